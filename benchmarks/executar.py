@@ -0,0 +1,109 @@
+# benchmarks/executar.py
+"""
+Mede o pipeline de reconciliação sobre relatórios sintéticos.
+
+Exemplo (a partir da raiz do projeto):
+    python benchmarks/executar.py --linhas 10000 100000 1000000 --fundo Apoge Gpa --taxa 0.9
+
+Para cada tamanho e fundo, gera os arquivos (ou reaproveita os já gerados na pasta),
+executa a reconciliação sem cache e imprime o tempo, a vazão (linhas/s) e a memória de
+cada etapa (o pico e o acréscimo sobre o início da etapa). Com --json os resultados
+também são gravados para comparação.
+"""
+import os
+import sys
+import json
+import argparse
+import platform
+import tempfile
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from benchmarks.geradores import GERADORES_FUNDOS, caminhos_cenario, gerar_cenario
+from reconciliacao import carregar_parsers_fundos, caminho_relatorio, executar_conciliacao, FORMATOS_SAIDA
+from instrumentacao import Perfilador
+
+
+def _vazao(etapa):
+    linhas = etapa.get('linhas_entrada') or etapa.get('linhas_saida')
+    if not linhas or not etapa['segundos']:
+        return None
+    return round(linhas / etapa['segundos'])
+
+
+def medir(pasta, linhas, fundo, taxa=0.9, formato='xlsx', medir_memoria=False, semente=42):
+    """
+    Executa uma reconciliação completa sobre um cenário sintético.
+    Retorna o relatório do Perfilador acrescido dos parâmetros e da vazão de cada etapa.
+    """
+    caminho_nosso, caminho_fundo = caminhos_cenario(pasta, linhas, fundo, taxa, semente)
+    if not (os.path.exists(caminho_nosso) and os.path.exists(caminho_fundo)):
+        caminho_nosso, caminho_fundo = gerar_cenario(pasta, linhas, fundo, taxa, semente)
+
+    perfilador = Perfilador(medir_memoria=medir_memoria)
+    caminho_saida = caminho_relatorio(pasta, f'{fundo}_{linhas}', formato)
+    executar_conciliacao(caminho_nosso, fundo, carregar_parsers_fundos()[fundo], caminho_fundo, caminho_saida,
+                         formato, usar_cache=False, perfilador=perfilador)
+
+    resultado = perfilador.relatorio()
+    for etapa in resultado['etapas']:
+        etapa['linhas_por_segundo'] = _vazao(etapa)
+    resultado.update({'linhas': linhas, 'fundo': fundo, 'taxa': taxa, 'formato': formato,
+                      'bytes_nosso': os.path.getsize(caminho_nosso), 'bytes_fundo': os.path.getsize(caminho_fundo)})
+    return resultado
+
+
+def imprimir(resultado):
+    print(f"\n== {resultado['fundo']} | {resultado['linhas']:,} linhas | taxa {resultado['taxa']} | "
+          f"{resultado['formato']} ==")
+    print(f"{'Etapa':<16}{'Segundos':>10}{'Linhas':>12}{'Linhas/s':>14}{'Pico RSS (MB)':>15}"
+          f"{'Acréscimo (MB)':>16}")
+    for etapa in resultado['etapas']:
+        linhas = etapa.get('linhas_entrada') or etapa.get('linhas_saida') or 0
+        vazao = etapa['linhas_por_segundo'] or 0
+        print(f"{etapa['etapa']:<16}{etapa['segundos']:>10.3f}{linhas:>12,}{vazao:>14,}"
+              f"{etapa['pico_rss_mb'] or 0:>15,.1f}{etapa['acrescimo_rss_mb'] or 0:>16,.1f}")
+    print(f"{'Total':<16}{resultado['total_segundos']:>10.3f}")
+
+
+def criar_parser_argumentos():
+    parser = argparse.ArgumentParser(description="Benchmark da reconciliação com relatórios sintéticos.")
+    parser.add_argument('--linhas', type=int, nargs='+', default=[10_000, 100_000],
+                        help="Quantidade de títulos gerados (um ou mais tamanhos).")
+    parser.add_argument('--fundo', nargs='+', choices=sorted(GERADORES_FUNDOS), default=['Apoge'],
+                        help="Layout(s) do relatório do fundo.")
+    parser.add_argument('--taxa', type=float, default=0.9,
+                        help="Fração dos títulos presentes nos dois relatórios (padrão: 0.9).")
+    parser.add_argument('--formato', choices=FORMATOS_SAIDA, default='xlsx')
+    parser.add_argument('--pasta', help="Pasta dos arquivos gerados (padrão: pasta temporária). "
+                                        "Arquivos já gerados nela são reaproveitados.")
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--memoria', action='store_true',
+                        help="Mede também a memória alocada pelo Python em cada etapa (mais lento).")
+    parser.add_argument('--json', help="Grava os resultados neste arquivo JSON.")
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser_argumentos().parse_args(argv)
+    pasta = args.pasta or tempfile.mkdtemp(prefix='recon_fidc_bench_')
+    os.makedirs(pasta, exist_ok=True)
+
+    resultados = []
+    for linhas in args.linhas:
+        for fundo in args.fundo:
+            resultado = medir(pasta, linhas, fundo, args.taxa, args.formato, args.memoria, args.semente)
+            imprimir(resultado)
+            resultados.append(resultado)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'python': platform.python_version(), 'plataforma': platform.platform(),
+                       'resultados': resultados}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# benchmarks/geradores.py
+"""
+Geradores de relatórios sintéticos nos layouts suportados, para medir desempenho.
+
+Todos partem do mesmo universo de títulos (documento, sacado, valor), de modo que a
+taxa de correspondência entre o nosso relatório e o relatório do fundo é controlada.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+SACADOS = ['COMERCIAL ALFA LTDA', 'BETA DISTRIBUIDORA SA', 'GAMA INDUSTRIA ME', 'DELTA SERVICOS EIRELI',
+           'EPSILON ALIMENTOS LTDA', 'ZETA TRANSPORTES', 'ETA CONSTRUCOES SA', 'TETA MATERIAIS LTDA']
+
+
+def formatar_moeda(centavos):
+    """
+    Formata valores em centavos no padrão brasileiro (ex: 157400 -> '1.574,00').
+    """
+    centavos = pd.Series(centavos, dtype='int64')
+    reais = (centavos.abs() // 100).map('{:,}'.format).str.replace(',', '.', regex=False)
+    sinal = np.where(centavos < 0, '-', '')
+    return sinal + reais + ',' + (centavos.abs() % 100).astype(str).str.zfill(2)
+
+
+def gerar_titulos(linhas, taxa_correspondencia=0.9, semente=42):
+    """
+    Gera o universo de títulos e em que lado(s) cada um aparece.
+    Retorna um DataFrame com: principal, parcela, sacado, centavos, no_nosso, no_fundo, juros.
+    """
+    rng = np.random.default_rng(semente)
+    titulos = pd.DataFrame({
+        'principal': rng.integers(1000, 999999, linhas),
+        'parcela': rng.integers(1, 13, linhas),
+        'sacado': np.array(SACADOS)[rng.integers(0, len(SACADOS), linhas)],
+        'centavos': rng.integers(1000, 5_000_000, linhas),
+    })
+    # Fora da correspondência, metade fica só no nosso e metade só no fundo
+    sorteio = rng.random(linhas)
+    fora = sorteio >= taxa_correspondencia
+    so_nosso = fora & (rng.random(linhas) < 0.5)
+    titulos['no_nosso'] = ~fora | so_nosso
+    titulos['no_fundo'] = ~fora | ~so_nosso
+    # Alguns títulos pagos com juros no fundo (aparecem como diferença de valor)
+    titulos['juros'] = np.where(rng.random(linhas) < 0.05, rng.integers(1, 50_000, linhas), 0)
+    return titulos
+
+
+def gerar_nosso(titulos, caminho, semente=42):
+    """
+    Nosso relatório: CSV ';' em latin-1, sem cabeçalho, histórico na coluna B e valor na C.
+    """
+    rng = np.random.default_rng(semente)
+    t = titulos[titulos['no_nosso']]
+    n = len(t)
+    doc = t['principal'].astype(str) + '/' + t['parcela'].astype(str).str.zfill(2)
+    variante = rng.integers(0, 4, n)
+    historico = np.select(
+        [variante == 0, variante == 1, variante == 2],
+        ['Recebimento cfe Dpl ' + doc + ' - ' + t['sacado'],
+         'Recebimento cfe Dpl ' + doc + '-' + t['sacado'],
+         'Recebimento cfe Dpl ' + doc + '-DME ' + t['sacado']],
+        'Pagamento cfe dpl. ' + doc + '-DIAMANTE FIDC')
+    linhas = pd.DataFrame({'data': '01/01/2024', 'historico': historico, 'valor': formatar_moeda(t['centavos'])})
+
+    # Lançamentos sem documento e linhas que o parser descarta
+    extras = max(1, n // 50)
+    avulsos = pd.DataFrame({
+        'data': '01/01/2024',
+        'historico': np.array(['Reembolso Duplicata', 'DESCONTO DUPL CFE BORDERO', 'Tarifa bancaria',
+                               'Saldo Anterior'])[rng.integers(0, 4, extras)],
+        'valor': formatar_moeda(rng.integers(100, 100_000, extras)),
+    })
+    linhas = pd.concat([linhas, avulsos]).sample(frac=1, random_state=semente)
+
+    with open(caminho, 'w', encoding='latin-1', newline='') as f:
+        f.write('Conta: 1.1.01.001;;\n;Histórico;Valor\n')
+        linhas.to_csv(f, sep=';', header=False, index=False)
+
+
+def _colunas_fundo(titulos, semente):
+    rng = np.random.default_rng(semente + 1)
+    t = titulos[titulos['no_fundo']].sample(frac=1, random_state=semente)
+    doc = t['principal'].astype(str) + '/' + t['parcela'].astype(str).str.zfill(2)
+    # Uma parte dos documentos vem com o sufixo usado por alguns fundos
+    doc = doc.where(rng.random(len(t)) < 0.8, doc + '-DME')
+    return t, doc, formatar_moeda(t['centavos']), formatar_moeda(t['centavos'] + t['juros'])
+
+
+def gerar_apoge(titulos, caminho, semente=42):
+    """
+    APOGE: linha de título, cabeçalho, documentos com prefixo 'DUP - ' e linhas de resumo.
+    """
+    t, doc, face, pago = _colunas_fundo(titulos, semente)
+    df = pd.DataFrame({'Documento': 'DUP - ' + doc, 'Sacado': t['sacado'], 'Vencimento': '10/01/2024',
+                       'Valor Face': face, 'Valor Pago': pago})
+    resumo = pd.DataFrame({'Documento': ['0,00'], 'Sacado': [''], 'Vencimento': [''],
+                           'Valor Face': [formatar_moeda([t['centavos'].sum()])[0]], 'Valor Pago': ['']})
+    with open(caminho, 'w', encoding='latin-1', newline='') as f:
+        f.write('RELATÓRIO DE LIQUIDAÇÕES - APOGE;;;;\n')
+        pd.concat([df, resumo]).to_csv(f, sep=';', index=False)
+
+
+def gerar_gpa(titulos, caminho, semente=42):
+    """
+    GPA: CSV ';' com as colunas 'Título', 'Razão Social Sacado', 'Vlr Original' e 'Total Recdo'.
+    """
+    t, doc, face, pago = _colunas_fundo(titulos, semente)
+    df = pd.DataFrame({'Título': doc, 'Razão Social Sacado': t['sacado'], 'Dt Vencto': '10/01/2024',
+                       'Vlr Original': face, 'Total Recdo': pago})
+    df.to_csv(caminho, sep=';', index=False, encoding='latin-1')
+
+
+def gerar_diamante(titulos, caminho, semente=42):
+    """
+    Diamante: CSV ',' com os valores entre aspas.
+    """
+    t, doc, face, pago = _colunas_fundo(titulos, semente)
+    df = pd.DataFrame({'Documento': doc, 'Sacado': t['sacado'], 'Valor': face, 'Valor Pago': pago})
+    df.to_csv(caminho, sep=',', index=False, encoding='latin-1')
+
+
+GERADORES_FUNDOS = {'Apoge': gerar_apoge, 'Gpa': gerar_gpa, 'Diamante': gerar_diamante}
+
+
+def caminhos_cenario(pasta, linhas, fundo='Apoge', taxa_correspondencia=0.9, semente=42):
+    """
+    Caminhos dos arquivos de um cenário. Todos os parâmetros da geração entram no nome,
+    para que arquivos gerados com outra taxa ou semente nunca sejam reaproveitados.
+    Retorna (caminho do nosso relatório, caminho do relatório do fundo).
+    """
+    sufixo = f'{linhas}_t{taxa_correspondencia:g}_s{semente}'
+    return (os.path.join(pasta, f'nosso_{sufixo}.csv'),
+            os.path.join(pasta, f'{fundo.lower()}_{sufixo}.csv'))
+
+
+def gerar_cenario(pasta, linhas, fundo='Apoge', taxa_correspondencia=0.9, semente=42):
+    """
+    Gera o nosso relatório e o relatório do fundo em `pasta`.
+    Retorna (caminho do nosso relatório, caminho do relatório do fundo).
+    """
+    os.makedirs(pasta, exist_ok=True)
+    titulos = gerar_titulos(linhas, taxa_correspondencia, semente)
+    caminho_nosso, caminho_fundo = caminhos_cenario(pasta, linhas, fundo, taxa_correspondencia, semente)
+    gerar_nosso(titulos, caminho_nosso, semente)
+    GERADORES_FUNDOS[fundo](titulos, caminho_fundo, semente)
+    return caminho_nosso, caminho_fundo
@@ -0,0 +1,123 @@
+# cache.py
+"""
+Cache em disco dos relatórios já processados pelos parsers.
+
+A chave é o hash do conteúdo do arquivo + o nome e a VERSAO do parser (+ as opções
+de leitura), então qualquer mudança no arquivo ou no parser gera uma nova entrada.
+Os DataFrames são gravados em Parquet quando o pyarrow está instalado (ou em pickle,
+caso contrário) e as entradas menos usadas são apagadas quando a pasta passa do limite.
+"""
+import os
+import hashlib
+import tempfile
+
+import pandas as pd
+
+PASTA_CACHE_PADRAO = os.environ.get('RECON_FIDC_CACHE',
+                                    os.path.join(os.path.expanduser('~'), '.cache', 'recon_fidc'))
+TAMANHO_MAXIMO_CACHE = 2 * 1024 * 1024 * 1024  # 2 GB
+
+try:
+    import pyarrow  # noqa: F401
+    EXTENSAO = '.parquet'
+except ImportError:
+    EXTENSAO = '.pkl'
+
+
+def hash_arquivo(caminho_arquivo, tamanho_bloco=1024 * 1024):
+    """
+    Calcula o hash do conteúdo do arquivo, lendo-o em blocos.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    with open(caminho_arquivo, 'rb') as f:
+        while bloco := f.read(tamanho_bloco):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def chave_cache(parser_modulo, caminho_arquivo, **opcoes):
+    """
+    Monta a chave da entrada de cache de um arquivo lido por um parser.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(hash_arquivo(caminho_arquivo).encode())
+    h.update(parser_modulo.__name__.encode())
+    h.update(str(getattr(parser_modulo, 'VERSAO', 0)).encode())
+    h.update(repr(sorted(opcoes.items())).encode())
+    return h.hexdigest()
+
+
+def salvar_df(df, caminho):
+    """
+    Grava o DataFrame de forma atômica (arquivo temporário + rename).
+    Cada gravação usa o seu próprio temporário: processos que perdem o cache da mesma
+    chave ao mesmo tempo gravam em paralelo, e o último rename vence.
+    """
+    fd, temporario = tempfile.mkstemp(prefix=os.path.basename(caminho) + '.', suffix='.tmp',
+                                      dir=os.path.dirname(caminho) or None)
+    os.close(fd)
+    try:
+        if caminho.endswith('.parquet'):
+            df.to_parquet(temporario)
+        else:
+            df.to_pickle(temporario)
+        os.replace(temporario, caminho)
+    except BaseException:
+        try:
+            os.remove(temporario)
+        except OSError:
+            pass
+        raise
+
+
+def carregar_df(caminho):
+    if caminho.endswith('.parquet'):
+        return pd.read_parquet(caminho)
+    return pd.read_pickle(caminho)
+
+
+def limpar_cache(pasta_cache=PASTA_CACHE_PADRAO, tamanho_maximo=TAMANHO_MAXIMO_CACHE):
+    """
+    Apaga as entradas usadas há mais tempo até a pasta caber no tamanho máximo.
+    """
+    entradas = []
+    for nome in os.listdir(pasta_cache):
+        caminho = os.path.join(pasta_cache, nome)
+        if os.path.isfile(caminho):
+            info = os.stat(caminho)
+            entradas.append((info.st_mtime, info.st_size, caminho))
+
+    total = sum(tamanho for _, tamanho, _ in entradas)
+    for _, tamanho, caminho in sorted(entradas):
+        if total <= tamanho_maximo:
+            break
+        try:
+            os.remove(caminho)
+            total -= tamanho
+        except OSError:
+            pass
+
+
+def processar_com_cache(parser_modulo, caminho_arquivo, pasta_cache=PASTA_CACHE_PADRAO, **opcoes):
+    """
+    Equivalente a `parser_modulo.processar(caminho_arquivo, **opcoes)`, mas reaproveita
+    o resultado de uma execução anterior sobre o mesmo arquivo quando existir.
+    """
+    os.makedirs(pasta_cache, exist_ok=True)
+    caminho_cache = os.path.join(pasta_cache, chave_cache(parser_modulo, caminho_arquivo, **opcoes) + EXTENSAO)
+
+    if os.path.exists(caminho_cache):
+        try:
+            df = carregar_df(caminho_cache)
+            os.utime(caminho_cache)  # marca como usada recentemente (LRU)
+            return df
+        except Exception as e:
+            print(f"Aviso: entrada de cache inválida, reprocessando o arquivo ({e}).")
+
+    df = parser_modulo.processar(caminho_arquivo, **opcoes)
+    try:
+        salvar_df(df, caminho_cache)
+        limpar_cache(pasta_cache)
+    except OSError as e:
+        print(f"Aviso: não foi possível gravar o cache ({e}).")
+    return df
@@ -0,0 +1,315 @@
+# cli.py
+"""
+Modo de linha de comando (sem interface gráfica).
+
+Exemplos:
+    python cli.py run --nosso razao.csv --fund Apoge=apoge.csv --fund Gpa=gpa.csv --saida relatorios/
+    python cli.py run --nosso razao_*.csv --fund "Gpa=gpa/2024-05-*.csv"
+    python cli.py vigiar --nosso razao.csv --pasta entrada/
+    python cli.py historico documento 58817/3
+
+O nosso relatório é lido e agregado uma única vez; cada fundo é conciliado em
+paralelo, em um processo separado, gerando um relatório por fundo.
+"""
+import os
+import sys
+import sqlite3
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from reconciliacao import (carregar_parsers_fundos, normalizar, agregar_nosso, caminho_relatorio, gerar_relatorio,
+                           ler_arquivos, expandir_caminhos, executar_conciliacao, FORMATOS_SAIDA)
+from instrumentacao import Perfilador, caminho_tempos, perfil_cprofile
+from incremental import conciliar_incremental, PASTA_ESTADO_PADRAO
+from vigilancia import vigiar, INTERVALO_PADRAO, ESTABILIDADE_PADRAO
+from particionado import particionar_nosso
+from historico import (registrar_execucao, historico_documento, envelhecimento, diferencas_recorrentes,
+                       totais_por_fundo, HISTORICO_PADRAO)
+from parsers import nosso_relatorio_parser
+from parsers._deteccao import detectar_fundo
+
+
+def _ler_fundos(especificacoes, parsers):
+    """
+    Converte as opções '--fund Nome=caminho' (ou só '--fund caminho') em uma lista de
+    (nome do fundo, caminho). O caminho pode ser um padrão glob com vários arquivos do
+    mesmo fundo. O fundo detectado pelo cabeçalho do (primeiro) arquivo tem prioridade
+    sobre o nome informado; sem nome, a detecção é obrigatória. Cada fundo só pode
+    aparecer uma vez: o relatório gerado tem o nome do fundo.
+    """
+    nomes = {nome.lower(): nome for nome in parsers}
+    caminhos_parsers = {nome: parser.caminho for nome, parser in parsers.items()}
+    fundos = []
+    for especificacao in especificacoes:
+        nome, separador, caminho = especificacao.partition('=')
+        if not separador:
+            nome, caminho = '', especificacao
+        if not caminho:
+            raise ValueError(f"Fundo inválido '{especificacao}'. Use o formato Nome=caminho.")
+        if nome and nome.lower() not in nomes:
+            raise ValueError(f"Parser do fundo '{nome}' não encontrado. Disponíveis: {', '.join(sorted(parsers))}.")
+
+        try:
+            detectado = detectar_fundo(expandir_caminhos(caminho)[0], caminhos_parsers)
+        except OSError:
+            # O erro de leitura aparece ao processar o arquivo
+            detectado = None
+        if not nome and not detectado:
+            raise ValueError(f"Não foi possível identificar o fundo do arquivo '{caminho}'. Use o formato Nome=caminho.")
+        escolhido = nomes[nome.lower()] if nome else detectado
+        if detectado and detectado != escolhido:
+            print(f"Aviso: '{caminho}' parece ser um relatório do fundo '{detectado}', e não '{escolhido}'. "
+                  f"Usando '{detectado}'.", file=sys.stderr)
+        fundo = detectado or escolhido
+        repetido = next((c for n, c in fundos if n == fundo), None)
+        if repetido is not None:
+            raise ValueError(f"'{repetido}' e '{caminho}' são ambos do fundo '{fundo}' e gerariam o mesmo relatório. "
+                             f"Junte os arquivos em um padrão (--fund \"{fundo}=*.csv\") ou concilie-os em "
+                             f"execuções separadas.")
+        fundos.append((fundo, caminho))
+    return fundos
+
+
+def _caminho_perfil(caminho_saida, perfil):
+    return os.path.splitext(caminho_saida)[0] + '.prof' if perfil else None
+
+
+def _registrar(df_comparativo, nome_fundo, caminho_saida, historico, periodo):
+    # O relatório já foi gerado: uma falha no histórico vira só um aviso
+    if not historico:
+        return
+    try:
+        registrar_execucao(df_comparativo, nome_fundo, periodo, caminho_saida, historico)
+    except sqlite3.Error as e:
+        print(f"[{nome_fundo}] Aviso: execução não registrada no histórico: {e}", file=sys.stderr)
+
+
+def conciliar_fundo(df_nosso_agg, nome_fundo, caminho_fundo, pasta_saida, usar_cache=True, formato='xlsx',
+                    etapas_nosso=(), perfil=False, historico=None, periodo=None, particoes=None, pasta_nosso=None):
+    """
+    Concilia um fundo contra o nosso relatório já agregado (ou já particionado em
+    `pasta_nosso`, com `particoes`), gera o relatório e registra o resultado no
+    `historico`. Executada nos processos de trabalho; retorna o caminho do arquivo gerado.
+    """
+    parser_modulo = carregar_parsers_fundos()[nome_fundo]
+    caminho_saida = caminho_relatorio(pasta_saida, nome_fundo, formato)
+    perfilador = Perfilador(medir_memoria=perfil, etapas=etapas_nosso)
+    with perfil_cprofile(_caminho_perfil(caminho_saida, perfil)):
+        _, _, df_comparativo = executar_conciliacao(None, nome_fundo, parser_modulo, caminho_fundo, caminho_saida,
+                                                    formato, usar_cache=usar_cache, perfilador=perfilador,
+                                                    df_nosso_agg=df_nosso_agg, particoes=particoes,
+                                                    pasta_nosso=pasta_nosso)
+    _registrar(df_comparativo, nome_fundo, caminho_saida, historico, periodo)
+    return caminho_saida
+
+
+def conciliar_fundo_incremental(caminho_nosso, nome_fundo, caminho_fundo, pasta_saida, formato='xlsx',
+                                pasta_estado=PASTA_ESTADO_PADRAO, perfil=False, historico=None, periodo=None):
+    """
+    Como `conciliar_fundo`, mas processando só as linhas acrescentadas desde a última execução.
+    """
+    parser_modulo = carregar_parsers_fundos()[nome_fundo]
+    caminho_saida = caminho_relatorio(pasta_saida, nome_fundo, formato)
+    perfilador = Perfilador(medir_memoria=perfil)
+    with perfil_cprofile(_caminho_perfil(caminho_saida, perfil)):
+        with perfilador.etapa('conciliacao_incremental') as etapa:
+            df_nosso_agg, df_fundo_agg, df_comparativo = conciliar_incremental(caminho_nosso, nome_fundo,
+                                                                               parser_modulo, caminho_fundo,
+                                                                               pasta_estado)
+            etapa['linhas_saida'] = len(df_comparativo)
+        with perfilador.etapa('relatorio', linhas_entrada=len(df_comparativo)):
+            gerar_relatorio(df_nosso_agg, df_fundo_agg, df_comparativo, caminho_saida, formato)
+    perfilador.salvar_json(caminho_tempos(caminho_saida))
+    _registrar(df_comparativo, nome_fundo, caminho_saida, historico, periodo)
+    return caminho_saida
+
+
+def _submeter(executor, args, fundos, pasta_saida, pasta_particoes=None):
+    historico = None if args.sem_historico else args.historico
+    if args.incremental:
+        # Cada fundo guarda seu próprio estado, inclusive do nosso relatório
+        return {executor.submit(conciliar_fundo_incremental, args.nosso, nome, caminho, pasta_saida, args.formato,
+                                args.estado, args.perfil, historico, args.periodo): nome
+                for nome, caminho in fundos}
+
+    if args.particoes:
+        # O nosso relatório é particionado uma vez só; cada fundo particiona o seu e cruza partição a partição
+        perfilador = Perfilador(medir_memoria=args.perfil)
+        with perfilador.etapa('leitura_nosso', "Particionando nosso relatório...") as etapa:
+            etapa['linhas_saida'] = particionar_nosso(args.nosso, pasta_particoes, args.particoes)
+        return {executor.submit(conciliar_fundo, None, nome, caminho, pasta_saida, formato=args.formato,
+                                etapas_nosso=perfilador.etapas, perfil=args.perfil, historico=historico,
+                                periodo=args.periodo, particoes=args.particoes, pasta_nosso=pasta_particoes): nome
+                for nome, caminho in fundos}
+
+    # O nosso relatório é lido e agregado uma vez só; as medições vão para o JSON de cada fundo
+    perfilador = Perfilador(medir_memoria=args.perfil)
+    with perfilador.etapa('leitura_nosso', "Processando nosso relatório...") as etapa:
+        df_nosso, df_nosso_agg = ler_arquivos(nosso_relatorio_parser, args.nosso, agregar_nosso, not args.sem_cache)
+        etapa['linhas_saida'] = len(df_nosso if df_nosso is not None else df_nosso_agg)
+    if df_nosso is not None:
+        with perfilador.etapa('normalizacao_nosso', linhas_entrada=len(df_nosso)):
+            normalizar(df_nosso)
+        with perfilador.etapa('agregacao_nosso', linhas_entrada=len(df_nosso)) as etapa:
+            df_nosso_agg = agregar_nosso(df_nosso)
+            etapa['linhas_saida'] = len(df_nosso_agg)
+    del df_nosso
+
+    return {executor.submit(conciliar_fundo, df_nosso_agg, nome, caminho, pasta_saida,
+                            not args.sem_cache, args.formato, perfilador.etapas, args.perfil, historico,
+                            args.periodo): nome
+            for nome, caminho in fundos}
+
+
+def executar(args):
+    parsers = carregar_parsers_fundos()
+    fundos = _ler_fundos(args.fund, parsers)
+    arquivos_nosso = expandir_caminhos(args.nosso)
+    if args.incremental and (len(arquivos_nosso) > 1 or any(len(expandir_caminhos(c)) > 1 for _, c in fundos)):
+        raise ValueError("O modo incremental aceita um arquivo só por relatório.")
+    if args.particoes is not None and args.particoes < 1:
+        raise ValueError("--particoes precisa ser pelo menos 1.")
+    if args.incremental and args.particoes:
+        raise ValueError("O modo incremental não pode ser combinado com --particoes.")
+    args.nosso = arquivos_nosso[0] if len(arquivos_nosso) == 1 else arquivos_nosso
+    pasta_saida = args.saida or os.path.dirname(os.path.abspath(arquivos_nosso[0]))
+    os.makedirs(pasta_saida, exist_ok=True)
+
+    falhas = 0
+    max_workers = args.workers or min(len(fundos), os.cpu_count() or 1)
+    # A pasta temporária só é usada com --particoes (o nosso relatório particionado)
+    with tempfile.TemporaryDirectory(prefix='recon_particoes_') as pasta_particoes, \
+            ProcessPoolExecutor(max_workers=max_workers) as executor:
+        tarefas = _submeter(executor, args, fundos, pasta_saida, pasta_particoes)
+        for tarefa in as_completed(tarefas):
+            nome_fundo = tarefas[tarefa]
+            try:
+                print(f"[{nome_fundo}] Relatório gerado: {tarefa.result()}")
+            except Exception as e:
+                falhas += 1
+                print(f"[{nome_fundo}] Erro: {e}", file=sys.stderr)
+
+    return 1 if falhas else 0
+
+
+def executar_vigilancia(args):
+    pasta_saida = args.saida or os.path.join(args.pasta, 'relatorios')
+    try:
+        vigiar(args.nosso, args.pasta, pasta_saida, args.formato, args.workers, args.intervalo, args.estabilidade,
+               usar_cache=not args.sem_cache, historico=None if args.sem_historico else args.historico,
+               periodo=args.periodo)
+    except KeyboardInterrupt:
+        print("Encerrado.")
+    return 0
+
+
+def executar_historico(args):
+    if args.consulta == 'documento':
+        df = historico_documento(args.documento, args.fundo, args.banco)
+    elif args.consulta == 'aging':
+        df = envelhecimento(args.fundo, args.periodo, args.banco)
+    elif args.consulta == 'recorrentes':
+        df = diferencas_recorrentes(args.fundo, args.minimo, args.banco)
+    else:
+        df = totais_por_fundo(args.fundo, args.banco)
+
+    if df.empty:
+        print("Nenhum registro encontrado no histórico.")
+    elif args.csv:
+        df.to_csv(sys.stdout, index=False)
+    else:
+        print(df.to_string(index=False, float_format='{:.2f}'.format))
+    return 0
+
+
+def criar_parser_argumentos():
+    parser = argparse.ArgumentParser(description="Reconciliador de Relatórios Contábeis (linha de comando).")
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    run = subcomandos.add_parser('run', help="Concilia o nosso relatório contra um ou mais fundos.")
+    run.add_argument('--nosso', required=True, nargs='+',
+                     help="CSV do nosso relatório (interno). Aceita vários arquivos ou um padrão glob.")
+    run.add_argument('--fund', action='append', required=True, metavar='[NOME=]CAMINHO',
+                     help="Fundo e relatório do fundo. Pode ser repetido. Sem o nome, o fundo é detectado "
+                          "pelo cabeçalho do arquivo (que também prevalece sobre um nome errado). O caminho "
+                          "pode ser um padrão glob (ex: 'Gpa=gpa/*.csv') para um fundo entregue em vários arquivos.")
+    run.add_argument('--saida', help="Pasta dos relatórios gerados (padrão: pasta do nosso relatório).")
+    run.add_argument('--workers', type=int, help="Número de processos paralelos (padrão: um por fundo, até o "
+                                                 "número de núcleos).")
+    run.add_argument('--formato', choices=FORMATOS_SAIDA, default='xlsx',
+                     help="Formato da saída: planilha Excel ou arquivos Parquet/CSV por tabela (padrão: xlsx).")
+    run.add_argument('--sem-cache', action='store_true', help="Ignora o cache de relatórios já processados.")
+    run.add_argument('--incremental', action='store_true',
+                     help="Processa só as linhas acrescentadas aos arquivos desde a última execução.")
+    run.add_argument('--estado', default=PASTA_ESTADO_PADRAO,
+                     help="Pasta do estado da reconciliação incremental.")
+    run.add_argument('--particoes', type=int, metavar='N',
+                     help="Concilia fora da memória: divide os dois lados em N partições no disco pelo hash do "
+                          "documento e cruza uma partição por vez. Para relatórios maiores que a memória.")
+    run.add_argument('--perfil', action='store_true',
+                     help="Mede também a memória alocada por etapa e grava um perfil do cProfile (.prof) "
+                          "ao lado de cada relatório.")
+    run.add_argument('--periodo', help="Período (competência) registrado no histórico, ex: 2024-05 ou "
+                                       "2024-05-31 (padrão: a data de hoje).")
+    run.add_argument('--historico', default=HISTORICO_PADRAO, help="Banco SQLite do histórico de conciliações.")
+    run.add_argument('--sem-historico', action='store_true', help="Não registra a execução no histórico.")
+    run.set_defaults(funcao=executar)
+
+    vigia = subcomandos.add_parser('vigiar', help="Vigia uma pasta e concilia cada relatório de fundo que chegar.")
+    vigia.add_argument('--nosso', required=True, help="CSV do nosso relatório (interno), mantido em memória.")
+    vigia.add_argument('--pasta', required=True, help="Pasta onde chegam os relatórios dos fundos.")
+    vigia.add_argument('--saida', help="Pasta dos relatórios gerados (padrão: subpasta 'relatorios' da vigiada).")
+    vigia.add_argument('--workers', type=int, default=2, help="Número de processos paralelos (padrão: 2).")
+    vigia.add_argument('--formato', choices=FORMATOS_SAIDA, default='xlsx')
+    vigia.add_argument('--intervalo', type=float, default=INTERVALO_PADRAO,
+                       help="Segundos entre as varreduras da pasta.")
+    vigia.add_argument('--estabilidade', type=float, default=ESTABILIDADE_PADRAO,
+                       help="Segundos que um arquivo precisa ficar sem mudar para ser processado.")
+    vigia.add_argument('--sem-cache', action='store_true', help="Ignora o cache de relatórios já processados.")
+    vigia.add_argument('--periodo', help="Período (competência) registrado no histórico para todos os arquivos "
+                                         "(padrão: a data de cada conciliação).")
+    vigia.add_argument('--historico', default=HISTORICO_PADRAO, help="Banco SQLite do histórico de conciliações.")
+    vigia.add_argument('--sem-historico', action='store_true', help="Não registra as conciliações no histórico.")
+    vigia.set_defaults(funcao=executar_vigilancia)
+
+    hist = subcomandos.add_parser('historico', help="Consulta o histórico das conciliações entre períodos.")
+    comuns = argparse.ArgumentParser(add_help=False)
+    comuns.add_argument('--banco', default=HISTORICO_PADRAO, help="Banco SQLite do histórico de conciliações.")
+    comuns.add_argument('--csv', action='store_true', help="Imprime o resultado em CSV em vez de tabela.")
+    consultas = hist.add_subparsers(dest='consulta', required=True)
+    doc = consultas.add_parser('documento', parents=[comuns],
+                               help="Períodos em que um documento ficou pendente (o primeiro é quando a "
+                                    "diferença apareceu).")
+    doc.add_argument('documento')
+    doc.add_argument('--fundo')
+    aging = consultas.add_parser('aging', parents=[comuns],
+                                 help="Pendências em aberto de um fundo e desde quando estão abertas.")
+    aging.add_argument('--fundo', required=True)
+    aging.add_argument('--periodo', help="Período de referência (padrão: o último registrado do fundo).")
+    recorrentes = consultas.add_parser('recorrentes', parents=[comuns],
+                                       help="Sacados com pendências em vários períodos.")
+    recorrentes.add_argument('--fundo')
+    recorrentes.add_argument('--minimo', type=int, default=2, help="Mínimo de períodos distintos (padrão: 2).")
+    totais = consultas.add_parser('totais', parents=[comuns],
+                                  help="Totais do sumário de cada fundo ao longo dos períodos.")
+    totais.add_argument('--fundo')
+    hist.set_defaults(funcao=executar_historico)
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser_argumentos().parse_args(argv)
+    try:
+        return args.funcao(args)
+    except (PermissionError, ValueError) as e:
+        print(f"Erro ao processar arquivo: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+# colunar_generator.py
+import os
+
+import pandas as pd
+from excel_generator import preparar_resultados, em_reais
+from formatos import FORMATOS_COLUNARES
+from instrumentacao import informar_progresso
+
+
+def _sumario_tipado(df_sumario):
+    """
+    A coluna 'Valor' do sumário mistura números e textos (SUCESSO/FALHA), o que não
+    cabe em uma coluna Parquet. Os textos vão para a coluna 'Status'.
+    """
+    valores = pd.to_numeric(df_sumario['Valor'], errors='coerce')
+    status = df_sumario['Valor'].where(df_sumario['Valor'].map(lambda v: isinstance(v, str)))
+    return pd.DataFrame({'Métrica': df_sumario['Métrica'], 'Valor': valores, 'Status': status})
+
+
+def gerar_relatorio_colunar(df_nosso_agg, df_fundo_agg, df_comparativo, pasta_saida, formato='parquet'):
+    """
+    Grava as mesmas tabelas do relatório Excel (mais o comparativo completo) como
+    arquivos Parquet ou CSV, um por tabela, dentro de `pasta_saida`.
+    Retorna a lista de arquivos gerados.
+    """
+    if formato not in FORMATOS_COLUNARES:
+        raise ValueError(f"Formato de saída '{formato}' inválido. Use: {', '.join(FORMATOS_COLUNARES)}.")
+
+    resultados = preparar_resultados(df_nosso_agg, df_fundo_agg, df_comparativo)
+    resultados['Sumario_Conciliacao'] = _sumario_tipado(resultados['Sumario_Conciliacao'])
+    comparativo = em_reais(df_comparativo, [c for c in df_comparativo.columns
+                                            if c.startswith('Valor_') or c == 'Juros/Taxas (Fundo)'])
+    comparativo['_merge'] = comparativo['_merge'].astype(str)
+    resultados['Comparativo'] = comparativo
+
+    os.makedirs(pasta_saida, exist_ok=True)
+    arquivos = []
+    for nome, df in resultados.items():
+        caminho = os.path.join(pasta_saida, f"{nome}.{formato}")
+        if formato == 'parquet':
+            df.to_parquet(caminho, index=False)
+        else:
+            df.to_csv(caminho, index=False)
+        arquivos.append(caminho)
+        informar_progresso(len(arquivos) / len(resultados), f"{nome}.{formato} gravado")
+    return arquivos
@@ -0,0 +1,162 @@
+# composicao.py
+"""
+Composição dos lançamentos sem documento do nosso relatório.
+
+Cada 'DESCONTO DUPL CFE BORDERO' e 'Reembolso Duplicata' sem documento vira uma chave
+sintética que nunca casa com o fundo. Aqui se tenta explicar o valor de cada um como
+a soma de documentos que ficaram só no relatório do fundo, com tolerância de centavos.
+
+A busca é feita em centavos inteiros e em etapas de custo crescente: um documento,
+um par, meet-in-the-middle para poucos candidatos e, por fim, programação dinâmica
+sobre as somas alcançáveis, com limite de estados e um orçamento de operações para a
+execução inteira (esgotado, só as buscas por um documento ou por um par continuam).
+"""
+from bisect import bisect_left, bisect_right
+
+import pandas as pd
+from parsers.nosso_relatorio_parser import PREFIXOS_SINTETICOS
+
+TOLERANCIA_CENTAVOS = 1
+# Até quantos candidatos usar meet-in-the-middle (2^(n/2) somas por metade)
+LIMITE_MEET_IN_THE_MIDDLE = 24
+# Máximo de somas distintas guardadas na programação dinâmica e de somas visitadas por
+# lançamento; o orçamento vale para todos os lançamentos de uma execução somados
+LIMITE_ESTADOS = 200_000
+LIMITE_OPERACOES = 500_000
+ORCAMENTO_OPERACOES = 20_000_000
+
+COLUNAS_COMPOSICAO = ['Lancamento (Nosso)', 'Sacado_Nosso', 'Valor_Nosso', 'Documentos (Fundo)',
+                      'Qtde Documentos', 'Soma (Fundo)', 'Diferenca']
+
+
+def _somas_subconjuntos(itens):
+    """
+    Todas as somas de subconjuntos de `itens` [(centavos, id)], com um subconjunto por soma.
+    """
+    somas = {0: ()}
+    for centavos, id_item in itens:
+        for soma, ids in list(somas.items()):
+            somas.setdefault(soma + centavos, ids + (id_item,))
+    return somas
+
+
+def _meet_in_the_middle(itens, alvo, tolerancia):
+    metade = len(itens) // 2
+    # As duas metades incluem o subconjunto vazio (soma 0): a solução pode estar
+    # inteira em uma delas
+    esquerda = _somas_subconjuntos(itens[:metade])
+    direita = _somas_subconjuntos(itens[metade:])
+    somas_direita = sorted(direita)
+    for soma, ids in esquerda.items():
+        # Menor soma da direita dentro da faixa [alvo - tol, alvo + tol]; com a esquerda
+        # vazia, a da direita não pode ser vazia também (os itens são todos positivos)
+        minimo = alvo - tolerancia - soma if ids else max(alvo - tolerancia, 1)
+        k = bisect_left(somas_direita, minimo)
+        if k < len(somas_direita) and somas_direita[k] <= alvo + tolerancia - soma:
+            return ids + direita[somas_direita[k]]
+    return None
+
+
+def _programacao_dinamica(itens, alvo, tolerancia, limite_estados, orcamento):
+    """
+    Somas alcançáveis até alvo + tolerância, cada uma com (soma anterior, item que a formou).
+    Desiste (None) se o número de somas distintas passar de `limite_estados` ou se o
+    total de somas visitadas passar de LIMITE_OPERACOES ou do que resta do `orcamento`.
+    """
+    anteriores = {0: None}
+    operacoes = 0
+    limite_operacoes = min(LIMITE_OPERACOES, orcamento['operacoes'])
+    for centavos, id_item in itens:
+        operacoes += len(anteriores)
+        if operacoes > limite_operacoes:
+            orcamento['operacoes'] -= operacoes
+            return None
+        for soma in list(anteriores):
+            nova = soma + centavos
+            if nova <= alvo + tolerancia and nova not in anteriores:
+                anteriores[nova] = (soma, id_item)
+        for nova in range(alvo - tolerancia, alvo + tolerancia + 1):
+            if nova > 0 and nova in anteriores:
+                escolhidos = []
+                while anteriores[nova] is not None:
+                    nova, id_item = anteriores[nova]
+                    escolhidos.append(id_item)
+                orcamento['operacoes'] -= operacoes
+                return tuple(escolhidos)
+        if len(anteriores) > limite_estados:
+            break
+    orcamento['operacoes'] -= operacoes
+    return None
+
+
+def compor_valor(alvo, itens, tolerancia=TOLERANCIA_CENTAVOS, limite_estados=LIMITE_ESTADOS, orcamento=None):
+    """
+    Procura um subconjunto de `itens` [(centavos, id)] cuja soma fique a até `tolerancia`
+    centavos de `alvo`. Prefere soluções com menos itens. Retorna os ids ou None.
+    `orcamento` ({'operacoes': n}) é compartilhado entre chamadas e limita a busca exaustiva.
+    """
+    orcamento = orcamento if orcamento is not None else {'operacoes': ORCAMENTO_OPERACOES}
+    itens = sorted((c, i) for c, i in itens if 0 < c <= alvo + tolerancia)
+    if not itens:
+        return None
+
+    # Um documento ou um par: busca direta pelo valor que falta
+    por_valor = {}
+    for centavos, id_item in itens:
+        por_valor.setdefault(centavos, []).append(id_item)
+    for delta in range(-tolerancia, tolerancia + 1):
+        if alvo + delta in por_valor:
+            return (por_valor[alvo + delta][0],)
+    for centavos, id_item in itens:
+        for delta in range(-tolerancia, tolerancia + 1):
+            for outro in por_valor.get(alvo + delta - centavos, ()):
+                if outro != id_item:
+                    return id_item, outro
+
+    # Nem todos juntos alcançam o alvo: não há composição possível
+    if sum(c for c, _ in itens) < alvo - tolerancia:
+        return None
+
+    if orcamento['operacoes'] <= 0:
+        return None
+    if len(itens) <= LIMITE_MEET_IN_THE_MIDDLE:
+        orcamento['operacoes'] -= 2 ** (len(itens) // 2 + 1)
+        return _meet_in_the_middle(itens, alvo, tolerancia)
+    # Os maiores primeiro: o alvo é alcançado com menos itens e menos estados
+    return _programacao_dinamica(itens[::-1], alvo, tolerancia, limite_estados, orcamento)
+
+
+def compor_lancamentos(df_comparativo, coluna_fundo='Valor_Fundo_Pago'):
+    """
+    Tenta explicar cada lançamento sem documento do nosso relatório como a soma de
+    documentos que estão só no relatório do fundo. Cada documento do fundo entra em
+    no máximo uma composição. Retorna um DataFrame com as colunas COLUNAS_COMPOSICAO
+    (valores em centavos).
+    """
+    so_nosso = df_comparativo[df_comparativo['_merge'] == 'left_only']
+    lancamentos = so_nosso[so_nosso['Documento'].astype(str).str.startswith(PREFIXOS_SINTETICOS)]
+    so_fundo = df_comparativo[df_comparativo['_merge'] == 'right_only']
+    if lancamentos.empty or so_fundo.empty:
+        return pd.DataFrame(columns=COLUNAS_COMPOSICAO)
+
+    disponiveis = {i: int(c) for i, c in so_fundo[coluna_fundo].dropna().items() if c > 0}
+    # Ordenados por valor, para pegar só os que cabem em cada lançamento
+    ordenados = sorted((c, i) for i, c in disponiveis.items())
+
+    orcamento = {'operacoes': ORCAMENTO_OPERACOES}
+    linhas = []
+    # Os menores primeiro: têm menos composições possíveis e consomem menos documentos
+    for _, lancamento in lancamentos.sort_values('Valor_Nosso', kind='stable').iterrows():
+        alvo = int(lancamento['Valor_Nosso'])
+        limite = bisect_right(ordenados, (alvo + TOLERANCIA_CENTAVOS, float('inf')))
+        escolhidos = compor_valor(alvo, ordenados[:limite], orcamento=orcamento)
+        if not escolhidos:
+            continue
+        for i in escolhidos:
+            del ordenados[bisect_left(ordenados, (disponiveis[i], i))]
+        soma = sum(disponiveis.pop(i) for i in escolhidos)
+        documentos = so_fundo.loc[list(escolhidos), 'Documento'].astype(str).sort_values()
+        linhas.append([lancamento['Documento'], lancamento['Sacado_Nosso'], lancamento['Valor_Nosso'],
+                       ', '.join(documentos), len(escolhidos), soma, soma - alvo])
+
+    return pd.DataFrame(linhas, columns=COLUNAS_COMPOSICAO)
@@ -1,7 +1,165 @@
 # excel_generator.py
 import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import NamedStyle
-from utils import configurar_locale  # <-- MUDANÇA AQUI
+from openpyxl.utils import get_column_letter
+from utils import configurar_locale, centavos_para_reais  # <-- MUDANÇA AQUI
+from instrumentacao import informar_progresso
+from sugestoes import sugerir_correspondencias
+from composicao import compor_lancamentos
+
+# A cada quantas linhas escritas o progresso é informado
+LINHAS_POR_AVISO = 10_000
+
+# Colunas das abas de detalhe que não recebem o formato de moeda
+COLUNAS_TEXTO = ('Documento', 'Sacado_Nosso', 'Sacado (Fundo)', 'Documento (Nosso)', 'Documento (Fundo)',
+                 'Pontuacao', 'Criterios', 'Lancamento (Nosso)', 'Documentos (Fundo)', 'Qtde Documentos')
+
+
+def em_reais(df, colunas=None):
+    """
+    Converte para reais as colunas de valor (em centavos) de uma tabela do relatório:
+    as de `colunas` ou, sem elas, todas fora de COLUNAS_TEXTO.
+    """
+    df = df.copy()
+    for coluna in (colunas if colunas is not None else [c for c in df.columns if c not in COLUNAS_TEXTO]):
+        df[coluna] = centavos_para_reais(df[coluna])
+    return df
+
+
+def _largura_coluna(serie, titulo):
+    """
+    Largura da coluna: o maior texto entre o título e os valores, mais uma folga.
+    """
+    tamanhos = serie.dropna().astype(str).str.len()
+    maior = max(len(str(titulo)), int(tamanhos.max()) if not tamanhos.empty else 0)
+    return maior + 2
+
+
+def _escrever_aba(workbook, nome_aba, df, colunas_moeda, ao_escrever=None):
+    """
+    Escreve o DataFrame em uma nova aba, linha a linha (modo write-only do openpyxl).
+    As larguras, o filtro e o estilo de moeda são definidos por coluna antes da escrita,
+    sem precisar revisitar as células depois. `ao_escrever(linhas)` é chamado a cada
+    LINHAS_POR_AVISO linhas escritas.
+    """
+    ws = workbook.create_sheet(nome_aba)
+    for i, coluna in enumerate(df.columns, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = _largura_coluna(df[coluna], coluna)
+    ws.auto_filter.ref = f"A1:{get_column_letter(len(df.columns))}{len(df) + 1}"
+
+    ws.append(list(df.columns))
+
+    # Uma célula modelo por coluna de moeda, reaproveitada em todas as linhas
+    modelos = {}
+    for i, coluna in enumerate(df.columns):
+        if coluna in colunas_moeda:
+            modelos[i] = WriteOnlyCell(ws)
+            modelos[i].style = 'currency_br'
+
+    valores = df.astype(object).where(df.notna(), None)
+    for n, linha in enumerate(valores.itertuples(index=False, name=None), start=1):
+        linha = list(linha)
+        for i, celula in modelos.items():
+            celula.value = linha[i]
+            linha[i] = celula
+        ws.append(linha)
+        if ao_escrever and n % LINHAS_POR_AVISO == 0:
+            ao_escrever(n)
+
+
+def _escrever_sumario(workbook, df_sumario):
+    ws = workbook.create_sheet('Sumario_Conciliacao')
+    for i, coluna in enumerate(df_sumario.columns, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = _largura_coluna(df_sumario[coluna], coluna)
+
+    ws.append(list(df_sumario.columns))
+    for metrica, valor in df_sumario.itertuples(index=False, name=None):
+        celula = WriteOnlyCell(ws, value=valor)
+        if "Documentos" in str(metrica) or "Correspondentes" in str(metrica):
+            celula.style = 'integer'
+        elif isinstance(valor, (int, float)):
+            celula.style = 'currency_br'
+        ws.append([metrica, celula])
+
+
+def preparar_resultados(df_nosso_agg, df_fundo_agg, df_comparativo):
+    """
+    Calcula as tabelas do relatório a partir dos DataFrames agregados e do comparativo.
+    Retorna um dicionário {nome da aba: DataFrame}, na ordem em que as abas aparecem.
+    As contas são feitas em centavos inteiros; as tabelas saem com os valores em reais.
+    """
+    # --- Cálculos e Preparação dos DataFrames ---
+    df_ambos = df_comparativo[df_comparativo['_merge'] == 'both'].copy()
+    # Renomeia colunas para clareza no relatório final
+    df_ambos.rename(columns={
+        'Valor_Fundo_Original': 'Valor Original (Fundo)',
+        'Valor_Fundo_Pago': 'Valor Pago (Fundo)',
+        'Sacado_Fundo': 'Sacado (Fundo)'
+    }, inplace=True)
+
+    df_ambos['Juros/Taxas (Fundo)'] = df_ambos['Valor Pago (Fundo)'] - df_ambos['Valor Original (Fundo)']
+    df_ambos['Diferenca_Liquida'] = df_ambos['Valor Pago (Fundo)'] - df_ambos['Valor_Nosso']
+
+    df_so_nosso = df_comparativo[df_comparativo['_merge'] == 'left_only'].copy()
+
+    df_so_fundo = df_comparativo[df_comparativo['_merge'] == 'right_only'].copy()
+    df_so_fundo.rename(columns={
+        'Valor_Fundo_Original': 'Valor Original (Fundo)',
+        'Valor_Fundo_Pago': 'Valor Pago (Fundo)',
+        'Sacado_Fundo': 'Sacado (Fundo)'
+    }, inplace=True)
+    df_so_fundo['Juros/Taxas (Fundo)'] = df_so_fundo['Valor Pago (Fundo)'] - df_so_fundo['Valor Original (Fundo)']
+
+    # --- Aba de Sumário ---
+    # Em centavos a conta fecha exatamente: a validação não precisa de tolerância
+    total_pago_fundo = df_fundo_agg['Valor_Fundo_Pago'].sum()
+    total_nosso = df_nosso_agg['Valor_Nosso'].sum()
+    diff_real = total_pago_fundo - total_nosso
+    diff_calculada = df_ambos['Diferenca_Liquida'].sum() - df_so_nosso['Valor_Nosso'].sum() + df_so_fundo[
+        'Valor Pago (Fundo)'].sum()
+
+    com_diferenca = df_ambos['Diferenca_Liquida'] != 0
+
+    sumario_data = {
+        'Métrica': [
+            'Documentos Únicos (Nosso Relatório)', 'Valor Total (Nosso)', '',
+            'Documentos Únicos (Rel. Fundo)', 'Valor Original (Fundo)', 'Valor Pago (Fundo)',
+            'Total Juros/Taxas (Fundo)', '',
+            'Documentos Correspondentes', 'Documentos com Diferença de Valor',
+            'Valor Total das Diferenças Líquidas', '',
+            'Documentos Apenas no Nosso Relatório', 'Valor Total (Apenas Nosso)', '',
+            'Documentos Apenas no Rel. Fundo', 'Valor Total (Apenas Fundo)', '',
+            'VALIDAÇÃO FINAL', 'Diferença Real (Total Pago Fundo - Total Nosso)',
+            'Diferença Calculada (Soma das Discrepâncias)'
+        ],
+        'Valor': [
+            df_nosso_agg['Documento'].nunique(), total_nosso / 100, None,
+            df_fundo_agg['Documento'].nunique(), df_fundo_agg['Valor_Fundo_Original'].sum() / 100,
+            total_pago_fundo / 100, df_fundo_agg['Juros/Taxas (Fundo)'].sum() / 100, None,
+            len(df_ambos), int(com_diferenca.sum()),
+            df_ambos['Diferenca_Liquida'].sum() / 100, None,
+            len(df_so_nosso), df_so_nosso['Valor_Nosso'].sum() / 100, None,
+            len(df_so_fundo), df_so_fundo['Valor Pago (Fundo)'].sum() / 100, None,
+            "SUCESSO" if diff_real == diff_calculada else "FALHA",
+            diff_real / 100,
+            diff_calculada / 100
+        ]
+    }
+
+    colunas_diferenca = ['Documento', 'Valor Original (Fundo)', 'Juros/Taxas (Fundo)', 'Valor Pago (Fundo)',
+                         'Valor_Nosso', 'Diferenca_Liquida']
+    colunas_so_fundo = ['Documento', 'Sacado (Fundo)', 'Valor Original (Fundo)', 'Juros/Taxas (Fundo)',
+                        'Valor Pago (Fundo)']
+    return {
+        'Sumario_Conciliacao': pd.DataFrame(sumario_data),
+        'Diferencas_de_Valor': em_reais(df_ambos[com_diferenca][colunas_diferenca]),
+        'Apenas_no_Nosso_Relatorio': em_reais(df_so_nosso[['Documento', 'Sacado_Nosso', 'Valor_Nosso']]),
+        'Apenas_no_Rel_Fundo': em_reais(df_so_fundo[colunas_so_fundo]),
+        'Sugestoes_de_Correspondencia': em_reais(sugerir_correspondencias(df_comparativo)),
+        'Composicao_de_Lancamentos': em_reais(compor_lancamentos(df_comparativo)),
+    }
 
 
 def gerar_relatorio_excel(df_nosso_agg, df_fundo_agg, df_comparativo, caminho_saida):
@@ -9,110 +167,26 @@ def gerar_relatorio_excel(df_nosso_agg, df_fundo_agg, df_comparativo, caminho_sa
     Gera um relatório Excel detalhado com a análise completa.
     """
     configurar_locale()
+    resultados = preparar_resultados(df_nosso_agg, df_fundo_agg, df_comparativo)
+
+    workbook = Workbook(write_only=True)
+    workbook.add_named_style(NamedStyle(name='currency_br', number_format='R$ #,##0.00'))
+    workbook.add_named_style(NamedStyle(name='integer', number_format='#,##0'))
+
+    _escrever_sumario(workbook, resultados['Sumario_Conciliacao'])
+    abas = ['Diferencas_de_Valor', 'Apenas_no_Nosso_Relatorio', 'Apenas_no_Rel_Fundo',
+            'Sugestoes_de_Correspondencia', 'Composicao_de_Lancamentos']
+    total = sum(len(resultados[nome_aba]) for nome_aba in abas) or 1
+    escritas = 0
+    for nome_aba in abas:
+        df = resultados[nome_aba]
+        colunas_moeda = [c for c in df.columns if c not in COLUNAS_TEXTO]
+
+        def ao_escrever(linhas, nome_aba=nome_aba, df=df, escritas=escritas):
+            informar_progresso((escritas + linhas) / total, f"{nome_aba}: {linhas} de {len(df)} linhas escritas")
+
+        _escrever_aba(workbook, nome_aba, df, colunas_moeda, ao_escrever)
+        escritas += len(df)
+        ao_escrever(len(df))
 
-    with pd.ExcelWriter(caminho_saida, engine='openpyxl') as writer:
-        # --- Cálculos e Preparação dos DataFrames ---
-        df_ambos = df_comparativo[df_comparativo['_merge'] == 'both'].copy()
-        # Renomeia colunas para clareza no relatório final
-        df_ambos.rename(columns={
-            'Valor_Fundo_Original': 'Valor Original (Fundo)',
-            'Valor_Fundo_Pago': 'Valor Pago (Fundo)',
-            'Sacado_Fundo': 'Sacado (Fundo)'
-        }, inplace=True)
-
-        df_ambos['Juros/Taxas (Fundo)'] = df_ambos['Valor Pago (Fundo)'] - df_ambos['Valor Original (Fundo)']
-        df_ambos['Diferenca_Liquida'] = df_ambos['Valor Pago (Fundo)'] - df_ambos['Valor_Nosso']
-
-        df_so_nosso = df_comparativo[df_comparativo['_merge'] == 'left_only'].copy()
-
-        df_so_fundo = df_comparativo[df_comparativo['_merge'] == 'right_only'].copy()
-        df_so_fundo.rename(columns={
-            'Valor_Fundo_Original': 'Valor Original (Fundo)',
-            'Valor_Fundo_Pago': 'Valor Pago (Fundo)',
-            'Sacado_Fundo': 'Sacado (Fundo)'
-        }, inplace=True)
-        df_so_fundo['Juros/Taxas (Fundo)'] = df_so_fundo['Valor Pago (Fundo)'] - df_so_fundo['Valor Original (Fundo)']
-
-        # --- Aba de Sumário ---
-        total_pago_fundo = df_fundo_agg['Valor_Fundo_Pago'].sum()
-        total_nosso = df_nosso_agg['Valor_Nosso'].sum()
-        diff_real = total_pago_fundo - total_nosso
-        diff_calculada = df_ambos['Diferenca_Liquida'].sum() - df_so_nosso['Valor_Nosso'].sum() + df_so_fundo[
-            'Valor Pago (Fundo)'].sum()
-
-        sumario_data = {
-            'Métrica': [
-                'Documentos Únicos (Nosso Relatório)', 'Valor Total (Nosso)', '',
-                'Documentos Únicos (Rel. Fundo)', 'Valor Original (Fundo)', 'Valor Pago (Fundo)',
-                'Total Juros/Taxas (Fundo)', '',
-                'Documentos Correspondentes', 'Documentos com Diferença de Valor',
-                'Valor Total das Diferenças Líquidas', '',
-                'Documentos Apenas no Nosso Relatório', 'Valor Total (Apenas Nosso)', '',
-                'Documentos Apenas no Rel. Fundo', 'Valor Total (Apenas Fundo)', '',
-                'VALIDAÇÃO FINAL', 'Diferença Real (Total Pago Fundo - Total Nosso)',
-                'Diferença Calculada (Soma das Discrepâncias)'
-            ],
-            'Valor': [
-                df_nosso_agg['Documento'].nunique(), total_nosso, None,
-                df_fundo_agg['Documento'].nunique(), df_fundo_agg['Valor_Fundo_Original'].sum(), total_pago_fundo,
-                df_fundo_agg['Juros/Taxas (Fundo)'].sum(), None,
-                len(df_ambos), len(df_ambos[df_ambos['Diferenca_Liquida'].abs() > 0.01]),
-                df_ambos['Diferenca_Liquida'].sum(), None,
-                len(df_so_nosso), df_so_nosso['Valor_Nosso'].sum(), None,
-                len(df_so_fundo), df_so_fundo['Valor Pago (Fundo)'].sum(), None,
-                "SUCESSO" if abs(diff_real - diff_calculada) < 0.01 else "FALHA",
-                diff_real,
-                diff_calculada
-            ]
-        }
-        pd.DataFrame(sumario_data).to_excel(writer, sheet_name='Sumario_Conciliacao', index=False)
-
-        # --- Abas de Detalhes ---
-        colunas_diferenca = ['Documento', 'Valor Original (Fundo)', 'Juros/Taxas (Fundo)', 'Valor Pago (Fundo)',
-                             'Valor_Nosso', 'Diferenca_Liquida']
-        df_ambos[df_ambos['Diferenca_Liquida'].abs() > 0.01][colunas_diferenca].to_excel(writer,
-                                                                                         sheet_name='Diferencas_de_Valor',
-                                                                                         index=False)
-
-        df_so_nosso[['Documento', 'Sacado_Nosso', 'Valor_Nosso']].to_excel(writer,
-                                                                           sheet_name='Apenas_no_Nosso_Relatorio',
-                                                                           index=False)
-
-        colunas_so_fundo = ['Documento', 'Sacado (Fundo)', 'Valor Original (Fundo)', 'Juros/Taxas (Fundo)',
-                            'Valor Pago (Fundo)']
-        df_so_fundo[colunas_so_fundo].to_excel(writer, sheet_name='Apenas_no_Rel_Fundo', index=False)
-
-        # --- Formatação e Auto-ajuste ---
-        workbook = writer.book
-        currency_style = NamedStyle(name='currency_br', number_format='R$ #,##0.00')
-        integer_style = NamedStyle(name='integer', number_format='#,##0')
-        if 'currency_br' not in workbook.style_names:
-            workbook.add_named_style(currency_style)
-        if 'integer' not in workbook.style_names:
-            workbook.add_named_style(integer_style)
-
-        sheets_to_format = {
-            'Diferencas_de_Valor': ['B', 'C', 'D', 'E', 'F'],
-            'Apenas_no_Nosso_Relatorio': ['C'],
-            'Apenas_no_Rel_Fundo': ['C', 'D', 'E']
-        }
-        for sheet_name, cols in sheets_to_format.items():
-            ws = writer.sheets[sheet_name]
-            ws.auto_filter.ref = ws.dimensions
-            for col_letter in cols:
-                for cell in ws[col_letter][1:]:
-                    cell.style = 'currency_br'
-
-        ws_sumario = writer.sheets['Sumario_Conciliacao']
-        for cell in ws_sumario['B'][1:]:
-            metric_cell = ws_sumario[f'A{cell.row}']
-            if "Documentos" in str(metric_cell.value) or "Correspondentes" in str(metric_cell.value):
-                cell.style = 'integer'
-            elif isinstance(cell.value, (int, float)):
-                cell.style = 'currency_br'
-
-        for sheet_name in writer.sheets:
-            worksheet = writer.sheets[sheet_name]
-            for column_cells in worksheet.columns:
-                max_length = max((len(str(cell.value)) for cell in column_cells if cell.value is not None), default=0)
-                worksheet.column_dimensions[column_cells[0].column_letter].width = (max_length + 2)
+    workbook.save(caminho_saida)
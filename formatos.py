@@ -0,0 +1,8 @@
+# formatos.py
+"""
+Formatos de saída dos relatórios. Fica separado dos geradores para que a interface
+monte a janela sem importar o pandas e o openpyxl.
+"""
+# 'xlsx' gera a planilha; os formatos colunares geram uma pasta com um arquivo por tabela
+FORMATOS_COLUNARES = ('parquet', 'csv')
+FORMATOS_SAIDA = ('xlsx',) + FORMATOS_COLUNARES
@@ -0,0 +1,269 @@
+# historico.py
+"""
+Histórico das conciliações em um banco SQLite local.
+
+Cada execução grava, por fundo e período, os totais do sumário e as pendências do
+comparativo (documentos com diferença de valor, só no nosso ou só no fundo). Os
+documentos que bateram não são gravados: são a maior parte das linhas e não
+respondem nenhuma das consultas. Uma nova execução do mesmo fundo e período
+substitui a anterior.
+
+As consultas entre períodos (quando um documento apareceu pela primeira vez,
+há quanto tempo cada pendência está aberta, sacados com diferenças recorrentes,
+totais por fundo) usam os índices do banco, sem reabrir os relatórios.
+"""
+import os
+import sqlite3
+from datetime import date, datetime
+from contextlib import closing
+
+import pandas as pd
+from cache import PASTA_CACHE_PADRAO
+from utils import normalizar_documento, centavos_para_reais
+
+HISTORICO_PADRAO = os.environ.get('RECON_FIDC_HISTORICO', os.path.join(PASTA_CACHE_PADRAO, 'historico.sqlite3'))
+VERSAO_BANCO = 1
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS execucoes (
+    id INTEGER PRIMARY KEY,
+    fundo TEXT NOT NULL,
+    periodo TEXT NOT NULL,
+    executado_em TEXT NOT NULL,
+    relatorio TEXT,
+    documentos_nosso INTEGER NOT NULL,
+    valor_nosso INTEGER NOT NULL,
+    documentos_fundo INTEGER NOT NULL,
+    valor_fundo_original INTEGER NOT NULL,
+    valor_fundo_pago INTEGER NOT NULL,
+    correspondentes INTEGER NOT NULL,
+    com_diferenca INTEGER NOT NULL,
+    valor_diferencas INTEGER NOT NULL,
+    apenas_nosso INTEGER NOT NULL,
+    valor_apenas_nosso INTEGER NOT NULL,
+    apenas_fundo INTEGER NOT NULL,
+    valor_apenas_fundo INTEGER NOT NULL,
+    UNIQUE (fundo, periodo)
+);
+CREATE TABLE IF NOT EXISTS pendencias (
+    execucao INTEGER NOT NULL REFERENCES execucoes (id),
+    documento TEXT NOT NULL,
+    situacao TEXT NOT NULL,
+    sacado TEXT,
+    valor_nosso INTEGER,
+    valor_fundo_pago INTEGER,
+    diferenca INTEGER NOT NULL,
+    PRIMARY KEY (execucao, documento)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS pendencias_documento ON pendencias (documento);
+CREATE INDEX IF NOT EXISTS pendencias_sacado ON pendencias (sacado);
+"""
+
+# Situação de cada pendência, pelo indicador '_merge' do comparativo
+SITUACOES = {'both': 'diferenca', 'left_only': 'so_nosso', 'right_only': 'so_fundo'}
+
+
+def conectar(caminho=HISTORICO_PADRAO):
+    """
+    Abre (e cria, se preciso) o banco do histórico. Em modo WAL, os processos que
+    conciliam fundos em paralelo podem gravar sem bloquear quem está consultando.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    conexao = sqlite3.connect(caminho, timeout=60)
+    conexao.execute("PRAGMA journal_mode=WAL")
+    if conexao.execute("PRAGMA user_version").fetchone()[0] != VERSAO_BANCO:
+        conexao.executescript(_ESQUEMA)
+        conexao.execute(f"PRAGMA user_version = {VERSAO_BANCO}")
+    return conexao
+
+
+def _inteiro(valor):
+    return int(valor) if pd.notna(valor) else None
+
+
+def _pendencias(df_comparativo):
+    """
+    Linhas do comparativo que ficaram em aberto, com a diferença (pago no fundo - nosso) em centavos.
+    """
+    nosso = df_comparativo['Valor_Nosso'].fillna(0)
+    pago = df_comparativo['Valor_Fundo_Pago'].fillna(0)
+    diferenca = pago - nosso
+    pendente = (df_comparativo['_merge'] != 'both') | (diferenca != 0)
+
+    pendentes = df_comparativo[pendente]
+    # O sacado do fundo só é usado quando o documento não está no nosso relatório
+    sacado = pendentes['Sacado_Nosso'].astype(object).where(pendentes['_merge'] != 'right_only',
+                                                             pendentes['Sacado_Fundo'].astype(object))
+    return pd.DataFrame({
+        'documento': pendentes['Documento'].astype(object),
+        'situacao': pendentes['_merge'].astype(object).map(SITUACOES),
+        'sacado': sacado,
+        'valor_nosso': pendentes['Valor_Nosso'],
+        'valor_fundo_pago': pendentes['Valor_Fundo_Pago'],
+        'diferenca': diferenca[pendente],
+    })
+
+
+def _totais(df_comparativo, pendencias):
+    """
+    Os mesmos totais do sumário do relatório, em centavos.
+    """
+    merge = df_comparativo['_merge']
+    nosso = df_comparativo.loc[merge != 'right_only', 'Valor_Nosso']
+    fundo = df_comparativo[merge != 'left_only']
+    diferencas = pendencias[pendencias['situacao'] == 'diferenca']
+    return {
+        'documentos_nosso': len(nosso), 'valor_nosso': _inteiro(nosso.sum()),
+        'documentos_fundo': len(fundo), 'valor_fundo_original': _inteiro(fundo['Valor_Fundo_Original'].sum()),
+        'valor_fundo_pago': _inteiro(fundo['Valor_Fundo_Pago'].sum()),
+        'correspondentes': int((merge == 'both').sum()),
+        'com_diferenca': len(diferencas), 'valor_diferencas': _inteiro(diferencas['diferenca'].sum()),
+        'apenas_nosso': int((merge == 'left_only').sum()),
+        'valor_apenas_nosso': _inteiro(df_comparativo.loc[merge == 'left_only', 'Valor_Nosso'].sum()),
+        'apenas_fundo': int((merge == 'right_only').sum()),
+        'valor_apenas_fundo': _inteiro(df_comparativo.loc[merge == 'right_only', 'Valor_Fundo_Pago'].sum()),
+    }
+
+
+def resumir_execucao(df_comparativo):
+    """
+    O que o histórico guarda de um comparativo: (totais do sumário, pendências).
+    Bem menor que o comparativo, pode ser montado em um processo de trabalho e
+    gravado por outro com `registrar_resumo`.
+    """
+    pendencias = _pendencias(df_comparativo)
+    return _totais(df_comparativo, pendencias), pendencias
+
+
+def registrar_execucao(df_comparativo, nome_fundo, periodo=None, relatorio=None, caminho=HISTORICO_PADRAO):
+    """
+    Grava o resultado de uma conciliação no histórico. `periodo` é um texto livre que
+    identifica a competência (ex: '2024-05' ou '2024-05-31'); sem ele, a data de hoje.
+    Uma execução anterior do mesmo fundo e período é substituída. Retorna o id da execução.
+    """
+    return registrar_resumo(resumir_execucao(df_comparativo), nome_fundo, periodo, relatorio, caminho)
+
+
+def registrar_resumo(resumo, nome_fundo, periodo=None, relatorio=None, caminho=HISTORICO_PADRAO):
+    """
+    Como `registrar_execucao`, a partir do resumo já montado por `resumir_execucao`.
+    """
+    periodo = periodo or date.today().isoformat()
+    totais, pendencias = resumo
+
+    with closing(conectar(caminho)) as conexao, conexao:
+        anterior = conexao.execute("SELECT id FROM execucoes WHERE fundo = ? AND periodo = ?",
+                                   (nome_fundo, periodo)).fetchone()
+        if anterior:
+            conexao.execute("DELETE FROM pendencias WHERE execucao = ?", anterior)
+            conexao.execute("DELETE FROM execucoes WHERE id = ?", anterior)
+
+        colunas = ['fundo', 'periodo', 'executado_em', 'relatorio'] + list(totais)
+        valores = [nome_fundo, periodo, datetime.now().isoformat(timespec='seconds'),
+                   relatorio and os.path.abspath(relatorio)] + list(totais.values())
+        cursor = conexao.execute(f"INSERT INTO execucoes ({', '.join(colunas)}) "
+                                 f"VALUES ({', '.join('?' * len(colunas))})", valores)
+        execucao = cursor.lastrowid
+
+        linhas = pendencias.astype(object).where(pendencias.notna(), None)
+        conexao.executemany("INSERT INTO pendencias VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            ((execucao, *linha) for linha in linhas.itertuples(index=False, name=None)))
+    return execucao
+
+
+# --- Consultas ---
+def _consultar(sql, parametros, caminho, colunas_valor=()):
+    with closing(conectar(caminho)) as conexao:
+        df = pd.read_sql_query(sql, conexao, params=parametros)
+    for coluna in colunas_valor:
+        df[coluna] = centavos_para_reais(df[coluna])
+    return df
+
+
+def historico_documento(documento, nome_fundo=None, caminho=HISTORICO_PADRAO):
+    """
+    Todos os períodos em que o documento ficou pendente, do mais antigo ao mais recente
+    (a primeira linha de cada fundo é quando a diferença apareceu). O documento é
+    normalizado como nos relatórios, então '58817/3' e '58817-003' dão no mesmo.
+    """
+    sql = """
+        SELECT e.fundo AS Fundo, e.periodo AS Periodo, p.situacao AS Situacao, p.sacado AS Sacado,
+               p.valor_nosso AS Valor_Nosso, p.valor_fundo_pago AS Valor_Fundo_Pago, p.diferenca AS Diferenca
+        FROM pendencias p JOIN execucoes e ON e.id = p.execucao
+        WHERE p.documento = ? AND (? IS NULL OR e.fundo = ?)
+        ORDER BY e.fundo, e.periodo
+    """
+    return _consultar(sql, (normalizar_documento(documento), nome_fundo, nome_fundo), caminho,
+                      ('Valor_Nosso', 'Valor_Fundo_Pago', 'Diferenca'))
+
+
+def envelhecimento(nome_fundo, periodo=None, caminho=HISTORICO_PADRAO):
+    """
+    Pendências em aberto no período informado (ou no último registrado do fundo), com o
+    período desde o qual cada uma está aberta, em quantos períodos seguidos esteve
+    pendente e, quando os períodos são datas, há quantos dias está aberta. Uma pendência
+    que foi resolvida e voltou conta a partir da volta.
+    """
+    sql = """
+        WITH referencia AS (
+            SELECT id, periodo FROM execucoes
+            WHERE fundo = :fundo AND periodo = COALESCE(:periodo, (SELECT MAX(periodo) FROM execucoes
+                                                                   WHERE fundo = :fundo))
+        ),
+        abertas AS (
+            -- Último período anterior em que o documento não estava pendente (se houver)
+            SELECT p.documento, p.situacao, p.sacado, p.diferenca, r.periodo AS referencia,
+                   (SELECT MAX(s.periodo) FROM execucoes s
+                    WHERE s.fundo = :fundo AND s.periodo < r.periodo
+                      AND NOT EXISTS (SELECT 1 FROM pendencias a
+                                      WHERE a.execucao = s.id AND a.documento = p.documento)) AS resolvido
+            FROM referencia r JOIN pendencias p ON p.execucao = r.id
+        )
+        SELECT o.documento AS Documento, o.situacao AS Situacao, o.sacado AS Sacado, o.diferenca AS Diferenca,
+               MIN(e.periodo) AS Desde, COUNT(*) AS Periodos,
+               CAST(julianday(o.referencia) - julianday(MIN(e.periodo)) AS INTEGER) AS Dias_em_Aberto
+        FROM abertas o
+        JOIN execucoes e ON e.fundo = :fundo AND e.periodo <= o.referencia
+                        AND (o.resolvido IS NULL OR e.periodo > o.resolvido)
+        GROUP BY o.documento
+        ORDER BY Desde, o.documento
+    """
+    return _consultar(sql, {'fundo': nome_fundo, 'periodo': periodo}, caminho, ('Diferenca',))
+
+
+def diferencas_recorrentes(nome_fundo=None, minimo_periodos=2, caminho=HISTORICO_PADRAO):
+    """
+    Sacados com pendências em pelo menos `minimo_periodos` períodos distintos, dos mais
+    recorrentes para os menos, com a quantidade de documentos e a soma das diferenças.
+    """
+    sql = """
+        SELECT e.fundo AS Fundo, p.sacado AS Sacado, COUNT(DISTINCT e.periodo) AS Periodos,
+               COUNT(DISTINCT p.documento) AS Documentos, COUNT(*) AS Ocorrencias,
+               SUM(p.diferenca) AS Total_Diferencas, MIN(e.periodo) AS Desde, MAX(e.periodo) AS Ate
+        FROM pendencias p JOIN execucoes e ON e.id = p.execucao
+        WHERE ? IS NULL OR e.fundo = ?
+        GROUP BY e.fundo, p.sacado
+        HAVING COUNT(DISTINCT e.periodo) >= ?
+        ORDER BY Periodos DESC, ABS(SUM(p.diferenca)) DESC
+    """
+    return _consultar(sql, (nome_fundo, nome_fundo, minimo_periodos), caminho, ('Total_Diferencas',))
+
+
+def totais_por_fundo(nome_fundo=None, caminho=HISTORICO_PADRAO):
+    """
+    Os totais do sumário de cada execução registrada, por fundo e período.
+    """
+    sql = """
+        SELECT fundo AS Fundo, periodo AS Periodo, executado_em AS Executado_Em,
+               valor_nosso AS Valor_Nosso, valor_fundo_pago AS Valor_Fundo_Pago,
+               correspondentes AS Correspondentes, com_diferenca AS Com_Diferenca,
+               valor_diferencas AS Valor_Diferencas, apenas_nosso AS Apenas_Nosso,
+               valor_apenas_nosso AS Valor_Apenas_Nosso, apenas_fundo AS Apenas_Fundo,
+               valor_apenas_fundo AS Valor_Apenas_Fundo
+        FROM execucoes
+        WHERE ? IS NULL OR fundo = ?
+        ORDER BY fundo, periodo
+    """
+    return _consultar(sql, (nome_fundo, nome_fundo), caminho,
+                      ('Valor_Nosso', 'Valor_Fundo_Pago', 'Valor_Diferencas', 'Valor_Apenas_Nosso',
+                       'Valor_Apenas_Fundo'))
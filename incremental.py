@@ -0,0 +1,242 @@
+# incremental.py
+"""
+Reconciliação incremental.
+
+Guarda, por combinação (nosso relatório, fundo, relatório do fundo), os DataFrames
+agregados, o comparativo e até onde cada arquivo já foi lido. Na execução seguinte
+só as linhas acrescentadas no fim dos arquivos são processadas, e só os documentos
+afetados por elas são re-agregados e re-cruzados.
+
+Se um arquivo encolher, tiver o trecho já lido alterado, ou se a versão de algum
+parser mudar, o estado é descartado e tudo é reprocessado.
+"""
+import os
+import io
+import json
+import hashlib
+
+import pandas as pd
+from cache import PASTA_CACHE_PADRAO, EXTENSAO, salvar_df, carregar_df
+from reconciliacao import tamanho_bloco_para, normalizar, agregar_nosso, agregar_fundo, cruzar
+from parsers import nosso_relatorio_parser
+
+PASTA_ESTADO_PADRAO = os.path.join(PASTA_CACHE_PADRAO, 'incremental')
+VERSAO_ESTADO = 3
+# Trecho final já lido cujo hash é conferido para detectar arquivos reescritos
+TAMANHO_CAUDA = 64 * 1024
+
+
+def _hash_cauda(caminho_arquivo, fim):
+    inicio = max(0, fim - TAMANHO_CAUDA)
+    with open(caminho_arquivo, 'rb') as f:
+        f.seek(inicio)
+        return hashlib.blake2b(f.read(fim - inicio), digest_size=20).hexdigest()
+
+
+def _fim_linhas_completas(caminho_arquivo):
+    """
+    Posição logo depois da última quebra de linha do arquivo. Uma última linha sem quebra
+    pode estar sendo escrita ainda: fica para a próxima execução.
+    """
+    with open(caminho_arquivo, 'rb') as f:
+        fim = f.seek(0, os.SEEK_END)
+        while fim > 0:
+            inicio = max(0, fim - TAMANHO_CAUDA)
+            f.seek(inicio)
+            quebra = f.read(fim - inicio).rfind(b'\n')
+            if quebra >= 0:
+                return inicio + quebra + 1
+            fim = inicio
+    return 0
+
+
+class _Trecho(io.RawIOBase):
+    """
+    O arquivo aberto só até `tamanho` bytes: o que houver depois (inclusive o que for
+    acrescentado durante a leitura) é ignorado, como se o arquivo terminasse ali.
+    """
+
+    def __init__(self, caminho_arquivo, tamanho):
+        super().__init__()
+        self._arquivo = open(caminho_arquivo, 'rb')
+        self._tamanho = tamanho
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._arquivo.tell()
+
+    def seek(self, posicao, de_onde=os.SEEK_SET):
+        if de_onde == os.SEEK_END:
+            posicao += self._tamanho
+        elif de_onde == os.SEEK_CUR:
+            posicao += self._arquivo.tell()
+        return self._arquivo.seek(min(posicao, self._tamanho))
+
+    def readinto(self, destino):
+        restante = self._tamanho - self._arquivo.tell()
+        if restante <= 0:
+            return 0
+        return self._arquivo.readinto(memoryview(destino)[:restante])
+
+    def close(self):
+        self._arquivo.close()
+        super().close()
+
+
+def _abrir_trecho(caminho_arquivo, tamanho):
+    return io.BufferedReader(_Trecho(caminho_arquivo, tamanho))
+
+
+def _marcar_lido(caminho_arquivo, offset):
+    return {'offset': offset, 'cauda': _hash_cauda(caminho_arquivo, offset)}
+
+
+def _ler_acrescimo(caminho_arquivo, fonte, linhas_cabecalho):
+    """
+    Lê as linhas completas acrescentadas após o trecho já processado.
+    Retorna (conteúdo com o cabeçalho original na frente, posição até onde foi lido),
+    ou None se o arquivo não for mais uma continuação do que foi lido.
+    """
+    if os.path.getsize(caminho_arquivo) < fonte['offset'] or \
+            _hash_cauda(caminho_arquivo, fonte['offset']) != fonte['cauda']:
+        return None
+
+    with open(caminho_arquivo, 'rb') as f:
+        cabecalho = b''.join(f.readline() for _ in range(linhas_cabecalho))
+        f.seek(fonte['offset'])
+        dados = f.read()
+
+    # Uma última linha sem quebra pode estar sendo escrita ainda: fica para a próxima execução
+    dados = dados[:dados.rfind(b'\n') + 1]
+    return cabecalho + dados, fonte['offset'] + len(dados)
+
+
+def _atualizar_agregado(df_agg, df_delta_agg, agregar):
+    """
+    Re-agrega apenas os documentos presentes no acréscimo e devolve o agregado completo.
+    """
+    if df_delta_agg.empty:
+        return df_agg
+    afetados = df_agg['Documento'].isin(df_delta_agg['Documento'])
+    combinados = pd.concat([df_agg[afetados], df_delta_agg], ignore_index=True)
+    atualizados = agregar(combinados.rename(columns={'Documento': 'Documento_Norm'}))
+    return (pd.concat([df_agg[~afetados], atualizados], ignore_index=True)
+            .sort_values('Documento', kind='stable').reset_index(drop=True))
+
+
+def _chave_estado(caminho_nosso, nome_fundo, caminho_fundo):
+    texto = '|'.join([os.path.abspath(caminho_nosso), nome_fundo, os.path.abspath(caminho_fundo)])
+    return hashlib.blake2b(texto.encode(), digest_size=16).hexdigest()
+
+
+def _versoes(parser_fundo):
+    return [VERSAO_ESTADO, getattr(nosso_relatorio_parser, 'VERSAO', 0), getattr(parser_fundo, 'VERSAO', 0)]
+
+
+def _carregar_estado(pasta, parser_fundo):
+    try:
+        with open(os.path.join(pasta, 'estado.json'), encoding='utf-8') as f:
+            estado = json.load(f)
+        if estado['versoes'] != _versoes(parser_fundo):
+            return None
+        frames = [carregar_df(os.path.join(pasta, nome + EXTENSAO))
+                  for nome in ('nosso_agg', 'fundo_agg', 'comparativo')]
+    except (OSError, ValueError, KeyError):
+        return None
+    return estado, frames
+
+
+def _salvar_estado(pasta, parser_fundo, fontes, df_nosso_agg, df_fundo_agg, df_comparativo):
+    os.makedirs(pasta, exist_ok=True)
+    for nome, df in (('nosso_agg', df_nosso_agg), ('fundo_agg', df_fundo_agg), ('comparativo', df_comparativo)):
+        salvar_df(df, os.path.join(pasta, nome + EXTENSAO))
+    with open(os.path.join(pasta, 'estado.json'), 'w', encoding='utf-8') as f:
+        json.dump({'versoes': _versoes(parser_fundo), **fontes}, f)
+
+
+def _reconstruir(caminho_nosso, parser_fundo, caminho_fundo):
+    # Só as linhas completas que existiam no início da leitura: o que for acrescentado
+    # enquanto os arquivos são lidos fica para a próxima execução, sem ser contado duas vezes
+    fim_nosso = _fim_linhas_completas(caminho_nosso)
+    with _abrir_trecho(caminho_nosso, fim_nosso) as f:
+        df_nosso, linhas_nosso = nosso_relatorio_parser.processar_trecho(
+            f, chunksize=tamanho_bloco_para(caminho_nosso))
+    if df_nosso.empty:
+        raise ValueError(nosso_relatorio_parser.MENSAGEM_SEM_DADOS)
+
+    fim_fundo = _fim_linhas_completas(caminho_fundo)
+    with _abrir_trecho(caminho_fundo, fim_fundo) as f:
+        df_fundo = parser_fundo.processar(f, chunksize=tamanho_bloco_para(caminho_fundo))
+
+    # No nosso relatório, guarda também quantas linhas de dados já foram lidas: as chaves
+    # sintéticas das linhas novas continuam essa numeração
+    fontes = {'nosso': {**_marcar_lido(caminho_nosso, fim_nosso), 'linhas': linhas_nosso},
+              'fundo': _marcar_lido(caminho_fundo, fim_fundo)}
+    df_nosso_agg = agregar_nosso(normalizar(df_nosso))
+    df_fundo_agg = agregar_fundo(normalizar(df_fundo))
+    return fontes, df_nosso_agg, df_fundo_agg, cruzar(df_nosso_agg, df_fundo_agg)
+
+
+def conciliar_incremental(caminho_nosso, nome_fundo, parser_fundo, caminho_fundo, pasta_estado=PASTA_ESTADO_PADRAO):
+    """
+    Equivalente a conciliar os dois arquivos inteiros, mas reaproveitando o estado da
+    execução anterior para processar só as linhas novas.
+    Retorna (df_nosso_agg, df_fundo_agg, df_comparativo).
+    """
+    pasta = os.path.join(pasta_estado, _chave_estado(caminho_nosso, nome_fundo, caminho_fundo))
+    salvo = _carregar_estado(pasta, parser_fundo)
+
+    acrescimos = None
+    if salvo is not None:
+        estado, (df_nosso_agg, df_fundo_agg, df_comparativo) = salvo
+        acrescimo_nosso = _ler_acrescimo(caminho_nosso, estado['nosso'], nosso_relatorio_parser.LINHAS_CABECALHO)
+        acrescimo_fundo = _ler_acrescimo(caminho_fundo, estado['fundo'], parser_fundo.LINHAS_CABECALHO)
+        if acrescimo_nosso is not None and acrescimo_fundo is not None:
+            acrescimos = acrescimo_nosso, acrescimo_fundo
+
+    if acrescimos is None:
+        fontes, df_nosso_agg, df_fundo_agg, df_comparativo = _reconstruir(caminho_nosso, parser_fundo, caminho_fundo)
+        _salvar_estado(pasta, parser_fundo, fontes, df_nosso_agg, df_fundo_agg, df_comparativo)
+        return df_nosso_agg, df_fundo_agg, df_comparativo
+
+    (dados_nosso, fim_nosso), (dados_fundo, fim_fundo) = acrescimos
+    linhas_nosso = estado['nosso']['linhas']
+
+    if fim_nosso > estado['nosso']['offset']:
+        # As chaves sintéticas continuam a numeração das linhas de dados já lidas
+        df_delta, lidas = nosso_relatorio_parser.processar_trecho(io.BytesIO(dados_nosso),
+                                                                  indice_inicial=linhas_nosso)
+        linhas_nosso += lidas
+        if df_delta.empty:
+            # Nenhuma transação nas linhas novas
+            df_delta_nosso = df_nosso_agg.iloc[0:0]
+        else:
+            df_delta_nosso = agregar_nosso(normalizar(df_delta))
+        df_nosso_agg = _atualizar_agregado(df_nosso_agg, df_delta_nosso, agregar_nosso)
+    else:
+        df_delta_nosso = df_nosso_agg.iloc[0:0]
+
+    if fim_fundo > estado['fundo']['offset']:
+        df_delta_fundo = agregar_fundo(normalizar(parser_fundo.processar(io.BytesIO(dados_fundo))))
+        df_fundo_agg = _atualizar_agregado(df_fundo_agg, df_delta_fundo, agregar_fundo)
+    else:
+        df_delta_fundo = df_fundo_agg.iloc[0:0]
+
+    # Só os documentos tocados pelo acréscimo mudam de categoria no comparativo
+    afetados = pd.concat([df_delta_nosso['Documento'], df_delta_fundo['Documento']]).unique()
+    if len(afetados):
+        mantidos = df_comparativo[~df_comparativo['Documento'].isin(afetados)]
+        recruzados = cruzar(df_nosso_agg[df_nosso_agg['Documento'].isin(afetados)],
+                            df_fundo_agg[df_fundo_agg['Documento'].isin(afetados)])
+        df_comparativo = (pd.concat([mantidos, recruzados], ignore_index=True)
+                          .sort_values('Documento', kind='stable').reset_index(drop=True))
+
+    fontes = {'nosso': {**_marcar_lido(caminho_nosso, fim_nosso), 'linhas': linhas_nosso},
+              'fundo': _marcar_lido(caminho_fundo, fim_fundo)}
+    _salvar_estado(pasta, parser_fundo, fontes, df_nosso_agg, df_fundo_agg, df_comparativo)
+    return df_nosso_agg, df_fundo_agg, df_comparativo
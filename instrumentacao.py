@@ -0,0 +1,322 @@
+# instrumentacao.py
+"""
+Medição das etapas da reconciliação: tempo, linhas de entrada/saída e memória.
+
+A memória de cada etapa é a memória residente (RSS) do processo, amostrada em uma
+thread enquanto a etapa executa: o valor no início, o pico e o acréscimo entre os
+dois (o que a etapa de fato consumiu, mesmo em processos que já rodaram outras
+conciliações antes).
+
+O Perfilador também calcula o percentual de progresso a partir de pesos por etapa,
+que vêm dos tempos medidos na execução anterior (ou de uma estimativa pelo tamanho
+dos arquivos), e grava um relatório JSON com as medições. Dentro de uma etapa, o
+código que lê ou grava em partes chama `informar_progresso` a cada parte, o que
+também é o ponto em que um cancelamento pedido é atendido.
+"""
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+ETAPAS = ['leitura_nosso', 'leitura_fundo', 'normalizacao', 'agregacao', 'cruzamento', 'relatorio']
+# Na reconciliação particionada, a normalização é feita junto com a leitura e a agregação
+# junto com o cruzamento de cada partição
+ETAPAS_PARTICIONADO = ['leitura_nosso', 'leitura_fundo', 'cruzamento', 'relatorio']
+
+# Fração do tempo total de cada etapa quando não há medição anterior.
+# A fatia das leituras é dividida entre os dois arquivos pelo tamanho de cada um.
+_FRACAO_LEITURA = 0.6
+_FRACOES_PADRAO = {'normalizacao': 0.05, 'agregacao': 0.05, 'cruzamento': 0.05, 'relatorio': 0.25}
+
+
+# Intervalo entre as medidas de memória durante uma etapa, em segundos
+INTERVALO_AMOSTRAGEM = 0.02
+
+
+def _rss_windows():
+    import ctypes
+    from ctypes import wintypes
+
+    class ContadoresMemoria(ctypes.Structure):  # PROCESS_MEMORY_COUNTERS
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+            (campo, ctypes.c_size_t) for campo in (
+                'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+
+    kernel32, psapi = ctypes.WinDLL('kernel32'), ctypes.WinDLL('psapi')
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.c_void_p, wintypes.DWORD]
+    contadores = ContadoresMemoria()
+    contadores.cb = ctypes.sizeof(contadores)
+
+    def rss():
+        if not psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(contadores), contadores.cb):
+            return None
+        return contadores.WorkingSetSize
+    return rss
+
+
+def _rss_proc():
+    tamanho_pagina = os.sysconf('SC_PAGE_SIZE')
+
+    def rss():
+        # Segundo campo do statm: páginas residentes
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * tamanho_pagina
+    return rss
+
+
+def _leitor_rss():
+    """
+    Função que devolve a memória residente atual do processo em bytes: pelo psutil, se
+    instalado, ou direto pelo sistema (Windows e Linux). None se não houver como medir.
+    """
+    if psutil is not None:
+        processo = psutil.Process()
+        return lambda: processo.memory_info().rss
+    try:
+        rss = _rss_windows() if sys.platform == 'win32' else _rss_proc()
+        rss()
+        return rss
+    except (OSError, ValueError, AttributeError, IndexError):
+        return None
+
+
+_ler_rss = _leitor_rss()
+
+
+def rss_mb():
+    """
+    Memória residente atual do processo, em MB (None se indisponível).
+    """
+    if _ler_rss is None:
+        return None
+    try:
+        rss = _ler_rss()
+    except (OSError, ValueError):
+        return None
+    return rss / (1024 * 1024) if rss is not None else None
+
+
+class AmostradorRss:
+    """
+    Acompanha a memória residente do processo enquanto o bloco `with` executa, em uma
+    thread que mede a cada `intervalo` segundos. `inicial` é a medida na entrada e
+    `pico` a maior medida até a saída (MB, ou None se não houver como medir).
+    """
+
+    def __init__(self, intervalo=INTERVALO_AMOSTRAGEM):
+        self.intervalo = intervalo
+        self.inicial = self.pico = None
+        self._parar = threading.Event()
+        self._thread = None
+
+    def _registrar(self, medida):
+        if medida is not None and (self.pico is None or medida > self.pico):
+            self.pico = medida
+
+    def _amostrar(self):
+        while not self._parar.wait(self.intervalo):
+            self._registrar(rss_mb())
+
+    def __enter__(self):
+        self.inicial = self.pico = rss_mb()
+        if self.inicial is not None:
+            self._thread = threading.Thread(target=self._amostrar, name='amostrador_rss', daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *excecao):
+        if self._thread is not None:
+            self._parar.set()
+            self._thread.join()
+            self._registrar(rss_mb())
+        return False
+
+
+class Cancelado(Exception):
+    """
+    A execução foi cancelada pelo usuário.
+    """
+
+
+# Perfilador da etapa em andamento neste processo (ver `informar_progresso`)
+_perfilador_ativo = None
+
+
+def informar_progresso(fracao, detalhe=None):
+    """
+    Informa o quanto da etapa em andamento já foi feito (`fracao`, de 0 a 1). Fora de
+    uma etapa medida (ex: nos processos de leitura de vários arquivos) não faz nada.
+    Levanta Cancelado se o cancelamento tiver sido pedido.
+    """
+    if _perfilador_ativo is not None:
+        _perfilador_ativo.avancar(fracao, detalhe)
+
+
+def verificar_cancelamento():
+    """
+    Levanta Cancelado se o cancelamento da etapa em andamento tiver sido pedido, sem
+    informar progresso (ex: enquanto espera outros processos).
+    """
+    if _perfilador_ativo is not None:
+        _perfilador_ativo.verificar_cancelamento()
+
+
+def desligar_progresso():
+    """
+    Inicializador dos pools de processos. Criados por fork (o padrão no Linux), os
+    processos de trabalho herdariam o perfilador da etapa em andamento no processo pai,
+    com o envio de progresso e a consulta ao cancelamento, e informariam o andamento do
+    seu próprio arquivo como se fosse o da etapa inteira.
+    """
+    global _perfilador_ativo
+    _perfilador_ativo = None
+
+
+def caminho_tempos(caminho_saida):
+    """
+    Caminho do relatório de tempos, ao lado do relatório gerado.
+    """
+    return os.path.splitext(caminho_saida)[0] + '_tempos.json'
+
+
+def pesos_estimados(caminho_tempos_anterior, tamanho_nosso=0, tamanho_fundo=0):
+    """
+    Pesos das etapas para a barra de progresso: os segundos medidos na execução
+    anterior (em memória ou particionada), se houver, ou uma estimativa pelo tamanho
+    dos arquivos. As etapas que a execução atual não tiver são descartadas por ela
+    (ver `Perfilador.limitar_etapas`).
+    """
+    try:
+        with open(caminho_tempos_anterior, encoding='utf-8') as f:
+            anteriores = {e['etapa']: e['segundos'] for e in json.load(f)['etapas']}
+        if any(all(anteriores.get(etapa) is not None for etapa in etapas) for etapas in (ETAPAS, ETAPAS_PARTICIONADO)):
+            return anteriores
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    total = (tamanho_nosso + tamanho_fundo) or 1
+    pesos = dict(_FRACOES_PADRAO)
+    pesos['leitura_nosso'] = _FRACAO_LEITURA * tamanho_nosso / total
+    pesos['leitura_fundo'] = _FRACAO_LEITURA * tamanho_fundo / total
+    return pesos
+
+
+class Perfilador:
+    """
+    Registra as etapas executadas dentro de `with perfilador.etapa(...)`.
+    `ao_progredir(percentual, mensagem)` é chamado no início de cada etapa e
+    `ao_avancar(percentual, detalhe)` a cada parte informada dentro dela.
+    `cancelado()` é consultado nesses mesmos pontos: se retornar True, a etapa
+    é interrompida com Cancelado.
+    """
+
+    def __init__(self, pesos=None, ao_progredir=None, medir_memoria=False, etapas=None, ao_avancar=None,
+                 cancelado=None):
+        self.pesos = pesos or {}
+        self.ao_progredir = ao_progredir
+        self.ao_avancar = ao_avancar
+        self.cancelado = cancelado
+        self.medir_memoria = medir_memoria
+        self.etapas = list(etapas or [])
+        self._concluido = sum(self.pesos.get(e['etapa'], 0) for e in self.etapas)
+        self._atual = None
+
+    def percentual(self, fracao_atual=0):
+        total = sum(self.pesos.values())
+        concluido = self._concluido + self.pesos.get(self._atual, 0) * min(max(fracao_atual, 0), 1)
+        return round(100 * concluido / total) if total else 0
+
+    def limitar_etapas(self, etapas):
+        """
+        Descarta os pesos das etapas fora de `etapas`, que esta execução não vai ter:
+        sem isso, a barra de progresso pararia antes de 100%.
+        """
+        self.pesos = {etapa: peso for etapa, peso in self.pesos.items() if etapa in etapas}
+
+    def verificar_cancelamento(self):
+        if self.cancelado and self.cancelado():
+            raise Cancelado("Execução cancelada.")
+
+    def avancar(self, fracao, detalhe=None):
+        """
+        Progresso dentro da etapa em andamento (chamado por `informar_progresso`).
+        """
+        self.verificar_cancelamento()
+        if self.ao_avancar:
+            self.ao_avancar(self.percentual(fracao), detalhe)
+
+    @contextmanager
+    def etapa(self, nome, mensagem=None, linhas_entrada=None):
+        """
+        Mede a etapa `nome`. O dicionário devolvido pode receber 'linhas_saida'.
+        """
+        global _perfilador_ativo
+        self.verificar_cancelamento()
+        registro = {'etapa': nome, 'linhas_entrada': linhas_entrada, 'linhas_saida': None}
+        if self.ao_progredir and mensagem:
+            self.ao_progredir(self.percentual(), mensagem)
+
+        if self.medir_memoria:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+        anterior, _perfilador_ativo, self._atual = _perfilador_ativo, self, nome
+        amostrador = AmostradorRss()
+        inicio = time.perf_counter()
+        try:
+            with amostrador:
+                yield registro
+        finally:
+            _perfilador_ativo, self._atual = anterior, None
+            registro['segundos'] = round(time.perf_counter() - inicio, 4)
+            if self.medir_memoria:
+                registro['pico_python_mb'] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+            if amostrador.inicial is not None:
+                registro['rss_inicial_mb'] = round(amostrador.inicial, 1)
+                registro['pico_rss_mb'] = round(amostrador.pico, 1)
+                registro['acrescimo_rss_mb'] = round(amostrador.pico - amostrador.inicial, 1)
+            else:
+                registro['rss_inicial_mb'] = registro['pico_rss_mb'] = registro['acrescimo_rss_mb'] = None
+            self.etapas.append(registro)
+            self._concluido += self.pesos.get(nome, 0)
+
+    def relatorio(self):
+        return {
+            'etapas': self.etapas,
+            'total_segundos': round(sum(e['segundos'] for e in self.etapas), 4),
+            'pico_rss_mb': max((e['pico_rss_mb'] for e in self.etapas if e.get('pico_rss_mb') is not None),
+                               default=None),
+        }
+
+    def salvar_json(self, caminho):
+        with open(caminho, 'w', encoding='utf-8') as f:
+            json.dump(self.relatorio(), f, ensure_ascii=False, indent=2)
+
+
+@contextmanager
+def perfil_cprofile(caminho_saida):
+    """
+    Grava um perfil do cProfile do bloco em `caminho_saida` (não faz nada se for None).
+    """
+    if not caminho_saida:
+        yield
+        return
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        yield
+    finally:
+        perfil.disable()
+        perfil.dump_stats(caminho_saida)
@@ -1,10 +1,12 @@
 # main.py
 import os
 import sys
+import time
+import shutil
 import subprocess
-import threading
+import multiprocessing
 import queue
-import importlib
+import sqlite3
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 
@@ -14,55 +16,138 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 # --- Fim da Correção ---
 
-# Importa as funções dos nossos módulos
-import pandas as pd
-from utils import normalizar_documento
-from excel_generator import gerar_relatorio_excel
-# Importa os parsers específicos
-from parsers import nosso_relatorio_parser
+# Importa as funções dos nossos módulos. Só o que não depende do pandas: a janela aparece
+# logo, e o resto (pandas, openpyxl, parsers) é importado pelo processo de trabalho
+from formatos import FORMATOS_SAIDA
+from instrumentacao import Perfilador, Cancelado, pesos_estimados, caminho_tempos, perfil_cprofile
+from parsers._registro import parsers_fundos
+from parsers._deteccao import detectar_fundo
 
+# Segundos que a conciliação tem para atender o cancelamento antes de o processo ser encerrado à força
+PRAZO_CANCELAMENTO = 5
 
-# --- Lógica para carregar parsers dinamicamente ---
-def carregar_parsers_fundos():
+
+def preaquecer():
     """
-    Encontra todos os parsers de fundos na pasta 'parsers'.
-    Retorna um dicionário com o nome do fundo e o módulo do parser.
+    Importa os módulos pesados enquanto o usuário escolhe os arquivos, para que a
+    primeira conciliação não espere por eles.
     """
-    parsers = {}
-    parser_dir = os.path.join(project_root, "parsers")
-    if not os.path.isdir(parser_dir):
-        return parsers
+    try:
+        import reconciliacao  # noqa: F401
+        import historico  # noqa: F401
+        import parsers._ingestao  # noqa: F401
+    except Exception:
+        # Um erro de importação aparece de novo (e é mostrado) quando a conciliação rodar
+        pass
 
-    arquivos_parser = [f for f in os.listdir(parser_dir) if
-                       f.endswith('.py') and not f.startswith('_') and 'nosso' not in f]
 
-    for arquivo in arquivos_parser:
-        nome_modulo = arquivo[:-3]
-        nome_fundo = nome_modulo.replace("_parser", "").capitalize()
-        try:
-            modulo = importlib.import_module(f"parsers.{nome_modulo}")
-            if hasattr(modulo, 'processar'):
-                parsers[nome_fundo] = modulo
-        except ImportError as e:
-            print(f"Erro ao importar o parser '{nome_modulo}': {e}")
+def _modificado_em(caminho):
+    # Numa pasta de arquivos colunares, o arquivo mais recente (sobrescrever não muda a pasta)
+    if os.path.isdir(caminho):
+        return max([os.path.getmtime(caminho)] +
+                   [os.path.getmtime(os.path.join(caminho, nome)) for nome in os.listdir(caminho)])
+    return os.path.getmtime(caminho)
 
-    return parsers
+
+def remover_saida_parcial(caminho_saida, desde):
+    """
+    Apaga o relatório (planilha ou pasta) gravado a partir do instante `desde` por uma
+    execução interrompida. Um relatório anterior que não chegou a ser tocado é mantido.
+    """
+    try:
+        if not caminho_saida or _modificado_em(caminho_saida) < desde:
+            return
+        if os.path.isdir(caminho_saida):
+            shutil.rmtree(caminho_saida, ignore_errors=True)
+        else:
+            os.remove(caminho_saida)
+    except OSError:
+        pass
+
+
+def conciliar(mensagens, cancelar, arquivos_nosso, nome_fundo, arquivos_fundo, formato):
+    """
+    Executa uma conciliação no processo de trabalho, enviando o andamento para a janela
+    como tuplas (tipo, dados) em `mensagens`. Se `cancelar` for sinalizado, a execução
+    para no próximo bloco lido ou escrito e o relatório parcial é apagado.
+    """
+    inicio = time.time()
+    caminho_saida = None
+    try:
+        from reconciliacao import caminho_relatorio, executar_conciliacao
+        from historico import registrar_execucao
+
+        parser_modulo = parsers_fundos()[nome_fundo]
+        caminho_saida = caminho_relatorio(os.path.dirname(arquivos_nosso[0]), nome_fundo, formato)
+        mensagens.put(("saida", caminho_saida))
+
+        # A barra avança pelos tempos medidos na execução anterior deste relatório
+        pesos = pesos_estimados(caminho_tempos(caminho_saida),
+                                sum(os.path.getsize(f) for f in arquivos_nosso),
+                                sum(os.path.getsize(f) for f in arquivos_fundo))
+        perfilador = Perfilador(pesos,
+                                ao_progredir=lambda percentual, mensagem: mensagens.put(
+                                    ("progress", (percentual, mensagem))),
+                                ao_avancar=lambda percentual, detalhe: mensagens.put(
+                                    ("avanco", (percentual, detalhe))),
+                                cancelado=cancelar.is_set)
+
+        caminho_perfil = os.path.splitext(caminho_saida)[0] + '.prof' \
+            if os.environ.get('RECON_FIDC_PERFIL') else None
+        with perfil_cprofile(caminho_perfil):
+            _, _, df_comparativo = executar_conciliacao(arquivos_nosso, nome_fundo, parser_modulo, arquivos_fundo,
+                                                        caminho_saida, formato, perfilador=perfilador)
+        try:
+            registrar_execucao(df_comparativo, nome_fundo, relatorio=caminho_saida)
+        except sqlite3.Error as e:
+            mensagens.put(("progress", (99, f"Aviso: execução não registrada no histórico: {e}")))
+
+        mensagens.put(("progress", (100, "Análise concluída com sucesso!")))
+        mensagens.put(("done", None))
+    except Cancelado:
+        remover_saida_parcial(caminho_saida, inicio)
+        mensagens.put(("cancelled", None))
+    except (PermissionError, ValueError) as e:
+        mensagens.put(("error", f"Erro ao processar arquivo:\n\n{e}"))
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        mensagens.put(("error", f"Ocorreu um erro inesperado:\n\n{e}"))
+
+
+def executar_tarefas(tarefas, mensagens, cancelar):
+    """
+    Laço do processo de trabalho: importa os módulos pesados uma vez, enquanto o usuário
+    ainda escolhe os arquivos, e executa cada conciliação recebida em `tarefas`
+    (dicionários com os argumentos de `conciliar`). None encerra o processo.
+    """
+    preaquecer()
+    while (tarefa := tarefas.get()) is not None:
+        conciliar(mensagens, cancelar, **tarefa)
 
 
 class ReconciliationApp:
     def __init__(self, root, parsers_disponiveis):
         self.root = root
         self.root.title("Reconciliador de Relatórios Contábeis")
-        self.root.geometry("650x450")
+        self.root.geometry("650x480")
 
         self.parsers = parsers_disponiveis
         self.nosso_path = tk.StringVar()
         self.fundo_path = tk.StringVar()
+        # Arquivos escolhidos de cada lado (um fundo pode entregar o relatório em vários CSVs)
+        self.arquivos_nosso = []
+        self.arquivos_fundo = []
         self.fundo_selecionado = tk.StringVar()
+        self.formato_saida = tk.StringVar(value=FORMATOS_SAIDA[0])
 
         self.output_path = ""
-        self.thread_queue = queue.Queue()
         self.is_running = False
+        # Processo de trabalho (ver `executar_tarefas`) e suas filas, criados por `iniciar_trabalhador`
+        self.trabalhador = None
+        self.execucao = 0
+        self.inicio_execucao = 0
+        self.status_text = tk.StringVar()
 
         # --- Widgets ---
         main_frame = ttk.Frame(root, padding="10")
@@ -92,34 +177,86 @@ class ReconciliationApp:
                    command=lambda: self.select_file(self.fundo_path, "Selecione o Relatório do Fundo")).grid(row=2,
                                                                                                              column=3)
 
+        # Formato de saída
+        ttk.Label(main_frame, text="4. Formato de saída:").grid(row=3, column=0, sticky="w", pady=2)
+        formato_combo = ttk.Combobox(main_frame, textvariable=self.formato_saida, state="readonly",
+                                     values=list(FORMATOS_SAIDA))
+        formato_combo.grid(row=3, column=1, columnspan=2, sticky="ew", padx=5)
+
         # Controles
-        self.generate_button = ttk.Button(main_frame, text="Gerar Relatório", command=self.start_reconciliation_thread,
+        controles = ttk.Frame(main_frame)
+        controles.grid(row=4, column=0, columnspan=4, pady=15)
+        self.generate_button = ttk.Button(controles, text="Gerar Relatório", command=self.start_reconciliation_thread,
                                           state="disabled")
-        self.generate_button.grid(row=3, column=0, columnspan=4, pady=15)
+        self.generate_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(controles, text="Cancelar", command=self.cancel_reconciliation,
+                                        state="disabled")
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
 
         self.progress_bar = ttk.Progressbar(main_frame, orient="horizontal", mode="determinate")
-        self.progress_bar.grid(row=4, column=0, columnspan=4, sticky="ew", pady=5)
+        self.progress_bar.grid(row=5, column=0, columnspan=4, sticky="ew", pady=5)
+
+        # Andamento dentro da etapa (linhas lidas, linhas escritas...), sem ir para o log
+        ttk.Label(main_frame, textvariable=self.status_text).grid(row=6, column=0, columnspan=4, sticky="w")
 
         self.log_text = tk.Text(main_frame, height=8, state="disabled", bg="#f0f0f0", wrap="word")
-        self.log_text.grid(row=5, column=0, columnspan=4, sticky="nsew")
+        self.log_text.grid(row=7, column=0, columnspan=4, sticky="nsew")
 
         self.open_button = ttk.Button(main_frame, text="Abrir Relatório Gerado", command=self.open_report,
                                       state="disabled")
-        self.open_button.grid(row=6, column=0, columnspan=4, pady=10)
+        self.open_button.grid(row=8, column=0, columnspan=4, pady=10)
 
         main_frame.columnconfigure(1, weight=1)
-        main_frame.rowconfigure(5, weight=1)
+        main_frame.rowconfigure(7, weight=1)
+
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
 
     def select_file(self, path_var, title):
         """
-        Abre uma janela para selecionar um arquivo CSV.
+        Abre uma janela para selecionar um ou mais arquivos CSV.
         """
         filetypes = [("CSV files", "*.csv"), ("All files", "*.*")]
-        filepath = filedialog.askopenfilename(parent=self.root, title=title, filetypes=filetypes)
-        if filepath:
-            path_var.set(filepath)
+        filepaths = list(filedialog.askopenfilenames(parent=self.root, title=title, filetypes=filetypes))
+        if filepaths:
+            if path_var is self.fundo_path:
+                self.arquivos_fundo = filepaths
+            else:
+                self.arquivos_nosso = filepaths
+            path_var.set(filepaths[0] if len(filepaths) == 1 else
+                         f"{len(filepaths)} arquivos: " + ", ".join(os.path.basename(f) for f in filepaths))
+            if path_var is self.fundo_path:
+                # Já deixa selecionado o fundo reconhecido pelo cabeçalho do arquivo
+                detectado = self.detectar_fundo()
+                if detectado:
+                    self.fundo_selecionado.set(detectado)
             self.check_paths()
 
+    def detectar_fundo(self):
+        try:
+            return detectar_fundo(self.arquivos_fundo[0],
+                                  {nome: parser.caminho for nome, parser in self.parsers.items()})
+        except (IndexError, OSError):
+            return None
+
+    def confirmar_fundo(self):
+        """
+        Se o cabeçalho do arquivo indicar outro fundo que não o selecionado, pergunta se
+        deve trocar. Retorna False se o usuário cancelar.
+        """
+        detectado = self.detectar_fundo()
+        escolhido = self.fundo_selecionado.get()
+        if not detectado or detectado == escolhido:
+            return True
+        resposta = messagebox.askyesnocancel(
+            "Fundo diferente",
+            f"O arquivo parece ser um relatório do fundo '{detectado}', mas o fundo selecionado é '{escolhido}'.\n\n"
+            f"Usar o parser de '{detectado}'?", parent=self.root)
+        if resposta is None:
+            return False
+        if resposta:
+            self.fundo_selecionado.set(detectado)
+        return True
+
     def check_paths(self):
         if self.nosso_path.get() and self.fundo_path.get() and self.fundo_selecionado.get():
             self.generate_button.config(state="normal")
@@ -132,90 +269,127 @@ class ReconciliationApp:
         self.log_text.see(tk.END)
         self.log_text.config(state="disabled")
 
+    def iniciar_trabalhador(self):
+        """
+        Inicia o processo que executa as conciliações. Ele já importa o pandas e os parsers
+        enquanto o usuário escolhe os arquivos; a janela continua respondendo durante a
+        leitura, que não disputa o GIL com o Tk.
+        """
+        # 'spawn' também no Linux: o processo não herda a conexão do Tk
+        contexto = multiprocessing.get_context('spawn')
+        self.tarefas = contexto.Queue()
+        self.mensagens = contexto.Queue()
+        self.cancelar = contexto.Event()
+        # Não pode ser daemon: a leitura de vários arquivos abre seus próprios processos
+        self.trabalhador = contexto.Process(target=executar_tarefas, args=(self.tarefas, self.mensagens, self.cancelar),
+                                            name="conciliacao")
+        self.trabalhador.start()
+
+    def encerrar_trabalhador(self):
+        # Os processos que o trabalhador abriu para ler vários arquivos (ver
+        # `reconciliacao.mapear_em_processos`) percebem a morte dele e saem em seguida,
+        # sem terminar a tarefa em andamento
+        if self.trabalhador is not None and self.trabalhador.is_alive():
+            self.trabalhador.terminate()
+            self.trabalhador.join()
+        self.trabalhador = None
+
     def start_reconciliation_thread(self):
         if self.is_running: return
+        if not self.confirmar_fundo(): return
+        if self.trabalhador is None or not self.trabalhador.is_alive():
+            self.iniciar_trabalhador()
         self.is_running = True
+        self.execucao += 1
+        self.inicio_execucao = time.time()
+        self.output_path = ""
         self.generate_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
         self.open_button.config(state="disabled")
         self.progress_bar['value'] = 0
+        self.status_text.set("")
         self.log_text.config(state="normal")
         self.log_text.delete(1.0, tk.END)
         self.log_text.config(state="disabled")
 
-        self.thread = threading.Thread(target=self.run_reconciliation)
-        self.thread.daemon = True
-        self.thread.start()
+        self.cancelar.clear()
+        self.tarefas.put({'arquivos_nosso': self.arquivos_nosso, 'nome_fundo': self.fundo_selecionado.get(),
+                          'arquivos_fundo': self.arquivos_fundo, 'formato': self.formato_saida.get()})
         self.root.after(100, self.check_thread)
 
+    def cancel_reconciliation(self):
+        """
+        Pede o cancelamento, atendido no próximo bloco lido ou escrito. Se a conciliação
+        estiver numa etapa sem blocos (ex: o cruzamento), o processo é encerrado à força
+        depois de PRAZO_CANCELAMENTO segundos.
+        """
+        if not self.is_running: return
+        self.cancel_button.config(state="disabled")
+        self.cancelar.set()
+        self.log_message("Cancelando...")
+        self.root.after(PRAZO_CANCELAMENTO * 1000, self.forcar_cancelamento, self.execucao)
+
+    def forcar_cancelamento(self, execucao):
+        if not self.is_running or execucao != self.execucao:
+            return
+        # As filas de um processo encerrado à força não são mais confiáveis: o próximo começa do zero
+        self.encerrar_trabalhador()
+        remover_saida_parcial(self.output_path, self.inicio_execucao)
+        self.finalizar_cancelamento()
+
+    def finalizar_cancelamento(self):
+        self.is_running = False
+        self.output_path = ""
+        self.log_message("Conciliação cancelada. O relatório parcial foi apagado.")
+
     def check_thread(self):
         try:
             while True:
-                message = self.thread_queue.get(block=False)
+                message = self.mensagens.get(block=False)
                 msg_type, msg_data = message
 
-                if msg_type == "progress":
+                if msg_type == "saida":
+                    self.output_path = msg_data
+                elif msg_type == "progress":
                     progress, text = msg_data
                     self.progress_bar['value'] = progress
+                    self.status_text.set("")
                     self.log_message(text)
+                elif msg_type == "avanco":
+                    progress, detalhe = msg_data
+                    self.progress_bar['value'] = progress
+                    self.status_text.set(detalhe or "")
                 elif msg_type == "done":
                     self.is_running = False
                     self.open_button.config(state="normal")
                     messagebox.showinfo("Sucesso", "Relatório de reconciliação gerado com sucesso!", parent=self.root)
                     return
+                elif msg_type == "cancelled":
+                    self.finalizar_cancelamento()
+                    return
                 elif msg_type == "error":
                     self.is_running = False
                     messagebox.showerror("Erro", msg_data, parent=self.root)
                     return
         except queue.Empty:
-            pass
+            if self.is_running and not self.trabalhador.is_alive():
+                self.is_running = False
+                remover_saida_parcial(self.output_path, self.inicio_execucao)
+                messagebox.showerror("Erro", "O processo de conciliação terminou inesperadamente.", parent=self.root)
         finally:
             if self.is_running:
                 self.root.after(100, self.check_thread)
             else:
                 self.generate_button.config(state="normal")
+                self.cancel_button.config(state="disabled")
                 self.progress_bar['value'] = 0
+                self.status_text.set("")
 
-    def run_reconciliation(self):
-        try:
-            self.thread_queue.put(("progress", (10, "Processando nosso relatório...")))
-            df_nosso = nosso_relatorio_parser.processar(self.nosso_path.get())
-
-            nome_fundo_selecionado = self.fundo_selecionado.get()
-            parser_modulo = self.parsers[nome_fundo_selecionado]
-            self.thread_queue.put(("progress", (30, f"Processando relatório do fundo '{nome_fundo_selecionado}'...")))
-            df_fundo = parser_modulo.processar(self.fundo_path.get())
-
-            self.thread_queue.put(("progress", (50, "Normalizando documentos...")))
-            df_nosso['Documento_Norm'] = df_nosso['Documento'].apply(normalizar_documento)
-            df_fundo['Documento_Norm'] = df_fundo['Documento'].apply(normalizar_documento)
-
-            self.thread_queue.put(("progress", (60, "Agregando valores por documento...")))
-            df_nosso_agg = df_nosso.groupby('Documento_Norm').agg(Valor_Nosso=('Valor_Nosso', 'sum'),
-                                                                  Sacado_Nosso=('Sacado_Nosso', 'first')).reset_index()
-            df_fundo_agg = df_fundo.groupby('Documento_Norm').agg(Valor_Fundo_Original=('Valor_Fundo_Original', 'sum'),
-                                                                  Valor_Fundo_Pago=('Valor_Fundo_Pago', 'sum'),
-                                                                  Sacado_Fundo=('Sacado_Fundo', 'first')).reset_index()
-            df_fundo_agg['Juros/Taxas (Fundo)'] = df_fundo_agg['Valor_Fundo_Pago'] - df_fundo_agg[
-                'Valor_Fundo_Original']
-
-            self.thread_queue.put(("progress", (70, "Cruzando informações dos relatórios...")))
-            df_nosso_agg.rename(columns={'Documento_Norm': 'Documento'}, inplace=True)
-            df_fundo_agg.rename(columns={'Documento_Norm': 'Documento'}, inplace=True)
-            df_comparativo = pd.merge(df_nosso_agg, df_fundo_agg, on='Documento', how='outer', indicator=True)
-
-            self.thread_queue.put(("progress", (80, "Gerando planilha Excel...")))
-            pasta_saida = os.path.dirname(self.nosso_path.get())
-            self.output_path = os.path.join(pasta_saida, f"Relatorio_Conciliacao_{nome_fundo_selecionado}.xlsx")
-            gerar_relatorio_excel(df_nosso_agg, df_fundo_agg, df_comparativo, self.output_path)
-
-            self.thread_queue.put(("progress", (100, "Análise concluída com sucesso!")))
-            self.thread_queue.put(("done", None))
-        except (PermissionError, ValueError) as e:
-            self.thread_queue.put(("error", f"Erro ao processar arquivo:\n\n{e}"))
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            self.thread_queue.put(("error", f"Ocorreu um erro inesperado:\n\n{e}"))
+    def close(self):
+        self.encerrar_trabalhador()
+        if self.is_running:
+            remover_saida_parcial(self.output_path, self.inicio_execucao)
+        self.root.destroy()
 
     def open_report(self):
         if self.output_path and os.path.exists(self.output_path):
@@ -237,15 +411,19 @@ if __name__ == "__main__":
     if not os.path.isdir("parsers"):
         os.makedirs("parsers")
 
-    available_parsers = carregar_parsers_fundos()
+    # Só lista os nomes dos fundos: nenhum parser é importado aqui
+    available_parsers = parsers_fundos()
 
     app_root = tk.Tk()
     if not available_parsers:
         messagebox.showwarning("Nenhum Parser Encontrado",
-                               "Nenhum arquivo de parser de fundo foi encontrado na pasta 'parsers'.\n\n"
-                               "Crie arquivos .py para cada fundo dentro da pasta 'parsers' para continuar.",
+                               "Nenhum parser de fundo foi encontrado na pasta 'parsers'.\n\n"
+                               "Crie uma especificação .toml para cada fundo em 'parsers/fundos' (ou um "
+                               "arquivo .py em 'parsers') para continuar.",
                                parent=app_root)
         app_root.destroy()
     else:
         app = ReconciliationApp(app_root, available_parsers)
+        # Depois que a janela já foi desenhada, para o processo não disputar com o primeiro desenho
+        app_root.after(100, app.iniciar_trabalhador)
         app_root.mainloop()
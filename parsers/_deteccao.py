@@ -0,0 +1,78 @@
+# parsers/_deteccao.py
+"""
+Detecção do fundo de um relatório pelo cabeçalho.
+
+Lê só os primeiros KB do arquivo e confere, para cada fundo, se a linha de cabeçalho
+decodificada com o encoding do fundo e separada pelo delimitador dele contém todas as
+colunas que o parser usa. Não importa o pandas.
+
+A assinatura de um fundo vem da especificação .toml; um parser em Python pode declarar
+a sua em `ASSINATURA = {'encoding': ..., 'delimitador': ..., 'pular_linhas': ..., 'colunas': [...]}`.
+"""
+import csv
+import tomllib
+
+from parsers._registro import listar_fundos, carregar_parser
+
+TAMANHO_AMOSTRA = 16 * 1024
+
+
+def assinatura(caminho_parser):
+    """
+    Assinatura do cabeçalho esperado pelo parser em `caminho_parser`, ou None se não houver.
+    """
+    if caminho_parser.endswith('.toml'):
+        try:
+            with open(caminho_parser, 'rb') as f:
+                spec = tomllib.load(f)
+        except (OSError, tomllib.TOMLDecodeError):
+            return None
+        return {'encoding': spec.get('encoding', 'latin-1'), 'delimitador': spec.get('delimitador', ';'),
+                'pular_linhas': spec.get('pular_linhas', 0), 'colunas': list(spec.get('colunas', {}).values())}
+    try:
+        return getattr(carregar_parser(caminho_parser), 'ASSINATURA', None)
+    except ImportError:
+        return None
+
+
+def _cabecalho(linhas, encoding, delimitador, pular_linhas):
+    if len(linhas) <= pular_linhas:
+        return None
+    try:
+        texto = linhas[pular_linhas].decode(encoding)
+    except (UnicodeDecodeError, LookupError):
+        return None
+    return {coluna.strip() for coluna in next(csv.reader([texto], delimiter=delimitador), [])}
+
+
+def detectar_fundo(caminho_arquivo, fundos=None):
+    """
+    Retorna o nome do fundo cujo cabeçalho corresponde ao arquivo, ou None se nenhum
+    (ou mais de um, com a mesma quantidade de colunas) corresponder.
+    `fundos` é o {nome: caminho do parser} de `listar_fundos()`.
+    """
+    fundos = listar_fundos() if fundos is None else fundos
+    with open(caminho_arquivo, 'rb') as f:
+        amostra = f.read(TAMANHO_AMOSTRA)
+    # A última linha da amostra pode estar cortada no meio
+    linhas = amostra.splitlines()[:-1] if len(amostra) == TAMANHO_AMOSTRA else amostra.splitlines()
+    if amostra.startswith(b'\xef\xbb\xbf') and linhas:
+        linhas[0] = linhas[0][3:]
+
+    candidatos = []
+    for nome, caminho_parser in fundos.items():
+        esperado = assinatura(caminho_parser)
+        if not esperado or not esperado.get('colunas'):
+            continue
+        cabecalho = _cabecalho(linhas, esperado.get('encoding', 'latin-1'), esperado.get('delimitador', ';'),
+                               esperado.get('pular_linhas', 0))
+        if cabecalho and set(esperado['colunas']) <= cabecalho:
+            candidatos.append((len(esperado['colunas']), nome))
+
+    if not candidatos:
+        return None
+    candidatos.sort(reverse=True)
+    # Empate: o cabeçalho não distingue os fundos
+    if len(candidatos) > 1 and candidatos[0][0] == candidatos[1][0]:
+        return None
+    return candidatos[0][1]
@@ -0,0 +1,109 @@
+# parsers/_ingestao.py
+"""
+Motor único de leitura dos relatórios de fundos descritos por especificações TOML
+(pasta parsers/fundos). Cada especificação define o formato do arquivo e de onde vêm
+as quatro colunas padronizadas; só essas colunas são lidas do CSV (usecols), e o
+documento e o sacado já chegam como texto (dtype).
+
+Chaves aceitas na especificação:
+    encoding, delimitador     formato do CSV (padrão: latin-1 e ';')
+    pular_linhas              linhas antes do cabeçalho (ex: título do relatório)
+    decimal, milhar           separadores numéricos; quando informados, os valores já
+                              chegam como número da leitura
+    [colunas]                 coluna padronizada -> nome da coluna no arquivo
+    [documento]
+      remover_prefixo         texto removido do documento (ex: "DUP - ")
+      descartar               documentos que marcam linhas de resumo (ex: ["0,00"])
+      descartar_vazios        remove as linhas sem documento
+"""
+import os
+import hashlib
+import tomllib
+
+import pandas as pd
+from utils import limpar_centavos, combinar_blocos, ler_blocos, BLOCO_LEITURA, TIPO_TEXTO
+
+# Incrementar sempre que a saída do motor mudar (a versão de cada parser também
+# inclui o hash da especificação, então editar um .toml já invalida o cache)
+VERSAO_MOTOR = 4
+COLUNAS = ['Documento', 'Sacado_Fundo', 'Valor_Fundo_Original', 'Valor_Fundo_Pago']
+
+
+class ParserDeclarativo:
+    """
+    Parser de fundo montado a partir de uma especificação. Expõe a mesma interface
+    dos módulos de parser: processar, processar_em_blocos, VERSAO, LINHAS_CABECALHO e COLUNAS.
+    """
+
+    def __init__(self, caminho_spec):
+        with open(caminho_spec, 'rb') as f:
+            conteudo = f.read()
+        try:
+            spec = tomllib.loads(conteudo.decode('utf-8'))
+        except (UnicodeDecodeError, tomllib.TOMLDecodeError) as e:
+            raise ValueError(f"Especificação inválida '{caminho_spec}': {e}")
+
+        faltando = [c for c in COLUNAS if c not in spec.get('colunas', {})]
+        if faltando:
+            raise ValueError(f"Especificação '{caminho_spec}' sem as colunas: {', '.join(faltando)}.")
+
+        self.__name__ = f"parsers.fundos.{os.path.splitext(os.path.basename(caminho_spec))[0]}"
+        self.VERSAO = f"{VERSAO_MOTOR}-{hashlib.blake2b(conteudo, digest_size=6).hexdigest()}"
+        self.COLUNAS = COLUNAS
+        self.spec = spec
+        self.pular_linhas = spec.get('pular_linhas', 0)
+        # Linhas antes dos dados: as puladas + a dos nomes das colunas
+        self.LINHAS_CABECALHO = self.pular_linhas + 1
+        self.mapa = {spec['colunas'][c]: c for c in COLUNAS}
+        self.documento = spec.get('documento', {})
+
+    def _ler(self, caminho_arquivo, chunksize=None):
+        opcoes = {}
+        if 'decimal' in self.spec:
+            opcoes['decimal'] = self.spec['decimal']
+        if 'milhar' in self.spec:
+            opcoes['thousands'] = self.spec['milhar']
+        colunas = self.spec['colunas']
+        texto = {colunas['Documento']: TIPO_TEXTO, colunas['Sacado_Fundo']: TIPO_TEXTO}
+        return pd.read_csv(caminho_arquivo, encoding=self.spec.get('encoding', 'latin-1'),
+                           delimiter=self.spec.get('delimitador', ';'), skiprows=self.pular_linhas or None,
+                           usecols=list(self.mapa), dtype=texto, chunksize=chunksize, **opcoes)
+
+    def _normalizar(self, df):
+        df = df.rename(columns=self.mapa)[COLUNAS]
+
+        # Linhas de resumo e linhas sem documento
+        if self.documento.get('descartar'):
+            df = df[~df['Documento'].str.strip().isin(self.documento['descartar'])]
+        if self.documento.get('descartar_vazios'):
+            df = df.dropna(subset=['Documento'])
+
+        if self.documento.get('remover_prefixo'):
+            df['Documento'] = df['Documento'].str.replace(self.documento['remover_prefixo'], '', regex=False)
+        df['Documento'] = df['Documento'].astype(TIPO_TEXTO).str.strip()
+
+        # Limpa os valores monetários, convertendo-os para centavos inteiros
+        df['Valor_Fundo_Original'] = limpar_centavos(df['Valor_Fundo_Original'])
+        df['Valor_Fundo_Pago'] = limpar_centavos(df['Valor_Fundo_Pago'])
+        return df
+
+    def processar_em_blocos(self, caminho_arquivo, chunksize):
+        """
+        Lê o relatório em partes de `chunksize` linhas, devolvendo cada parte já com as colunas padronizadas.
+        """
+        for bloco in ler_blocos(self._ler, caminho_arquivo, chunksize):
+            yield self._normalizar(bloco)
+
+    def processar(self, caminho_arquivo, chunksize=None):
+        """
+        Lê e processa o relatório do fundo. Retorna um DataFrame com as colunas padronizadas.
+        Com `chunksize`, lê o arquivo em partes e devolve os valores já pré-agregados por documento.
+        """
+        if chunksize:
+            df = combinar_blocos(self.processar_em_blocos(caminho_arquivo, chunksize), COLUNAS)
+        else:
+            # Mesmo resultado da leitura de uma vez, sem as colunas intermediárias do arquivo inteiro
+            df = pd.concat(list(self.processar_em_blocos(caminho_arquivo, BLOCO_LEITURA)))
+        # Poucos sacados distintos repetidos em muitas linhas: categórica
+        df['Sacado_Fundo'] = df['Sacado_Fundo'].astype('category')
+        return df
@@ -0,0 +1,80 @@
+# parsers/_registro.py
+"""
+Registro dos parsers de fundos.
+
+Um fundo pode ter um módulo Python (parsers/<fundo>_parser.py, com `processar`) ou uma
+especificação declarativa (parsers/fundos/<fundo>.toml, lida por parsers/_ingestao.py).
+Listar os fundos só lê nomes de arquivos: nada é importado (nem o pandas) até que um
+parser seja usado de fato.
+"""
+import os
+import importlib
+
+PASTA_PARSERS = os.path.dirname(os.path.abspath(__file__))
+PASTA_ESPECIFICACOES = os.path.join(PASTA_PARSERS, 'fundos')
+
+_carregados = {}
+
+
+def listar_fundos():
+    """
+    Retorna {nome do fundo: caminho do .py ou do .toml}. Se um fundo tiver os dois,
+    o módulo Python tem prioridade.
+    """
+    fundos = {}
+    if os.path.isdir(PASTA_ESPECIFICACOES):
+        for arquivo in sorted(os.listdir(PASTA_ESPECIFICACOES)):
+            if arquivo.endswith('.toml') and not arquivo.startswith('_'):
+                fundos[arquivo[:-5].capitalize()] = os.path.join(PASTA_ESPECIFICACOES, arquivo)
+
+    for arquivo in sorted(os.listdir(PASTA_PARSERS)):
+        if arquivo.endswith('.py') and not arquivo.startswith('_') and 'nosso' not in arquivo:
+            fundos[arquivo[:-3].replace("_parser", "").capitalize()] = os.path.join(PASTA_PARSERS, arquivo)
+    return fundos
+
+
+def carregar_parser(caminho):
+    """
+    Importa o módulo ou monta o parser declarativo de `caminho` (uma vez por processo).
+    """
+    if caminho not in _carregados:
+        if caminho.endswith('.toml'):
+            from parsers._ingestao import ParserDeclarativo
+            parser = ParserDeclarativo(caminho)
+        else:
+            nome_modulo = os.path.splitext(os.path.basename(caminho))[0]
+            parser = importlib.import_module(f"parsers.{nome_modulo}")
+            if not hasattr(parser, 'processar'):
+                raise ImportError(f"O módulo 'parsers.{nome_modulo}' não tem a função 'processar'.")
+        _carregados[caminho] = parser
+    return _carregados[caminho]
+
+
+class ParserPreguicoso:
+    """
+    Representa o parser de um fundo sem carregá-lo: o módulo ou a especificação só
+    é carregado no primeiro acesso a um atributo (processar, VERSAO, __name__...).
+    """
+
+    def __init__(self, nome_fundo, caminho):
+        self.nome_fundo = nome_fundo
+        self.caminho = caminho
+
+    def carregar(self):
+        return carregar_parser(self.caminho)
+
+    def __getattr__(self, atributo):
+        # Atributos especiais (pickle, copy...) não são repassados, exceto o nome
+        if atributo.startswith('_') and atributo != '__name__':
+            raise AttributeError(atributo)
+        return getattr(self.carregar(), atributo)
+
+    def __repr__(self):
+        return f"<parser do fundo {self.nome_fundo}: {os.path.basename(self.caminho)}>"
+
+
+def parsers_fundos():
+    """
+    Retorna {nome do fundo: ParserPreguicoso}.
+    """
+    return {nome: ParserPreguicoso(nome, caminho) for nome, caminho in listar_fundos().items()}
@@ -1,66 +1,159 @@
-# parsers/nosso_relatorio_parser.py
 import pandas as pd
-import re
-from utils import limpar_valor
+from utils import limpar_centavos, combinar_blocos, ler_blocos, BLOCO_LEITURA, TIPO_TEXTO
 
+# Incrementar sempre que a saída do parser mudar (invalida o cache)
+VERSAO = 3
+# Linhas de cabeçalho no início do arquivo (o relatório é lido sem cabeçalho)
+LINHAS_CABECALHO = 0
+COLUNAS = ['Documento', 'Sacado_Nosso', 'Valor_Nosso']
+MENSAGEM_SEM_DADOS = ("Nenhum dado de transação válido foi encontrado no arquivo CSV. "
+                      "Verifique se o formato corresponde ao esperado.")
 
-def processar(caminho_arquivo):
+# Padrões do campo de histórico, na ordem de prioridade em que são testados.
+# Cada entrada: (tipo, regex, sacado fixo, prefixo da chave sintética).
+# - Padrões sem sacado fixo capturam documento e sacado (grupos 1 e 2).
+# - Padrões com sacado fixo e sem prefixo capturam apenas o documento (grupo 1).
+# - Padrões com prefixo não têm documento: a chave é '{prefixo}{índice da linha}'.
+PADROES_HISTORICO = [
+    ('recebimento', r'Recebimento cfe Dpl\s+(.*?)\s+-\s+(.*)', None, None),
+    ('recebimento', r'Recebimento cfe Dpl\s+([\w\d\/-]+)-(.*)', None, None),
+    ('recebimento', r'Recebimento cfe Dpl\s+([\w\d\/-]+(?:-[\w\d]+)?)\s+([A-Za-z].*)', None, None),
+    ('pagamento', r'Pagamento cfe dpl\.\s+(.*?)-DIAMANTE.*', 'N/A (Pagamento)', None),
+    ('reembolso', r'Reembolso Duplicata\s+([\w\d\/-]+)', 'N/A (Reembolso)', None),
+    ('reembolso', r'^Reembolso Duplicata$', 'N/A (Reembolso sem doc)', 'REEMBOLSO_SEM_DOC_'),
+    ('desconto', r'^DESCONTO DUPL CFE BORDERO$', 'N/A (Desconto Bordero)', 'DESCONTO_BORDERO_'),
+]
+# Prefixos das chaves sintéticas (lançamentos sem documento)
+PREFIXOS_SINTETICOS = tuple(prefixo for *_, prefixo in PADROES_HISTORICO if prefixo)
+
+# Alternância dos trechos fixos de todos os padrões, usada para descartar de uma vez as
+# linhas que não têm nenhuma chance de corresponder (tarifas, saldos, cabeçalhos...).
+_REGEX_CANDIDATOS = r'Recebimento cfe Dpl|Pagamento cfe dpl\.|Reembolso Duplicata|DESCONTO DUPL CFE BORDERO'
+
+
+def _classificar(historico):
     """
-    Lê e processa o nosso relatório a partir de um CSV, lendo o histórico
-    da coluna B e o valor sempre da coluna C.
+    Aplica os padrões de histórico em bloco, respeitando a ordem de prioridade.
+    Retorna um DataFrame (mesmo índice de `historico`) com as colunas 'Tipo',
+    'Documento' e 'Sacado_Nosso' para as linhas reconhecidas.
     """
-    # Lê o CSV sem cabeçalho e atribui nomes genéricos às colunas
-    df = pd.read_csv(caminho_arquivo, header=None, encoding='latin-1', delimiter=';', on_bad_lines='warn',
-                     engine='python')
+    pendentes = historico[historico.str.contains(_REGEX_CANDIDATOS, regex=True)]
+    partes = []
+
+    for tipo, regex, sacado_fixo, prefixo in PADROES_HISTORICO:
+        if pendentes.empty:
+            break
+
+        if prefixo is not None:
+            casou = pendentes.str.contains(regex, regex=True)
+            indice = pendentes.index[casou.to_numpy()]
+            encontrados = pd.DataFrame({
+                'Documento': prefixo + indice.astype(str),
+                'Sacado_Nosso': sacado_fixo,
+            }, index=indice)
+        else:
+            extraido = pendentes.str.extract(regex, expand=True)
+            casou = extraido[0].notna()
+            extraido = extraido[casou]
+            encontrados = pd.DataFrame({
+                'Documento': extraido[0].str.strip(),
+                'Sacado_Nosso': extraido[1].str.strip() if sacado_fixo is None else sacado_fixo,
+            }, index=extraido.index)
+
+        encontrados['Tipo'] = tipo
+        partes.append(encontrados)
+        # Uma linha é classificada pelo primeiro padrão que casar, mesmo que o documento
+        # extraído seja vazio (nesse caso ela é descartada mais adiante, como antes).
+        pendentes = pendentes[~casou.to_numpy()]
+
+    if not partes:
+        return pd.DataFrame(columns=['Tipo', 'Documento', 'Sacado_Nosso'])
+    return pd.concat(partes).sort_index()[['Tipo', 'Documento', 'Sacado_Nosso']]
+
+
+def _ler(caminho_arquivo, chunksize=None):
+    # Lê o CSV sem cabeçalho; tudo como texto, pois o histórico e o valor são tratados depois
+    return pd.read_csv(caminho_arquivo, header=None, encoding='latin-1', delimiter=';', on_bad_lines='warn',
+                       dtype=TIPO_TEXTO, chunksize=chunksize)
+
+
+def _extrair(df, indice_inicial=0):
+    """
+    Extrai documento, sacado e valor das linhas de um bloco do relatório.
+    O índice do bloco (deslocado por `indice_inicial`) é mantido, pois compõe as chaves sintéticas.
+    """
+    if indice_inicial:
+        df.index = df.index + indice_inicial
     df.columns = [f'col_{i}' for i in range(df.shape[1])]
+    if 'col_1' not in df.columns or 'col_2' not in df.columns:
+        return pd.DataFrame(columns=COLUNAS)
+
+    # O histórico está na segunda coluna (índice 1 -> Coluna B)
+    historico = df['col_1'].fillna('').astype(TIPO_TEXTO).str.strip()
 
-    dados_extraidos = []
-    # Expressões regulares para extrair dados do campo de histórico
-    regex_recebimento_padrao = re.compile(r'Recebimento cfe Dpl\s+(.*?)\s+-\s+(.*)')
-    regex_recebimento_alt = re.compile(r'Recebimento cfe Dpl\s+([\w\d\/-]+)-(.*)')
-    regex_recebimento_space = re.compile(r'Recebimento cfe Dpl\s+([\w\d\/-]+(?:-[\w\d]+)?)\s+([A-Za-z].*)')
-    regex_reembolso_com_doc = re.compile(r'Reembolso Duplicata\s+([\w\d\/-]+)')
-    regex_reembolso_sem_doc = re.compile(r'^Reembolso Duplicata$')
-    regex_desconto = re.compile(r'^DESCONTO DUPL CFE BORDERO$')
-    regex_pagamento = re.compile(r'Pagamento cfe dpl\.\s+(.*?)-DIAMANTE.*')
-
-    # Itera sobre todas as linhas do dataframe
-    for index, row in df.iterrows():
-        # O histórico está na segunda coluna (índice 1 -> Coluna B)
-        historico = str(row.get('col_1', '')).strip()
-
-        # Pula a linha se for um cabeçalho ou linha de resumo
-        if not historico or "Histórico" in historico or "Saldo Anterior" in historico or "Conta:" in historico:
-            continue
-
-        # O valor está sempre na terceira coluna (índice 2 -> Coluna C)
-        valor_str = str(row.get('col_2', '0'))
-
-        documento, sacado = None, None
-
-        match = (regex_recebimento_padrao.search(historico) or
-                 regex_recebimento_alt.search(historico) or
-                 regex_recebimento_space.search(historico))
-
-        if match:
-            documento, sacado = match.group(1).strip(), match.group(2).strip()
-        elif (match := regex_pagamento.search(historico)):
-            documento, sacado = match.group(1).strip(), "N/A (Pagamento)"
-        elif (match := regex_reembolso_com_doc.search(historico)):
-            documento, sacado = match.group(1).strip(), "N/A (Reembolso)"
-        elif regex_reembolso_sem_doc.search(historico):
-            documento, sacado = f"REEMBOLSO_SEM_DOC_{index}", "N/A (Reembolso sem doc)"
-        elif regex_desconto.search(historico):
-            documento, sacado = f"DESCONTO_BORDERO_{index}", "N/A (Desconto Bordero)"
+    # Descarta linhas vazias, de cabeçalho ou de resumo
+    resumo = (historico.str.contains('Histórico', regex=False) |
+              historico.str.contains('Saldo Anterior', regex=False) |
+              historico.str.contains('Conta:', regex=False))
+    historico = historico[(historico != '') & ~resumo]
+
+    extraidos = _classificar(historico)
+
+    # O valor está sempre na terceira coluna (índice 2 -> Coluna C)
+    extraidos['Valor_Nosso'] = limpar_centavos(df.loc[extraidos.index, 'col_2'].astype(TIPO_TEXTO))
+
+    validos = (extraidos['Documento'] != '') & (extraidos['Valor_Nosso'] > 0)
+    return extraidos.loc[validos, COLUNAS]
+
+
+def processar_em_blocos(caminho_arquivo, chunksize, indice_inicial=0):
+    """
+    Lê o nosso relatório em partes de `chunksize` linhas, devolvendo as
+    transações extraídas de cada parte.
+    """
+    for bloco in ler_blocos(_ler, caminho_arquivo, chunksize):
+        yield _extrair(bloco, indice_inicial)
+
+
+def processar_trecho(origem, chunksize=None, indice_inicial=0):
+    """
+    Como `processar`, mas para um trecho do relatório que pode não ter nenhuma transação
+    (leitura incremental). Retorna (transações, linhas de dados lidas): são as linhas que
+    o read_csv devolve, sem as linhas em branco, e são elas que numeram as chaves
+    sintéticas. O trecho seguinte continua com `indice_inicial` somado a esse total.
+    """
+    lidas = 0
+
+    def extrair_blocos():
+        nonlocal lidas
+        for bloco in ler_blocos(_ler, origem, chunksize or BLOCO_LEITURA):
+            lidas += len(bloco)
+            yield _extrair(bloco, indice_inicial)
+
+    try:
+        if chunksize:
+            extraidos = combinar_blocos(extrair_blocos(), COLUNAS)
         else:
-            # Se a linha não corresponder a um padrão conhecido, ignora-a.
-            continue
+            # Mesmo resultado da leitura de uma vez, sem as colunas intermediárias do arquivo inteiro
+            extraidos = pd.concat(list(extrair_blocos()))
+    except pd.errors.EmptyDataError:
+        # Trecho vazio ou só com linhas em branco
+        extraidos = pd.DataFrame(columns=COLUNAS)
 
-        if documento and (valor := limpar_valor(valor_str)) is not None and valor > 0:
-            dados_extraidos.append({'Documento': documento, 'Sacado_Nosso': sacado, 'Valor_Nosso': valor})
+    # Poucos sacados distintos repetidos em muitas linhas: categórica
+    extraidos['Sacado_Nosso'] = extraidos['Sacado_Nosso'].astype('category')
+    return extraidos.reset_index(drop=True), lidas
 
-    if not dados_extraidos:
-        raise ValueError(
-            "Nenhum dado de transação válido foi encontrado no arquivo CSV. Verifique se o formato corresponde ao esperado.")
 
-    return pd.DataFrame(dados_extraidos)
+def processar(caminho_arquivo, chunksize=None, indice_inicial=0):
+    """
+    Lê e processa o nosso relatório a partir de um CSV, lendo o histórico
+    da coluna B e o valor sempre da coluna C.
+    Com `chunksize`, lê o arquivo em partes e devolve os valores já pré-agregados por documento.
+    `indice_inicial` desloca a numeração das linhas usada nas chaves sintéticas (leitura
+    de um trecho que não começa no início do arquivo).
+    """
+    extraidos, _ = processar_trecho(caminho_arquivo, chunksize, indice_inicial)
+    if extraidos.empty:
+        raise ValueError(MENSAGEM_SEM_DADOS)
+    return extraidos
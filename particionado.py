@@ -0,0 +1,154 @@
+# particionado.py
+"""
+Reconciliação fora da memória, para relatórios maiores que a RAM.
+
+Cada lado é lido em blocos, normalizado e gravado em disco dividido em N partições
+pelo hash do documento normalizado: o mesmo documento cai sempre na mesma partição,
+nos dois lados. Depois, cada partição é agregada e cruzada sozinha (opcionalmente em
+paralelo) e os resultados são concatenados e ordenados por documento, chegando ao
+mesmo comparativo (e aos mesmos totais) da reconciliação em memória. O pico de
+memória fica em um bloco na leitura e em uma partição no cruzamento, mais o
+resultado final.
+
+O cache de relatórios não é usado aqui: ele guarda o relatório inteiro já lido.
+"""
+import os
+import glob
+import tempfile
+from itertools import repeat
+
+import pandas as pd
+from utils import BLOCO_LEITURA
+from instrumentacao import Perfilador, informar_progresso
+from reconciliacao import (normalizar, agregar_nosso, agregar_fundo, cruzar, expandir_caminhos, rotulos_arquivos,
+                           rotular_sinteticos, mapear_em_processos)
+from parsers import nosso_relatorio_parser
+
+PARTICOES_PADRAO = 16
+
+
+def _blocos(parser_modulo, caminho_arquivo):
+    # Parsers próprios (.py) sem leitura em blocos são lidos de uma vez
+    if hasattr(parser_modulo, 'processar_em_blocos'):
+        return parser_modulo.processar_em_blocos(caminho_arquivo, BLOCO_LEITURA)
+    return [parser_modulo.processar(caminho_arquivo)]
+
+
+def particionar(parser_modulo, caminhos, pasta, particoes=PARTICOES_PADRAO):
+    """
+    Lê o relatório (um ou mais arquivos) em blocos, normaliza os documentos e grava cada
+    bloco em `pasta`, dividido em `particoes` arquivos pelo hash de 'Documento_Norm'.
+    Retorna o número de linhas gravadas.
+    """
+    os.makedirs(pasta, exist_ok=True)
+    arquivos = expandir_caminhos(caminhos)
+    rotulos = rotulos_arquivos(arquivos) if len(arquivos) > 1 else [None]
+    linhas = 0
+    numero = 0
+    for caminho_arquivo, rotulo in zip(arquivos, rotulos):
+        for bloco in _blocos(parser_modulo, caminho_arquivo):
+            bloco = normalizar(bloco)
+            if rotulo is not None:
+                rotular_sinteticos(bloco, 'Documento_Norm', rotulo)
+            if numero == 0:
+                # Colunas e tipos para as partições que ficarem sem nenhuma linha
+                bloco.iloc[:0].to_pickle(os.path.join(pasta, 'modelo.pkl'))
+
+            particao = pd.util.hash_pandas_object(bloco['Documento_Norm'], index=False).to_numpy() % particoes
+            for numero_particao, parte in bloco.groupby(particao, sort=False):
+                parte.to_pickle(os.path.join(pasta, f"{numero_particao:04d}_{numero:05d}.pkl"))
+            linhas += len(bloco)
+            numero += 1
+    return linhas
+
+
+def particionar_nosso(caminhos, pasta, particoes=PARTICOES_PADRAO):
+    """
+    `particionar` para o nosso relatório, com o mesmo erro do parser quando não há
+    nenhuma transação válida.
+    """
+    linhas = particionar(nosso_relatorio_parser, caminhos, pasta, particoes)
+    if not linhas:
+        raise ValueError(nosso_relatorio_parser.MENSAGEM_SEM_DADOS)
+    return linhas
+
+
+def _carregar_particao(pasta, numero_particao):
+    # As partes são concatenadas na ordem de leitura: o primeiro sacado de cada documento é o mesmo
+    caminhos = sorted(glob.glob(os.path.join(pasta, f"{numero_particao:04d}_*.pkl")))
+    partes = [pd.read_pickle(caminho) for caminho in caminhos]
+    return pd.concat(partes) if partes else pd.read_pickle(os.path.join(pasta, 'modelo.pkl'))
+
+
+def _conciliar_particao(pasta_nosso, pasta_fundo, numero_particao):
+    # Só o comparativo volta: os agregados de cada lado estão contidos nele
+    return cruzar(agregar_nosso(_carregar_particao(pasta_nosso, numero_particao)),
+                  agregar_fundo(_carregar_particao(pasta_fundo, numero_particao)))
+
+
+def _colunas_agregadas(pasta, agregar):
+    return list(agregar(pd.read_pickle(os.path.join(pasta, 'modelo.pkl'))).columns)
+
+
+def _lado(df_comparativo, colunas, fora):
+    # Os documentos de um lado são os do comparativo que não estão só no outro. As colunas
+    # do lado são separadas antes de filtrar as linhas: só elas são copiadas, e nenhuma
+    # quando o lado tem todos os documentos
+    df_lado = df_comparativo[colunas]
+    presentes = (df_comparativo['_merge'] != fora).to_numpy()
+    if presentes.all():
+        return df_lado
+    return df_lado[presentes].reset_index(drop=True)
+
+
+def conciliar_particoes(pasta_nosso, pasta_fundo, particoes=PARTICOES_PADRAO, workers=None):
+    """
+    Agrega e cruza as partições dos dois lados, uma a uma (ou `workers` ao mesmo tempo).
+    Retorna (df_nosso_agg, df_fundo_agg, df_comparativo), como `reconciliacao.conciliar`.
+    """
+    resultados = []
+    if workers and workers > 1:
+        argumentos = zip(repeat(pasta_nosso), repeat(pasta_fundo), range(particoes))
+        resultados = list(mapear_em_processos(_conciliar_particao, argumentos, workers, 'partições'))
+    else:
+        for numero_particao in range(particoes):
+            resultados.append(_conciliar_particao(pasta_nosso, pasta_fundo, numero_particao))
+            informar_progresso(len(resultados) / particoes, f"{len(resultados)} de {particoes} partições")
+
+    df_comparativo = pd.concat(resultados, ignore_index=True)
+    del resultados
+    # Ordenado por documento, como o groupby e o merge da reconciliação em memória
+    df_comparativo = df_comparativo.sort_values('Documento', kind='stable', ignore_index=True)
+    # Cada partição tem as suas categorias: concatenados, os sacados voltam a ser categóricos
+    for coluna in ('Sacado_Nosso', 'Sacado_Fundo'):
+        df_comparativo[coluna] = df_comparativo[coluna].astype('category')
+
+    return (_lado(df_comparativo, _colunas_agregadas(pasta_nosso, agregar_nosso), 'right_only'),
+            _lado(df_comparativo, _colunas_agregadas(pasta_fundo, agregar_fundo), 'left_only'),
+            df_comparativo)
+
+
+def conciliar_particionado(caminho_nosso, nome_fundo, parser_fundo, caminho_fundo, particoes=PARTICOES_PADRAO,
+                           workers=None, perfilador=None, pasta_nosso=None, pasta_temporaria=None):
+    """
+    Reconciliação completa fora da memória. Se `pasta_nosso` for informada, o nosso
+    relatório já particionado (com o mesmo número de partições) é reaproveitado.
+    As partições ficam em uma pasta temporária (dentro de `pasta_temporaria`, se
+    informada), apagada no fim. Retorna (df_nosso_agg, df_fundo_agg, df_comparativo).
+    """
+    perfilador = perfilador or Perfilador()
+    with tempfile.TemporaryDirectory(prefix='recon_particoes_', dir=pasta_temporaria) as pasta:
+        if pasta_nosso is None:
+            pasta_nosso = os.path.join(pasta, 'nosso')
+            with perfilador.etapa('leitura_nosso', "Particionando nosso relatório...") as etapa:
+                etapa['linhas_saida'] = particionar_nosso(caminho_nosso, pasta_nosso, particoes)
+
+        with perfilador.etapa('leitura_fundo', f"Particionando relatório do fundo '{nome_fundo}'...") as etapa:
+            linhas_fundo = particionar(parser_fundo, caminho_fundo, os.path.join(pasta, 'fundo'), particoes)
+            etapa['linhas_saida'] = linhas_fundo
+
+        with perfilador.etapa('cruzamento', f"Cruzando as {particoes} partições...",
+                              linhas_entrada=linhas_fundo) as etapa:
+            resultado = conciliar_particoes(pasta_nosso, os.path.join(pasta, 'fundo'), particoes, workers)
+            etapa['linhas_saida'] = len(resultado[2])
+    return resultado
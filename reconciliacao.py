@@ -0,0 +1,331 @@
+# reconciliacao.py
+import os
+import glob
+import signal
+import importlib
+import threading
+import multiprocessing
+from types import ModuleType
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import pandas as pd
+from utils import normalizar_documentos
+from excel_generator import gerar_relatorio_excel
+from colunar_generator import gerar_relatorio_colunar
+from formatos import FORMATOS_SAIDA  # noqa: F401 (reexportado para a linha de comando)
+from cache import processar_com_cache
+from instrumentacao import (Perfilador, caminho_tempos, informar_progresso, verificar_cancelamento,
+                            desligar_progresso, ETAPAS_PARTICIONADO)
+from parsers import nosso_relatorio_parser
+from parsers.nosso_relatorio_parser import PREFIXOS_SINTETICOS
+from parsers._registro import parsers_fundos
+
+# Arquivos acima deste tamanho são lidos em partes, com pré-agregação por documento,
+# para que o pico de memória dependa da quantidade de documentos e não do arquivo.
+LIMITE_LEITURA_EM_BLOCOS = 256 * 1024 * 1024
+TAMANHO_BLOCO = 250_000
+# Segundos entre as consultas ao cancelamento enquanto outros processos trabalham
+INTERVALO_CANCELAMENTO = 0.2
+
+
+def tamanho_bloco_para(caminho_arquivo):
+    """
+    Retorna o chunksize a ser usado na leitura do arquivo, ou None para lê-lo de uma vez.
+    """
+    try:
+        if os.path.getsize(caminho_arquivo) > LIMITE_LEITURA_EM_BLOCOS:
+            return TAMANHO_BLOCO
+    except OSError:
+        pass
+    return None
+
+
+# --- Lógica para carregar parsers dinamicamente ---
+def carregar_parsers_fundos():
+    """
+    Encontra os parsers de fundos (módulos em 'parsers' e especificações em 'parsers/fundos').
+    Retorna um dicionário com o nome do fundo e o parser, que só é carregado no primeiro uso.
+    """
+    return parsers_fundos()
+
+
+# --- Etapas da reconciliação ---
+def normalizar(df):
+    """
+    Troca a coluna 'Documento' pela 'Documento_Norm', com o documento no formato canônico.
+    """
+    df['Documento_Norm'] = normalizar_documentos(df['Documento'])
+    del df['Documento']
+    return df
+
+
+def agregar_nosso(df_nosso):
+    """
+    Soma os valores do nosso relatório por documento normalizado.
+    """
+    df_nosso_agg = df_nosso.groupby('Documento_Norm').agg(Valor_Nosso=('Valor_Nosso', 'sum'),
+                                                          Sacado_Nosso=('Sacado_Nosso', 'first')).reset_index()
+    return df_nosso_agg.rename(columns={'Documento_Norm': 'Documento'})
+
+
+def agregar_fundo(df_fundo):
+    """
+    Soma os valores do relatório do fundo por documento normalizado.
+    """
+    df_fundo_agg = df_fundo.groupby('Documento_Norm').agg(Valor_Fundo_Original=('Valor_Fundo_Original', 'sum'),
+                                                          Valor_Fundo_Pago=('Valor_Fundo_Pago', 'sum'),
+                                                          Sacado_Fundo=('Sacado_Fundo', 'first')).reset_index()
+    df_fundo_agg['Juros/Taxas (Fundo)'] = df_fundo_agg['Valor_Fundo_Pago'] - df_fundo_agg['Valor_Fundo_Original']
+    return df_fundo_agg.rename(columns={'Documento_Norm': 'Documento'})
+
+
+def cruzar(df_nosso_agg, df_fundo_agg):
+    """
+    Cruza os dois lados agregados. A coluna '_merge' indica onde cada documento foi
+    encontrado: 'both', 'left_only' (só no nosso) ou 'right_only' (só no fundo).
+    """
+    return pd.merge(df_nosso_agg, df_fundo_agg, on='Documento', how='outer', indicator=True)
+
+
+def conciliar(df_nosso, df_fundo):
+    """
+    Executa todas as etapas sobre os DataFrames já lidos pelos parsers.
+    Retorna (df_nosso_agg, df_fundo_agg, df_comparativo).
+    """
+    df_nosso_agg = agregar_nosso(normalizar(df_nosso))
+    df_fundo_agg = agregar_fundo(normalizar(df_fundo))
+    return df_nosso_agg, df_fundo_agg, cruzar(df_nosso_agg, df_fundo_agg)
+
+
+# --- Saída ---
+def caminho_relatorio(pasta_saida, nome_fundo, formato='xlsx'):
+    """
+    Caminho do relatório de um fundo: a planilha .xlsx ou a pasta dos arquivos colunares.
+    """
+    caminho = os.path.join(pasta_saida, f"Relatorio_Conciliacao_{nome_fundo}")
+    return caminho + '.xlsx' if formato == 'xlsx' else caminho
+
+
+def gerar_relatorio(df_nosso_agg, df_fundo_agg, df_comparativo, caminho_saida, formato='xlsx'):
+    """
+    Gera o relatório no formato escolhido (ver FORMATOS_SAIDA).
+    """
+    if formato == 'xlsx':
+        gerar_relatorio_excel(df_nosso_agg, df_fundo_agg, df_comparativo, caminho_saida)
+    else:
+        gerar_relatorio_colunar(df_nosso_agg, df_fundo_agg, df_comparativo, caminho_saida, formato)
+
+
+# --- Execução completa ---
+def ler_relatorio(parser_modulo, caminho_arquivo, usar_cache=True):
+    """
+    Lê o arquivo com o parser, passando pelo cache e escolhendo a leitura em partes pelo tamanho.
+    """
+    if usar_cache:
+        return processar_com_cache(parser_modulo, caminho_arquivo, chunksize=tamanho_bloco_para(caminho_arquivo))
+    return parser_modulo.processar(caminho_arquivo, chunksize=tamanho_bloco_para(caminho_arquivo))
+
+
+def expandir_caminhos(caminhos):
+    """
+    Aceita um caminho, um padrão glob (ex: 'extratos/*.csv') ou uma lista deles e retorna
+    a lista de arquivos, na ordem informada e sem repetições (cada padrão em ordem alfabética).
+    """
+    if isinstance(caminhos, (str, os.PathLike)):
+        caminhos = [caminhos]
+    arquivos = []
+    for caminho in map(os.fspath, caminhos):
+        encontrados = [caminho] if os.path.exists(caminho) or not glob.has_magic(caminho) \
+            else sorted(glob.glob(caminho))
+        if not encontrados:
+            raise ValueError(f"Nenhum arquivo corresponde a '{caminho}'.")
+        arquivos.extend(a for a in encontrados if a not in arquivos)
+    if not arquivos:
+        raise ValueError("Nenhum arquivo informado.")
+    return arquivos
+
+
+def rotulos_arquivos(arquivos):
+    """
+    Rótulo de cada arquivo de um relatório em várias partes: o nome do arquivo ou,
+    se dois tiverem o mesmo nome (em pastas diferentes), o caminho.
+    """
+    nomes = [os.path.basename(a) for a in arquivos]
+    return nomes if len(set(nomes)) == len(nomes) else arquivos
+
+
+def rotular_sinteticos(df, coluna, rotulo):
+    """
+    Acrescenta o rótulo do arquivo às chaves sintéticas da `coluna`. Elas são numeradas
+    pela linha do arquivo: sem o rótulo, lançamentos diferentes de arquivos diferentes
+    virariam um só.
+    """
+    sinteticos = df[coluna].str.startswith(PREFIXOS_SINTETICOS)
+    if sinteticos.any():
+        df.loc[sinteticos, coluna] = df.loc[sinteticos, coluna] + f" ({rotulo})"
+    return df
+
+
+def _encerrar_junto_com(pai):
+    pai.join()
+    os._exit(1)
+
+
+def _iniciar_processo(pids):
+    """
+    Inicializador dos processos de `mapear_em_processos`. Desliga o progresso herdado do
+    pai e informa o pid, para que um cancelamento encerre o processo na hora. Se o pai
+    morrer (ex: o processo da interface encerrado à força depois do prazo de cancelamento),
+    o processo sai junto, em vez de ficar órfão terminando a tarefa.
+    """
+    desligar_progresso()
+    pids.put(os.getpid())
+    pai = multiprocessing.parent_process()
+    if pai is not None:
+        threading.Thread(target=_encerrar_junto_com, args=(pai,), daemon=True).start()
+
+
+def _interromper(executor, pids):
+    # Sem isso, o arquivo (ou a partição) que já estava em andamento seria processado até
+    # o fim: o shutdown só descarta as tarefas que ainda não começaram
+    executor.shutdown(wait=False, cancel_futures=True)
+    while not pids.empty():
+        try:
+            os.kill(pids.get(), signal.SIGTERM)
+        except OSError:
+            pass  # já tinha terminado
+
+
+def mapear_em_processos(funcao, argumentos, workers, unidade):
+    """
+    Executa `funcao(*args)` para cada tupla de `argumentos` em `workers` processos,
+    devolvendo os resultados na ordem. O progresso ('3 de 10 <unidade>') é informado só
+    por este processo; os de trabalho não informam nada. Se a execução for cancelada,
+    as tarefas pendentes são descartadas e os processos, encerrados.
+    """
+    pids = multiprocessing.SimpleQueue()
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_processo, initargs=(pids,))
+    try:
+        futuros = [executor.submit(funcao, *args) for args in argumentos]
+        total = len(futuros)
+        # Retirados da lista um a um, para que cada resultado seja liberado depois de usado
+        futuros.reverse()
+        while futuros:
+            futuro = futuros.pop()
+            while not wait([futuro], timeout=INTERVALO_CANCELAMENTO).done:
+                verificar_cancelamento()
+            informar_progresso((total - len(futuros)) / total, f"{total - len(futuros)} de {total} {unidade}")
+            yield futuro.result()
+    except BaseException:
+        _interromper(executor, pids)
+        raise
+    executor.shutdown()
+
+
+def _ler_e_agregar(parser, caminho_arquivo, agregar, usar_cache, rotulo):
+    # Executada nos processos de trabalho: só o agregado (um registro por documento) volta
+    if isinstance(parser, str):
+        parser = importlib.import_module(parser)
+    return rotular_sinteticos(agregar(normalizar(ler_relatorio(parser, caminho_arquivo, usar_cache))), 'Documento',
+                              rotulo)
+
+
+def ler_agregado(parser_modulo, caminhos, agregar, usar_cache=True, workers=None):
+    """
+    Lê, normaliza e agrega (com `agregar_nosso` ou `agregar_fundo`) um relatório entregue
+    em um ou mais arquivos. Com vários, cada arquivo é processado em um processo separado
+    e os agregados são somados por documento.
+    """
+    arquivos = expandir_caminhos(caminhos)
+    if len(arquivos) == 1:
+        return agregar(normalizar(ler_relatorio(parser_modulo, arquivos[0], usar_cache)))
+
+    # Módulos não são serializáveis: o processo de trabalho importa o parser pelo nome
+    parser = parser_modulo.__name__ if isinstance(parser_modulo, ModuleType) else parser_modulo
+    rotulos = rotulos_arquivos(arquivos)
+    argumentos = zip(repeat(parser), arquivos, repeat(agregar), repeat(usar_cache), rotulos)
+    partes = list(mapear_em_processos(_ler_e_agregar, argumentos,
+                                      workers or min(len(arquivos), os.cpu_count() or 1), 'arquivos lidos'))
+    return agregar(pd.concat(partes, ignore_index=True).rename(columns={'Documento': 'Documento_Norm'}))
+
+
+def ler_arquivos(parser_modulo, caminhos, agregar, usar_cache):
+    """
+    Com um arquivo só retorna (DataFrame lido, None), para normalizar e agregar nas etapas
+    seguintes; com vários, (None, agregado), pois cada arquivo já é agregado no seu processo.
+    """
+    arquivos = expandir_caminhos(caminhos)
+    if len(arquivos) == 1:
+        return ler_relatorio(parser_modulo, arquivos[0], usar_cache), None
+    return None, ler_agregado(parser_modulo, arquivos, agregar, usar_cache)
+
+
+def _conciliar_em_memoria(caminho_nosso, nome_fundo, parser_fundo, caminho_fundo, usar_cache, perfilador,
+                         df_nosso_agg):
+    """
+    Leitura, normalização, agregação e cruzamento com os relatórios inteiros na memória.
+    """
+    df_nosso = None
+
+    if df_nosso_agg is None:
+        with perfilador.etapa('leitura_nosso', "Processando nosso relatório...") as etapa:
+            df_nosso, df_nosso_agg = ler_arquivos(nosso_relatorio_parser, caminho_nosso, agregar_nosso, usar_cache)
+            etapa['linhas_saida'] = len(df_nosso if df_nosso is not None else df_nosso_agg)
+
+    with perfilador.etapa('leitura_fundo', f"Processando relatório do fundo '{nome_fundo}'...") as etapa:
+        df_fundo, df_fundo_agg = ler_arquivos(parser_fundo, caminho_fundo, agregar_fundo, usar_cache)
+        etapa['linhas_saida'] = len(df_fundo if df_fundo is not None else df_fundo_agg)
+
+    # Só o que foi lido de um arquivo único ainda precisa ser normalizado e agregado
+    lidos = [df for df in (df_nosso, df_fundo) if df is not None]
+    linhas_lidas = sum(len(df) for df in lidos)
+    with perfilador.etapa('normalizacao', "Normalizando documentos...", linhas_entrada=linhas_lidas):
+        for df in lidos:
+            normalizar(df)
+
+    with perfilador.etapa('agregacao', "Agregando valores por documento...", linhas_entrada=linhas_lidas) as etapa:
+        etapa['linhas_saida'] = 0
+        if df_nosso is not None:
+            df_nosso_agg = agregar_nosso(df_nosso)
+            etapa['linhas_saida'] += len(df_nosso_agg)
+        if df_fundo is not None:
+            df_fundo_agg = agregar_fundo(df_fundo)
+            etapa['linhas_saida'] += len(df_fundo_agg)
+    del df_nosso, df_fundo, lidos
+
+    with perfilador.etapa('cruzamento', "Cruzando informações dos relatórios...",
+                          linhas_entrada=len(df_nosso_agg) + len(df_fundo_agg)) as etapa:
+        df_comparativo = cruzar(df_nosso_agg, df_fundo_agg)
+        etapa['linhas_saida'] = len(df_comparativo)
+    return df_nosso_agg, df_fundo_agg, df_comparativo
+
+
+def executar_conciliacao(caminho_nosso, nome_fundo, parser_fundo, caminho_fundo, caminho_saida, formato='xlsx',
+                         usar_cache=True, perfilador=None, df_nosso_agg=None, particoes=None, pasta_nosso=None):
+    """
+    Executa a reconciliação de ponta a ponta, medindo cada etapa, e grava o relatório e,
+    ao lado dele, o JSON de tempos. Cada lado pode ser um arquivo, um padrão glob ou uma
+    lista de arquivos (ver `ler_agregado`). Se `df_nosso_agg` for informado, o nosso
+    relatório não é lido de novo. Com `particoes`, a reconciliação é feita fora da
+    memória (ver `particionado`), reaproveitando o nosso relatório já particionado em
+    `pasta_nosso`, se informada. Retorna (df_nosso_agg, df_fundo_agg, df_comparativo).
+    """
+    perfilador = perfilador or Perfilador()
+    if particoes:
+        # Importado aqui: o módulo particionado usa as etapas deste
+        from particionado import conciliar_particionado
+        perfilador.limitar_etapas(ETAPAS_PARTICIONADO)
+        df_nosso_agg, df_fundo_agg, df_comparativo = conciliar_particionado(
+            caminho_nosso, nome_fundo, parser_fundo, caminho_fundo, particoes, perfilador=perfilador,
+            pasta_nosso=pasta_nosso)
+    else:
+        df_nosso_agg, df_fundo_agg, df_comparativo = _conciliar_em_memoria(
+            caminho_nosso, nome_fundo, parser_fundo, caminho_fundo, usar_cache, perfilador, df_nosso_agg)
+
+    mensagem = "Gerando planilha Excel..." if formato == 'xlsx' else f"Gravando arquivos {formato.upper()}..."
+    with perfilador.etapa('relatorio', mensagem, linhas_entrada=len(df_comparativo)):
+        gerar_relatorio(df_nosso_agg, df_fundo_agg, df_comparativo, caminho_saida, formato)
+
+    perfilador.salvar_json(caminho_tempos(caminho_saida))
+    return df_nosso_agg, df_fundo_agg, df_comparativo
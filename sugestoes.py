@@ -0,0 +1,142 @@
+# sugestoes.py
+"""
+Segunda passada sobre os documentos que não casaram no cruzamento exato.
+
+Muitos 'left_only'/'right_only' são o mesmo título com a chave um pouco diferente:
+parcela ausente, dígitos trocados, parcela lançada errada. Em vez de comparar todos
+contra todos, os candidatos saem de índices de bloqueio (número principal, valor em
+centavos e prefixo do sacado): só pares que compartilham alguma chave são pontuados.
+"""
+from difflib import SequenceMatcher
+
+import pandas as pd
+from utils import TIPO_TEXTO
+
+# Blocos com mais pares do que isso são ignorados: a chave não é seletiva o bastante
+# (ex: centenas de títulos de mesmo valor) e só geraria sugestões ruins
+LIMITE_PARES_POR_BLOCO = 50
+TAMANHO_PREFIXO_SACADO = 6
+PONTUACAO_MINIMA = 60.0
+
+# Peso de cada critério na pontuação (0 a 100)
+PESOS = {'documento': 0.5, 'valor': 0.3, 'sacado': 0.2}
+
+COLUNAS_SUGESTOES = ['Documento (Nosso)', 'Sacado_Nosso', 'Valor_Nosso', 'Documento (Fundo)', 'Sacado (Fundo)',
+                     'Valor Pago (Fundo)', 'Pontuacao', 'Criterios']
+
+
+def _chaves(documentos, sacados):
+    """
+    Chaves de bloqueio comuns aos dois lados: número principal e prefixo do sacado.
+    Chaves sintéticas (sem número) e sacados fixos 'N/A (...)' ficam sem chave.
+    """
+    principal = documentos.astype(str).str.extract(r'^(\d+)', expand=False).str.lstrip('0')
+    # Os sacados chegam como categóricas: vira texto antes de preencher os vazios
+    sacado = sacados.astype(TIPO_TEXTO).fillna('').str.upper()
+    prefixo = sacado.str.replace(r'[^A-Z0-9]', '', regex=True).str[:TAMANHO_PREFIXO_SACADO]
+    prefixo = prefixo.where(~sacado.str.startswith('N/A') & (prefixo.str.len() > 0))
+    return pd.DataFrame({'principal': principal.where(principal != ''), 'sacado': prefixo})
+
+
+def _pares_por_chave(chaves_nosso, chaves_fundo):
+    """
+    Junta os dois lados por uma chave, descartando os blocos grandes demais.
+    Retorna um DataFrame com os rótulos ('i', 'j') dos pares candidatos.
+    """
+    esquerda = chaves_nosso.dropna().rename('chave').rename_axis('i').reset_index()
+    direita = chaves_fundo.dropna().rename('chave').rename_axis('j').reset_index()
+    tamanhos = esquerda['chave'].value_counts().mul(direita['chave'].value_counts(), fill_value=0)
+    aceitas = tamanhos.index[(tamanhos > 0) & (tamanhos <= LIMITE_PARES_POR_BLOCO)]
+    return esquerda[esquerda['chave'].isin(aceitas)].merge(direita, on='chave')[['i', 'j']]
+
+
+def _candidatos(nosso, fundo):
+    chaves_nosso = _chaves(nosso['Documento'], nosso['Sacado_Nosso'])
+    chaves_fundo = _chaves(fundo['Documento'], fundo['Sacado_Fundo'])
+
+    pares = [
+        _pares_por_chave(chaves_nosso['principal'], chaves_fundo['principal']),
+        _pares_por_chave(chaves_nosso['sacado'], chaves_fundo['sacado']),
+        # O nosso valor pode corresponder ao valor pago ou ao valor original do fundo
+        _pares_por_chave(nosso['Valor_Nosso'], fundo['Valor_Fundo_Pago']),
+        _pares_por_chave(nosso['Valor_Nosso'], fundo['Valor_Fundo_Original']),
+    ]
+    return pd.concat(pares, ignore_index=True).drop_duplicates(ignore_index=True)
+
+
+def _similaridade(a, b):
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def _pontuar(doc_nosso, sacado_nosso, valor_nosso, doc_fundo, sacado_fundo, valores_fundo):
+    """
+    Pontua um par candidato de 0 a 100 e descreve o que o aproxima (valores em centavos).
+    Critérios sem informação (ex: sacado 'N/A') ficam fora da média ponderada.
+    """
+    notas, criterios = {}, []
+
+    principal_nosso, _, parcela_nosso = doc_nosso.partition('/')
+    principal_fundo, _, parcela_fundo = doc_fundo.partition('/')
+    notas['documento'] = _similaridade(doc_nosso, doc_fundo)
+    if principal_nosso.lstrip('0') == principal_fundo.lstrip('0') and principal_nosso:
+        parcela_ausente = not parcela_nosso or not parcela_fundo
+        notas['documento'] = max(notas['documento'], 0.9 if parcela_ausente else 0.8)
+        criterios.append('Parcela ausente' if parcela_ausente else 'Parcela diferente')
+    elif sorted(doc_nosso) == sorted(doc_fundo):
+        notas['documento'] = max(notas['documento'], 0.8)
+        criterios.append('Dígitos transpostos')
+
+    valores_fundo = [v for v in valores_fundo if pd.notna(v)]
+    if pd.notna(valor_nosso) and valores_fundo:
+        diferenca = min(abs(valor_nosso - v) for v in valores_fundo)
+        if diferenca <= 1:
+            notas['valor'] = 1.0
+            criterios.append('Mesmo valor')
+        else:
+            escala = max(abs(valor_nosso), *(abs(v) for v in valores_fundo))
+            notas['valor'] = max(0.0, 1 - diferenca / escala) if escala else 0.0
+
+    if not str(sacado_nosso).startswith('N/A') and pd.notna(sacado_fundo):
+        notas['sacado'] = _similaridade(str(sacado_nosso).upper(), str(sacado_fundo).upper())
+        if notas['sacado'] >= 0.8:
+            criterios.append('Sacado semelhante')
+
+    peso_total = sum(PESOS[c] for c in notas)
+    pontuacao = 100 * sum(PESOS[c] * nota for c, nota in notas.items()) / peso_total
+    return round(pontuacao, 1), ', '.join(criterios)
+
+
+def sugerir_correspondencias(df_comparativo, pontuacao_minima=PONTUACAO_MINIMA):
+    """
+    Sugere correspondências entre os documentos só do nosso lado e só do lado do fundo.
+    Cada documento aparece em no máximo uma sugestão (as de maior pontuação primeiro).
+    Retorna um DataFrame com as colunas COLUNAS_SUGESTOES, da maior para a menor pontuação.
+    """
+    nosso = df_comparativo[df_comparativo['_merge'] == 'left_only'].reset_index(drop=True)
+    fundo = df_comparativo[df_comparativo['_merge'] == 'right_only'].reset_index(drop=True)
+    if nosso.empty or fundo.empty:
+        return pd.DataFrame(columns=COLUNAS_SUGESTOES)
+
+    # Listas por posição: bem mais rápidas que .loc dentro do laço
+    a = {c: nosso[c].tolist() for c in ('Documento', 'Sacado_Nosso', 'Valor_Nosso')}
+    b = {c: fundo[c].tolist() for c in ('Documento', 'Sacado_Fundo', 'Valor_Fundo_Pago', 'Valor_Fundo_Original')}
+
+    avaliados = []
+    for i, j in _candidatos(nosso, fundo).itertuples(index=False, name=None):
+        pontuacao, criterios = _pontuar(str(a['Documento'][i]), a['Sacado_Nosso'][i], a['Valor_Nosso'][i],
+                                        str(b['Documento'][j]), b['Sacado_Fundo'][j],
+                                        (b['Valor_Fundo_Pago'][j], b['Valor_Fundo_Original'][j]))
+        if pontuacao >= pontuacao_minima:
+            avaliados.append((pontuacao, i, j, criterios))
+
+    # Emparelhamento guloso: cada documento fica com a melhor sugestão ainda disponível
+    usados_nosso, usados_fundo, linhas = set(), set(), []
+    for pontuacao, i, j, criterios in sorted(avaliados, key=lambda p: -p[0]):
+        if i in usados_nosso or j in usados_fundo:
+            continue
+        usados_nosso.add(i)
+        usados_fundo.add(j)
+        linhas.append([a['Documento'][i], a['Sacado_Nosso'][i], a['Valor_Nosso'][i], b['Documento'][j],
+                       b['Sacado_Fundo'][j], b['Valor_Fundo_Pago'][j], pontuacao, criterios])
+
+    return pd.DataFrame(linhas, columns=COLUNAS_SUGESTOES)
@@ -0,0 +1,20 @@
+# tests/test_cache.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from cache import salvar_df, carregar_df, EXTENSAO
+
+
+def test_salvar_df_com_gravacoes_simultaneas(tmp_path):
+    # Vários processos que perdem o cache da mesma chave gravam o mesmo arquivo ao mesmo tempo
+    caminho = str(tmp_path / ('entrada' + EXTENSAO))
+    df = pd.DataFrame({'Documento': [f'{i}/001' for i in range(2000)], 'Valor_Nosso': range(2000)})
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: salvar_df(df, caminho), range(64)))
+
+    assert_frame_equal(carregar_df(caminho), df)
+    assert os.listdir(tmp_path) == [os.path.basename(caminho)]
@@ -0,0 +1,30 @@
+# tests/test_cli.py
+import pytest
+
+from cli import _ler_fundos
+from reconciliacao import carregar_parsers_fundos
+
+CABECALHO_GPA = 'Título;Razão Social Sacado;Dt Vencto;Vlr Original;Total Recdo\n100/01;A;10/01/2024;1,00;1,00\n'
+
+
+@pytest.fixture
+def relatorios_gpa(tmp_path):
+    caminhos = []
+    for nome in ('a.csv', 'b.csv'):
+        caminho = tmp_path / nome
+        caminho.write_bytes(CABECALHO_GPA.encode('latin-1'))
+        caminhos.append(str(caminho))
+    return caminhos
+
+
+def test_ler_fundos_rejeita_fundo_repetido(relatorios_gpa):
+    # Um com o nome informado, o outro detectado pelo cabeçalho: os dois dariam o mesmo relatório
+    a, b = relatorios_gpa
+    with pytest.raises(ValueError, match="ambos do fundo 'Gpa'"):
+        _ler_fundos([f'Gpa={a}', b], carregar_parsers_fundos())
+
+
+def test_ler_fundos_nome_corrigido_pela_deteccao(relatorios_gpa, capsys):
+    a, _ = relatorios_gpa
+    assert _ler_fundos([f'Apoge={a}'], carregar_parsers_fundos()) == [('Gpa', a)]
+    assert "parece ser um relatório do fundo 'Gpa'" in capsys.readouterr().err
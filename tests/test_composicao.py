@@ -0,0 +1,25 @@
+# tests/test_composicao.py
+from composicao import _meet_in_the_middle, compor_valor
+
+
+def test_meet_in_the_middle_so_com_a_metade_direita():
+    # Com a tolerância, a soma vazia da direita cai na faixa do alvo: a busca não pode
+    # parar nela e deixar de ver as somas da direita sozinha
+    itens = [(50, 'a'), (60, 'b'), (1, 'c'), (2, 'd')]
+    assert _meet_in_the_middle(itens, 1, 1) == ('c',)
+
+
+def test_meet_in_the_middle_so_com_a_metade_esquerda():
+    itens = [(3, 'a'), (4, 'b'), (50, 'c'), (60, 'd')]
+    assert set(_meet_in_the_middle(itens, 7, 0)) == {'a', 'b'}
+
+
+def test_meet_in_the_middle_sem_solucao():
+    itens = [(50, 'a'), (60, 'b'), (70, 'c'), (80, 'd')]
+    assert _meet_in_the_middle(itens, 5, 1) is None
+
+
+def test_compor_valor_com_tres_documentos_da_metade_direita():
+    # Nenhum documento ou par chega ao alvo; só os três maiores juntos
+    itens = [(1, 'a'), (2, 'b'), (4, 'c'), (1000, 'd'), (2000, 'e'), (4000, 'f')]
+    assert set(compor_valor(7000, itens, tolerancia=0)) == {'d', 'e', 'f'}
@@ -0,0 +1,42 @@
+# tests/test_historico.py
+import pandas as pd
+
+from historico import registrar_execucao, envelhecimento, historico_documento
+
+
+def _comparativo(pendentes):
+    # Um documento que bateu e os pendentes informados (só no nosso)
+    documentos = ['10/001'] + pendentes
+    return pd.DataFrame({
+        'Documento': documentos,
+        'Valor_Nosso': pd.array([100] * len(documentos), dtype='Int64'),
+        'Sacado_Nosso': ['SACADO'] * len(documentos),
+        'Valor_Fundo_Original': pd.array([100] + [None] * len(pendentes), dtype='Int64'),
+        'Valor_Fundo_Pago': pd.array([100] + [None] * len(pendentes), dtype='Int64'),
+        'Sacado_Fundo': ['SACADO'] + [None] * len(pendentes),
+        '_merge': pd.Categorical(['both'] + ['left_only'] * len(pendentes),
+                                 categories=['left_only', 'right_only', 'both']),
+    })
+
+
+def test_envelhecimento_conta_a_partir_da_ultima_vez_que_voltou(tmp_path):
+    banco = str(tmp_path / 'historico.sqlite3')
+    registrar_execucao(_comparativo(['20/001', '30/001']), 'Gpa', '2024-01-31', caminho=banco)
+    registrar_execucao(_comparativo(['20/001']), 'Gpa', '2024-02-29', caminho=banco)
+    registrar_execucao(_comparativo(['20/001', '30/001']), 'Gpa', '2024-03-31', caminho=banco)
+    registrar_execucao(_comparativo(['30/001']), 'Outro', '2024-02-29', caminho=banco)
+
+    aging = envelhecimento('Gpa', caminho=banco).set_index('Documento')
+    # Aberto desde janeiro sem interrupção
+    assert aging.loc['20/001', 'Desde'] == '2024-01-31'
+    assert aging.loc['20/001', 'Periodos'] == 3
+    assert aging.loc['20/001', 'Dias_em_Aberto'] == 60
+    # Resolvido em fevereiro e de volta em março: aberto desde março
+    assert aging.loc['30/001', 'Desde'] == '2024-03-31'
+    assert aging.loc['30/001', 'Periodos'] == 1
+    assert aging.loc['30/001', 'Dias_em_Aberto'] == 0
+
+    # Com o período de referência em fevereiro, o 30/001 não está em aberto
+    assert list(envelhecimento('Gpa', '2024-02-29', caminho=banco)['Documento']) == ['20/001']
+    # O histórico do documento continua mostrando todas as vezes que ficou pendente
+    assert list(historico_documento('30/1', 'Gpa', caminho=banco)['Periodo']) == ['2024-01-31', '2024-03-31']
@@ -0,0 +1,112 @@
+# tests/test_incremental.py
+import os
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import incremental
+from incremental import conciliar_incremental
+from reconciliacao import conciliar
+from parsers import nosso_relatorio_parser
+from parsers._registro import carregar_parser, PASTA_ESPECIFICACOES
+
+RAZAO_INICIAL = [
+    '02/05;Recebimento cfe Dpl 58817/03 - MERCADO SAO JOSE LTDA;1.574,00;',
+    '02/05;Reembolso Duplicata;45,00;',
+    '',
+    '03/05;DESCONTO DUPL CFE BORDERO;2.345,67;',
+    '03/05;Recebimento cfe Dpl 61200/1 - PADARIA ESTRELA;300,10;',
+]
+RAZAO_ACRESCIMO = [
+    '',
+    '04/05;Reembolso Duplicata;12,00;',
+    '04/05;Recebimento cfe Dpl 61200/1 - PADARIA ESTRELA;10,00;',
+    '05/05;DESCONTO DUPL CFE BORDERO;99,99;',
+]
+FUNDO_CABECALHO = 'Título;Razão Social Sacado;Vlr Original;Total Recdo'
+FUNDO_INICIAL = [
+    '58817/3;MERCADO SAO JOSE;1.574,00;1.580,00',
+    '70000/1;OUTRO SACADO;10,00;10,00',
+]
+FUNDO_ACRESCIMO = [
+    '61200/1;PADARIA ESTRELA;310,10;310,10',
+]
+
+
+def _gravar(caminho, linhas, modo='wb'):
+    with open(caminho, modo) as f:
+        f.write(''.join(linha + '\n' for linha in linhas).encode('latin-1'))
+
+
+def _comparavel(df):
+    df = df.copy()
+    for coluna in df.columns:
+        if isinstance(df[coluna].dtype, pd.CategoricalDtype) or coluna == 'Documento':
+            df[coluna] = df[coluna].astype(str).astype(object)
+    return df.reset_index(drop=True)
+
+
+def _conferir_igual_a_execucao_completa(resultado, caminho_nosso, parser_fundo, caminho_fundo):
+    esperado = conciliar(nosso_relatorio_parser.processar(caminho_nosso), parser_fundo.processar(caminho_fundo))
+    for obtido, df_esperado in zip(resultado, esperado):
+        assert_frame_equal(_comparavel(obtido), _comparavel(df_esperado), check_dtype=False)
+
+
+@pytest.fixture
+def arquivos(tmp_path):
+    caminho_nosso = str(tmp_path / 'razao.csv')
+    caminho_fundo = str(tmp_path / 'gpa.csv')
+    _gravar(caminho_nosso, RAZAO_INICIAL)
+    _gravar(caminho_fundo, [FUNDO_CABECALHO] + FUNDO_INICIAL)
+    parser_fundo = carregar_parser(os.path.join(PASTA_ESPECIFICACOES, 'gpa.toml'))
+    return caminho_nosso, parser_fundo, caminho_fundo, str(tmp_path / 'estado')
+
+
+def test_acrescimo_com_linhas_em_branco_igual_a_execucao_completa(arquivos):
+    caminho_nosso, parser_fundo, caminho_fundo, pasta_estado = arquivos
+    conciliar_incremental(caminho_nosso, 'Gpa', parser_fundo, caminho_fundo, pasta_estado)
+
+    # As chaves sintéticas das linhas novas continuam a numeração das linhas de dados
+    # (o read_csv pula as linhas em branco, que por isso não contam)
+    _gravar(caminho_nosso, RAZAO_ACRESCIMO, 'ab')
+    _gravar(caminho_fundo, FUNDO_ACRESCIMO, 'ab')
+    resultado = conciliar_incremental(caminho_nosso, 'Gpa', parser_fundo, caminho_fundo, pasta_estado)
+
+    documentos = set(resultado[0]['Documento'])
+    assert {'REEMBOLSO_SEM_DOC_1', 'DESCONTO_BORDERO_2', 'REEMBOLSO_SEM_DOC_4', 'DESCONTO_BORDERO_6'} <= documentos
+    _conferir_igual_a_execucao_completa(resultado, caminho_nosso, parser_fundo, caminho_fundo)
+
+
+def test_ultima_linha_sem_quebra_fica_para_a_proxima_execucao(arquivos):
+    caminho_nosso, parser_fundo, caminho_fundo, pasta_estado = arquivos
+    incompleta = RAZAO_ACRESCIMO[-1]
+    with open(caminho_nosso, 'ab') as f:
+        f.write(incompleta[:20].encode('latin-1'))
+
+    resultado = conciliar_incremental(caminho_nosso, 'Gpa', parser_fundo, caminho_fundo, pasta_estado)
+    assert 'DESCONTO_BORDERO_4' not in set(resultado[0]['Documento'])
+
+    with open(caminho_nosso, 'ab') as f:
+        f.write((incompleta[20:] + '\n').encode('latin-1'))
+    resultado = conciliar_incremental(caminho_nosso, 'Gpa', parser_fundo, caminho_fundo, pasta_estado)
+    assert 'DESCONTO_BORDERO_4' in set(resultado[0]['Documento'])
+    _conferir_igual_a_execucao_completa(resultado, caminho_nosso, parser_fundo, caminho_fundo)
+
+
+def test_linhas_acrescentadas_durante_a_reconstrucao_nao_contam_duas_vezes(arquivos, monkeypatch):
+    caminho_nosso, parser_fundo, caminho_fundo, pasta_estado = arquivos
+    original = incremental.tamanho_bloco_para
+
+    def tamanho_bloco_enquanto_cresce(caminho_arquivo):
+        # O arquivo recebe linhas novas depois de medido, enquanto a reconstrução lê
+        if caminho_arquivo == caminho_nosso:
+            _gravar(caminho_nosso, RAZAO_ACRESCIMO, 'ab')
+        return original(caminho_arquivo)
+
+    monkeypatch.setattr(incremental, 'tamanho_bloco_para', tamanho_bloco_enquanto_cresce)
+    conciliar_incremental(caminho_nosso, 'Gpa', parser_fundo, caminho_fundo, pasta_estado)
+    monkeypatch.setattr(incremental, 'tamanho_bloco_para', original)
+
+    resultado = conciliar_incremental(caminho_nosso, 'Gpa', parser_fundo, caminho_fundo, pasta_estado)
+    _conferir_igual_a_execucao_completa(resultado, caminho_nosso, parser_fundo, caminho_fundo)
@@ -0,0 +1,47 @@
+# tests/test_ingestao.py
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from reconciliacao import carregar_parsers_fundos, normalizar, agregar_fundo
+from utils import agregar_por_documento
+
+# Relatório GPA com documentos repetidos longe um do outro (caem em blocos diferentes),
+# documentos em branco em vários blocos, sacado vazio e valores inválidos
+LINHAS_GPA = [
+    'Título;Razão Social Sacado;Dt Vencto;Vlr Original;Total Recdo',
+    '100/01;MERCADO ALFA;10/01/2024;1.000,00;1.000,00',
+    ';SACADO SEM TITULO;10/01/2024;5,00;5,00',
+    '200/02;PADARIA BETA;10/01/2024;10,00;10,50',
+    '100/1-DME;MERCADO ALFA 2;10/01/2024;20,00;20,00',
+    '300/03;;10/01/2024;7,00;7,00',
+    ';OUTRO SEM TITULO;10/01/2024;3,00;4,00',
+    '200/02;PADARIA BETA;10/01/2024;abc;1,00',
+    '300/03;ACOUGUE GAMA;10/01/2024;1,00;1,00',
+    '  ;;10/01/2024;1,00;1,00',
+    '100/01;MERCADO ALFA;10/01/2024;0,50;0,50',
+]
+
+
+@pytest.fixture
+def relatorio_gpa(tmp_path):
+    caminho = tmp_path / 'gpa.csv'
+    caminho.write_bytes(('\n'.join(LINHAS_GPA) + '\n').encode('latin-1'))
+    return str(caminho)
+
+
+@pytest.mark.parametrize('chunksize', [1, 2, 3, 4, 1000])
+def test_processar_em_blocos_igual_a_leitura_de_uma_vez(relatorio_gpa, chunksize):
+    parser = carregar_parsers_fundos()['Gpa']
+    inteiro = parser.processar(relatorio_gpa)
+    em_blocos = parser.processar(relatorio_gpa, chunksize=chunksize)
+
+    # O fixture precisa ter linhas sem documento, senão a comparação não prova nada
+    assert inteiro['Documento'].isna().sum() == 2
+
+    # Em blocos, o parser já devolve os valores somados por documento (sem perder os vazios)
+    assert_frame_equal(em_blocos.reset_index(drop=True), agregar_por_documento(inteiro), check_categorical=False)
+    # E a reconciliação chega aos mesmos agregados e totais
+    assert_frame_equal(agregar_fundo(normalizar(em_blocos)), agregar_fundo(normalizar(inteiro)),
+                       check_categorical=False)
+    assert em_blocos['Valor_Fundo_Pago'].sum() == inteiro['Valor_Fundo_Pago'].sum() == 105000
@@ -0,0 +1,59 @@
+# tests/test_instrumentacao.py
+import time
+
+import numpy as np
+import pytest
+
+from instrumentacao import Perfilador, rss_mb, pesos_estimados, caminho_tempos
+from reconciliacao import carregar_parsers_fundos, caminho_relatorio, executar_conciliacao
+from benchmarks.geradores import gerar_cenario
+
+
+@pytest.mark.skipif(rss_mb() is None, reason="sem como medir a memória residente aqui")
+def test_memoria_medida_por_etapa():
+    perfilador = Perfilador()
+    with perfilador.etapa('alocacao'):
+        bloco = np.ones(200 * 1024 * 1024 // 8)  # 200 MB, liberados no fim da etapa
+        time.sleep(0.1)
+        del bloco
+    with perfilador.etapa('sem_alocacao'):
+        time.sleep(0.05)
+
+    alocacao, sem_alocacao = perfilador.etapas
+    assert alocacao['acrescimo_rss_mb'] >= 150
+    assert alocacao['pico_rss_mb'] >= alocacao['rss_inicial_mb'] + 150
+    # O pico de uma etapa não herda o de etapas anteriores do mesmo processo
+    assert sem_alocacao['acrescimo_rss_mb'] < 20
+    assert sem_alocacao['pico_rss_mb'] < alocacao['pico_rss_mb'] - 100
+    assert perfilador.relatorio()['pico_rss_mb'] == alocacao['pico_rss_mb']
+
+
+
+@pytest.fixture
+def cenario(tmp_path):
+    caminho_nosso, caminho_fundo = gerar_cenario(str(tmp_path), 500)
+    return caminho_nosso, caminho_fundo, caminho_relatorio(str(tmp_path), 'Apoge', 'csv')
+
+
+def _executar(cenario, particoes, perfilador=None):
+    caminho_nosso, caminho_fundo, caminho_saida = cenario
+    executar_conciliacao(caminho_nosso, 'Apoge', carregar_parsers_fundos()['Apoge'], caminho_fundo, caminho_saida,
+                         'csv', usar_cache=False, perfilador=perfilador, particoes=particoes)
+
+
+def test_pesos_medidos_em_execucao_particionada(cenario):
+    _executar(cenario, 4)
+    # Os tempos da execução particionada são usados, e não a estimativa pelo tamanho
+    pesos = pesos_estimados(caminho_tempos(cenario[2]), 1000, 1000)
+    assert set(pesos) == {'leitura_nosso', 'leitura_fundo', 'cruzamento', 'relatorio'}
+
+
+@pytest.mark.parametrize('anterior', ['nenhuma', None, 4])
+@pytest.mark.parametrize('particoes', [None, 4])
+def test_progresso_chega_a_100(cenario, anterior, particoes):
+    # Com os pesos estimados ou medidos em uma execução anterior de qualquer tipo
+    if anterior != 'nenhuma':
+        _executar(cenario, anterior)
+    perfilador = Perfilador(pesos_estimados(caminho_tempos(cenario[2]), 1000, 1000))
+    _executar(cenario, particoes, perfilador)
+    assert perfilador.percentual() == 100
@@ -0,0 +1,126 @@
+# tests/test_nosso_relatorio_parser.py
+import re
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from parsers import nosso_relatorio_parser
+from utils import limpar_valor, agregar_por_documento, centavos_para_reais, TIPO_CENTAVOS
+
+# Razão com todos os tipos de histórico, cabeçalhos/resumos, documentos vazios, valores
+# inválidos ou não positivos e uma linha em branco no meio (que não entra na numeração)
+LINHAS_RAZAO = [
+    'Conta: 1.1.2.01;Clientes;;',
+    'Data;Histórico;Valor;Saldo',
+    '01/05;Saldo Anterior;;10.000,00',
+    '02/05;Recebimento cfe Dpl 58817/03 - MERCADO SAO JOSE LTDA;1.574,00;',
+    '02/05;Recebimento cfe Dpl 58817/3-MERCADO SAO JOSE LTDA;25,50;',
+    '02/05;Recebimento cfe Dpl 61200-2 PADARIA ESTRELA;300,10;',
+    '03/05;Recebimento cfe Dpl  - SACADO SEM DOCUMENTO;99,00;',
+    '03/05;Pagamento cfe dpl. 7001/1-DIAMANTE FIDC;1.000,00;',
+    '03/05;Pagamento cfe dpl. -DIAMANTE FIDC;50,00;',
+    '',
+    '04/05;Reembolso Duplicata 58820/1;12,34;',
+    '04/05;Reembolso Duplicata;45,00;',
+    '04/05;DESCONTO DUPL CFE BORDERO;2.345,67;',
+    '05/05;DESCONTO DUPL CFE BORDERO;0,00;',
+    '05/05;Reembolso Duplicata;-10,00;',
+    '05/05;Recebimento cfe Dpl 58900/1 - AÇOUGUE BOI GORDO;abc;',
+    '05/05;Tarifa bancária;15,00;',
+    '06/05;Recebimento cfe Dpl 58817/03 - MERCADO SAO JOSE LTDA;0,30;',
+    '06/05;;100,00;',
+    '07/05;DESCONTO DUPL CFE BORDERO;1.000.000,01;',
+]
+
+
+def _loop_original(caminho_arquivo):
+    """
+    O parser linha a linha substituído pela versão vetorizada (iterrows + regex por linha).
+    """
+    df = pd.read_csv(caminho_arquivo, header=None, encoding='latin-1', delimiter=';', on_bad_lines='warn',
+                     engine='python')
+    df.columns = [f'col_{i}' for i in range(df.shape[1])]
+
+    dados_extraidos = []
+    regex_recebimento_padrao = re.compile(r'Recebimento cfe Dpl\s+(.*?)\s+-\s+(.*)')
+    regex_recebimento_alt = re.compile(r'Recebimento cfe Dpl\s+([\w\d\/-]+)-(.*)')
+    regex_recebimento_space = re.compile(r'Recebimento cfe Dpl\s+([\w\d\/-]+(?:-[\w\d]+)?)\s+([A-Za-z].*)')
+    regex_reembolso_com_doc = re.compile(r'Reembolso Duplicata\s+([\w\d\/-]+)')
+    regex_reembolso_sem_doc = re.compile(r'^Reembolso Duplicata$')
+    regex_desconto = re.compile(r'^DESCONTO DUPL CFE BORDERO$')
+    regex_pagamento = re.compile(r'Pagamento cfe dpl\.\s+(.*?)-DIAMANTE.*')
+
+    for index, row in df.iterrows():
+        historico = str(row.get('col_1', '')).strip()
+        if not historico or "Histórico" in historico or "Saldo Anterior" in historico or "Conta:" in historico:
+            continue
+        valor_str = str(row.get('col_2', '0'))
+        documento, sacado = None, None
+
+        match = (regex_recebimento_padrao.search(historico) or
+                 regex_recebimento_alt.search(historico) or
+                 regex_recebimento_space.search(historico))
+        if match:
+            documento, sacado = match.group(1).strip(), match.group(2).strip()
+        elif (match := regex_pagamento.search(historico)):
+            documento, sacado = match.group(1).strip(), "N/A (Pagamento)"
+        elif (match := regex_reembolso_com_doc.search(historico)):
+            documento, sacado = match.group(1).strip(), "N/A (Reembolso)"
+        elif regex_reembolso_sem_doc.search(historico):
+            documento, sacado = f"REEMBOLSO_SEM_DOC_{index}", "N/A (Reembolso sem doc)"
+        elif regex_desconto.search(historico):
+            documento, sacado = f"DESCONTO_BORDERO_{index}", "N/A (Desconto Bordero)"
+        else:
+            continue
+
+        if documento and (valor := limpar_valor(valor_str)) is not None and valor > 0:
+            dados_extraidos.append({'Documento': documento, 'Sacado_Nosso': sacado, 'Valor_Nosso': valor})
+
+    return pd.DataFrame(dados_extraidos)
+
+
+def _comparavel(df):
+    # Tipos compactos (string do pyarrow, categoria, centavos) de volta aos tipos do loop original
+    return pd.DataFrame({
+        'Documento': df['Documento'].astype(str).astype(object),
+        'Sacado_Nosso': df['Sacado_Nosso'].astype(str).astype(object),
+        'Valor_Nosso': (centavos_para_reais(df['Valor_Nosso'])
+                        if df['Valor_Nosso'].dtype == TIPO_CENTAVOS else df['Valor_Nosso'].astype('float64')),
+    })
+
+
+@pytest.fixture
+def razao(tmp_path):
+    caminho = tmp_path / 'razao.csv'
+    caminho.write_bytes(('\n'.join(LINHAS_RAZAO) + '\n').encode('latin-1'))
+    return str(caminho)
+
+
+def test_processar_igual_ao_loop_original(razao):
+    esperado = _loop_original(razao)
+    obtido = nosso_relatorio_parser.processar(razao)
+
+    # O fixture precisa exercitar todos os casos, senão a comparação não prova nada
+    documentos = set(esperado['Documento'])
+    assert {'REEMBOLSO_SEM_DOC_10', 'DESCONTO_BORDERO_11', 'DESCONTO_BORDERO_18'} <= documentos
+    assert '' not in documentos
+    assert_frame_equal(_comparavel(obtido), _comparavel(esperado))
+
+
+@pytest.mark.parametrize('chunksize', [1, 3, 7, 1000])
+def test_processar_em_blocos_igual_ao_loop_original_agregado(razao, chunksize):
+    # Em blocos, o parser já devolve os valores somados por documento (primeiro sacado de cada um)
+    esperado = _comparavel(_loop_original(razao))
+    esperado['Valor_Nosso'] = (esperado['Valor_Nosso'] * 100).round().astype(TIPO_CENTAVOS)
+    esperado = _comparavel(agregar_por_documento(esperado))
+
+    obtido = nosso_relatorio_parser.processar(razao, chunksize=chunksize)
+    assert_frame_equal(_comparavel(obtido), esperado)
+
+
+def test_processar_sem_transacoes(tmp_path):
+    caminho = tmp_path / 'vazio.csv'
+    caminho.write_bytes('Conta: 1;x;;\n01/05;Tarifa;1,00;\n'.encode('latin-1'))
+    with pytest.raises(ValueError, match='Nenhum dado'):
+        nosso_relatorio_parser.processar(str(caminho))
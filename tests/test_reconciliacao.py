@@ -0,0 +1,90 @@
+# tests/test_reconciliacao.py
+import os
+import time
+import multiprocessing
+
+import pytest
+
+from instrumentacao import Perfilador, Cancelado, informar_progresso
+from reconciliacao import mapear_em_processos
+
+
+def _trabalho(segundos, fracoes):
+    # Como a leitura de um arquivo em blocos: informa o andamento do próprio trabalho
+    for fracao in fracoes:
+        informar_progresso(fracao, "bloco")
+    time.sleep(segundos)
+    return os.getpid()
+
+
+def test_progresso_informado_so_pelo_processo_pai():
+    avancos = multiprocessing.SimpleQueue()
+    perfilador = Perfilador({'leitura_fundo': 1}, ao_avancar=lambda percentual, detalhe: avancos.put(percentual))
+    with perfilador.etapa('leitura_fundo'):
+        argumentos = [(0.05 * i, (0.5, 1.0)) for i in range(6)]
+        list(mapear_em_processos(_trabalho, argumentos, 3, 'arquivos lidos'))
+
+    percentuais = []
+    while not avancos.empty():
+        percentuais.append(avancos.get())
+    # Um aviso por arquivo concluído, sempre para frente (nada dos blocos dos processos de trabalho)
+    assert percentuais == [17, 33, 50, 67, 83, 100]
+
+
+def test_cancelamento_descarta_pendentes_e_encerra_processos():
+    cancelar = multiprocessing.Event()
+    perfilador = Perfilador({'leitura_fundo': 1}, cancelado=cancelar.is_set)
+    inicio = time.monotonic()
+    with pytest.raises(Cancelado):
+        with perfilador.etapa('leitura_fundo'):
+            for _ in mapear_em_processos(_trabalho, [(0, ())] + [(30, ())] * 8, 2, 'arquivos lidos'):
+                cancelar.set()
+
+    assert time.monotonic() - inicio < 10
+    prazo = time.monotonic() + 5
+    while multiprocessing.active_children() and time.monotonic() < prazo:
+        time.sleep(0.05)
+    assert not multiprocessing.active_children()
+
+
+def _anotar_pid_e_dormir(pasta, segundos):
+    with open(os.path.join(pasta, str(os.getpid())), 'w'):
+        pass
+    time.sleep(segundos)
+
+
+def _mapear_e_dormir(pasta):
+    list(mapear_em_processos(_anotar_pid_e_dormir, [(pasta, 60)] * 2, 2, 'arquivos lidos'))
+
+
+def _vivo(pid):
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+    except OSError:
+        pass
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def test_processos_saem_junto_com_o_pai_encerrado_a_forca(tmp_path):
+    # Como o processo da interface encerrado depois do prazo de cancelamento
+    pai = multiprocessing.get_context('spawn').Process(target=_mapear_e_dormir, args=(str(tmp_path),))
+    pai.start()
+    prazo = time.monotonic() + 30
+    while len(os.listdir(tmp_path)) < 2:
+        assert time.monotonic() < prazo
+        time.sleep(0.05)
+    pai.kill()
+    pai.join()
+
+    pids = [int(nome) for nome in os.listdir(tmp_path)]
+    prazo = time.monotonic() + 5
+    while any(_vivo(pid) for pid in pids) and time.monotonic() < prazo:
+        time.sleep(0.05)
+    assert not any(_vivo(pid) for pid in pids)
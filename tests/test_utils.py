@@ -0,0 +1,64 @@
+# tests/test_utils.py
+import math
+
+import pandas as pd
+import pytest
+
+from utils import (limpar_valor, limpar_valores, limpar_centavos, normalizar_documento, normalizar_documentos,
+                   TIPO_TEXTO, TIPO_CENTAVOS)
+
+# Textos comuns e casos de borda do float() usado por `limpar_valor`
+TEXTOS = ['1.574,00', '25,5', '-10,00', ' 12,3 ', '+5', ',5', '5,', '0,01', '1E+2', '1,5e3', '1e 5', '1 e5', '1e',
+          'e5', '1e5.5', '1.5.5', '--1', '54_9', '1_000,5', '_1', '1__0', '١٢', '１２', 'inf', '-Infinity', 'nan',
+          '1e30', '1e400', 'abc', '', ' ', '0x10']
+
+
+def _iguais(obtido, esperado):
+    if esperado is None:
+        return math.isnan(obtido)
+    return obtido == esperado or (math.isnan(obtido) and math.isnan(esperado))
+
+
+@pytest.mark.parametrize('tipo', [object, TIPO_TEXTO])
+def test_limpar_valores_igual_a_limpar_valor(tipo):
+    # Uma coluna com células inválidas (conversão célula a célula) e cada texto sozinho
+    # (conversão direta da coluna inteira) devem dar o mesmo que `limpar_valor`
+    valores = limpar_valores(pd.Series(TEXTOS, dtype=tipo))
+    for texto, valor in zip(TEXTOS, valores):
+        assert _iguais(valor, limpar_valor(texto)), texto
+    for texto in TEXTOS:
+        assert _iguais(limpar_valores(pd.Series([texto], dtype=tipo))[0], limpar_valor(texto)), texto
+
+
+@pytest.mark.parametrize('tipo', [object, TIPO_TEXTO])
+def test_limpar_centavos_fora_do_intervalo_vira_vazio(tipo):
+    serie = pd.Series(['1.574,00', 'inf', '-Infinity', 'NaN', '1e30', '92.233.720.368.547.758,08', 'abc', '0,01'],
+                      dtype=tipo)
+    esperado = pd.Series([157400, None, None, None, None, None, None, 1], dtype=TIPO_CENTAVOS)
+    pd.testing.assert_series_equal(limpar_centavos(serie), esperado)
+
+
+def test_limpar_centavos_coluna_numerica():
+    serie = pd.Series([1574.0, float('inf'), float('nan'), 0.1])
+    esperado = pd.Series([157400, None, None, 10], dtype=TIPO_CENTAVOS)
+    pd.testing.assert_series_equal(limpar_centavos(serie), esperado)
+
+
+# Casos de borda de `normalizar_documento`: sufixos, várias barras/hífens, espaços nas pontas,
+# texto em várias linhas, textos sem documento, dígitos e espaços fora do ASCII
+DOCUMENTOS = ['58817/03-DME', '1-2-3', '12/3/4', 'DUP - 123/01', '  58817/3  ', '\t12-1\n', '  abc  ', 'abc\n',
+              'linha 1\n12/4 x\n9/9', 'x\n7-8', 'sem numero', '', ' ', '/', '12/', '/3', '0/0', '12 / 3',
+              '1234567/1234', '１２/３', '\xa012/3\xa0', '　abc　', '\x1c12/3\x1f', 'ação 5/6']
+
+
+@pytest.mark.parametrize('tipo', [object, TIPO_TEXTO])
+def test_normalizar_documentos_igual_a_normalizar_documento(tipo):
+    valores = DOCUMENTOS + [None, float('nan')]
+    if tipo is object:
+        # Só uma coluna object pode trazer números e os diferentes valores ausentes
+        valores += [pd.NA, 1234, 12.5, 58817.0, 7]
+    serie = pd.Series(valores + valores[::-1], dtype=tipo)
+    normalizados = normalizar_documentos(serie)
+    assert list(normalizados.index) == list(serie.index)
+    for valor, normalizado in zip(serie, normalizados):
+        assert normalizado == normalizar_documento(valor), repr(valor)
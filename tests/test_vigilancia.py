@@ -0,0 +1,88 @@
+# tests/test_vigilancia.py
+import os
+import time
+import shutil
+import threading
+
+import pytest
+
+import vigilancia
+from historico import totais_por_fundo
+from benchmarks.geradores import gerar_cenario
+
+_conciliar_arquivo = vigilancia.conciliar_arquivo
+
+
+def _conciliar_ou_morrer(nome_fundo, caminho_fundo, pasta_saida, formato='xlsx', resumir=False):
+    # Simula um processo de trabalho morto no meio da tarefa (ex: sem memória)
+    if 'morre' in os.path.basename(caminho_fundo):
+        os._exit(1)
+    return _conciliar_arquivo(nome_fundo, caminho_fundo, pasta_saida, formato, resumir)
+
+
+def _esperar(condicao, prazo=60):
+    limite = time.monotonic() + prazo
+    while not condicao():
+        assert time.monotonic() < limite, "tempo esgotado"
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def cenario(tmp_path):
+    caminho_nosso, caminho_fundo = gerar_cenario(str(tmp_path / 'gerados'), 300)
+    entrada = tmp_path / 'entrada'
+    entrada.mkdir()
+    return caminho_nosso, caminho_fundo, str(entrada), str(tmp_path / 'saida')
+
+
+def test_nosso_relatorio_ilegivel_para_o_servico(cenario, tmp_path):
+    _, _, entrada, saida = cenario
+    vazio = tmp_path / 'vazio.csv'
+    vazio.write_bytes(b'Conta: 1;x;;\n01/05;Tarifa;1,00;\n')
+    with pytest.raises(ValueError, match='Não foi possível ler o nosso relatório'):
+        vigilancia.vigiar(str(vazio), entrada, saida, 'csv', workers=1, usar_cache=False)
+
+
+def _servico(cenario, mensagens, **opcoes):
+    caminho_nosso, _, entrada, saida = cenario
+    parar = threading.Event()
+    servico = threading.Thread(target=vigilancia.vigiar, args=(caminho_nosso, entrada, saida, 'csv', 1, 0.05, 0),
+                               kwargs={'usar_cache': False, 'parar': parar, 'registrar': mensagens.append, **opcoes})
+    servico.start()
+    return servico, parar
+
+
+def test_conciliacoes_registradas_no_historico(cenario, tmp_path):
+    _, caminho_fundo, entrada, _ = cenario
+    banco = str(tmp_path / 'historico.sqlite3')
+    mensagens = []
+    servico, parar = _servico(cenario, mensagens, historico=banco, periodo='2024-05')
+    try:
+        shutil.copy(caminho_fundo, os.path.join(entrada, 'apoge_dia.csv'))
+        _esperar(lambda: any('Relatório gerado' in m for m in mensagens))
+    finally:
+        parar.set()
+        servico.join(60)
+    totais = totais_por_fundo('Apoge', banco)
+    assert list(totais['Periodo']) == ['2024-05']
+    assert totais['Correspondentes'].iloc[0] > 0
+
+
+def test_processo_de_trabalho_morto_e_recriado(cenario, monkeypatch):
+    _, caminho_fundo, entrada, saida = cenario
+    monkeypatch.setattr(vigilancia, 'conciliar_arquivo', _conciliar_ou_morrer)
+    mensagens = []
+    servico, parar = _servico(cenario, mensagens)
+    try:
+        shutil.copy(caminho_fundo, os.path.join(entrada, 'morre.csv'))
+        _esperar(lambda: any('morre.csv' in m and 'Erro' in m for m in mensagens))
+
+        # O pool quebrado é recriado no próximo arquivo, que é processado na varredura seguinte
+        shutil.copy(caminho_fundo, os.path.join(entrada, 'apoge_dia.csv'))
+        _esperar(lambda: any('Relatório gerado' in m for m in mensagens))
+    finally:
+        parar.set()
+        servico.join(60)
+    assert not servico.is_alive()
+    assert any('reiniciando os processos' in m for m in mensagens)
+    assert os.path.isdir(vigilancia.caminho_saida_arquivo(saida, 'Apoge', 'apoge_dia.csv', 'csv'))
@@ -1,6 +1,37 @@
 # utils.py
+import os
 import re
 import locale
+from contextlib import ExitStack
+
+import numpy as np
+import pandas as pd
+from instrumentacao import informar_progresso
+
+# Linhas por bloco na leitura dos relatórios: mesmo quando o resultado é montado
+# inteiro, as colunas intermediárias só existem para um bloco de cada vez
+BLOCO_LEITURA = 200_000
+
+
+def _tipo_texto():
+    """
+    Dtype das colunas de texto: strings do pyarrow (bem mais compactas que objetos Python),
+    com NaN como valor ausente, como nas colunas de texto comuns. Sem pyarrow, object.
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return object
+    try:
+        return pd.StringDtype('pyarrow', na_value=np.nan)  # pandas >= 2.3
+    except TypeError:
+        try:
+            return pd.StringDtype('pyarrow_numpy')  # pandas 2.1 e 2.2
+        except (TypeError, ValueError):
+            return object
+
+
+TIPO_TEXTO = _tipo_texto()
 
 def limpar_valor(valor):
     """
@@ -18,6 +49,68 @@ def limpar_valor(valor):
     return None
 
 
+def _float_ou_nan(texto):
+    try:
+        return float(texto)
+    except (ValueError, TypeError):
+        return np.nan
+
+
+def limpar_valores(serie):
+    """
+    Versão vetorizada de `limpar_valor` para uma coluna inteira, com o mesmo resultado
+    célula a célula. Remove os pontos de milhar e troca a vírgula decimal por ponto em bloco;
+    células que não puderem ser convertidas viram NaN (o None de `limpar_valor`).
+    """
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        # Já chegou numérica (ex: lida com decimal=',' e thousands='.')
+        return serie.astype('float64')
+
+    # Em colunas mistas, .str devolve NaN para tudo que não for texto
+    texto = serie.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    try:
+        valores = texto.astype('float64')
+    except (ValueError, TypeError):
+        # Há células inválidas: converte uma a uma só o que for possível
+        valores = pd.to_numeric(texto.str.strip(), errors='coerce').astype('float64')
+        # O to_numeric não lê alguns textos como o float() de `limpar_valor`: recusa '_'
+        # entre dígitos e dígitos não ASCII, e aceita espaço depois do expoente ('1e 5').
+        # Essas células (raras) são refeitas com float()
+        revisar = texto.notna() & (valores.isna() | texto.str.contains('e', case=False, regex=False, na=False))
+        if revisar.any():
+            valores[revisar] = texto[revisar].map(_float_ou_nan)
+
+    nao_texto = texto.isna()
+    if nao_texto.any():
+        valores[nao_texto] = pd.to_numeric(serie[nao_texto], errors='coerce')
+    return valores
+
+
+# Os valores monetários circulam em centavos inteiros ('Int64', vazio onde o valor não
+# pôde ser lido): somas e diferenças ficam exatas, e só a saída converte para reais
+TIPO_CENTAVOS = 'Int64'
+
+
+def limpar_centavos(serie):
+    """
+    Como `limpar_valores`, mas devolve os valores em centavos inteiros.
+    Um valor isolado com até duas casas decimais vira o inteiro exato (o erro do float
+    fica muito abaixo de meio centavo); o erro aparecia ao somar milhões de floats.
+    Valores que não cabem em centavos inteiros ('inf', 'NaN', '1e30'...) ficam vazios,
+    como os que não puderam ser lidos.
+    """
+    centavos = (limpar_valores(serie) * 100).round()
+    centavos = centavos.where(np.isfinite(centavos) & (centavos.abs() < 2.0 ** 63))
+    return centavos.astype(TIPO_CENTAVOS)
+
+
+def centavos_para_reais(serie):
+    """
+    Converte uma coluna em centavos para reais (float), para gravar no relatório.
+    """
+    return pd.to_numeric(serie, errors='coerce').astype('float64') / 100
+
+
 def normalizar_documento(doc_str):
     """
     Normaliza o número do documento para um formato canônico para permitir a correspondência.
@@ -43,6 +136,105 @@ def normalizar_documento(doc_str):
 
     return doc_str.strip()
 
+
+# Primeira ocorrência de 'num/num' ou 'num-num' no texto (a mesma busca de `normalizar_documento`)
+PADRAO_DOCUMENTO = r'(?s)^.*?(\d+)[\/-](\d+).*$'
+
+
+def normalizar_documentos(serie):
+    """
+    Versão vetorizada de `normalizar_documento` para uma coluna inteira.
+    A normalização é feita uma única vez por valor distinto (os relatórios repetem
+    o mesmo documento em várias parcelas e reenvios) e depois espalhada de volta.
+    """
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=False)
+    unicos = pd.Series(unicos)
+
+    # Colunas de texto (TIPO_TEXTO) são normalizadas sem passar por objetos Python:
+    # só busca, substituição e preenchimento, que o pyarrow executa direto nas strings
+    if isinstance(unicos.dtype, pd.StringDtype):
+        e_texto = unicos.notna()
+    else:
+        e_texto = unicos.map(lambda v: isinstance(v, str)).astype(bool)
+    textos = unicos[e_texto].astype(TIPO_TEXTO)
+    # Para o `re` do Python, \d e o strip também valem para dígitos e espaços fora do ASCII
+    # (ex: '１２/３'), e o regex do pyarrow não: esses textos (raros) passam pela função original
+    especiais = textos.str.contains(r'[^\x00-\x7f]', regex=True)
+    textos, especiais = textos[~especiais], textos[especiais]
+    casou = textos.str.contains(r'\d+[\/-]\d+', regex=True)
+    documentos = textos[casou]
+    principal = documentos.str.replace(PADRAO_DOCUMENTO, r'\1', regex=True)
+    parcela = documentos.str.replace(PADRAO_DOCUMENTO, r'\2', regex=True).str.pad(3, side='left', fillchar='0')
+    normalizados = pd.concat([textos[~casou].str.strip(), principal + '/' + parcela,
+                              especiais.map(normalizar_documento).astype(TIPO_TEXTO),
+                              unicos[~e_texto].map(str).astype(TIPO_TEXTO)])
+
+    # `normalizados` está fora de ordem: o índice é a posição do valor original em `unicos`
+    posicao = np.empty(len(unicos), dtype=np.intp)
+    posicao[normalizados.index.to_numpy()] = np.arange(len(normalizados))
+    resultado = pd.Series(normalizados.array.take(posicao[codigos]), index=serie.index, name=serie.name)
+
+    # O factorize junta None, NaN e pd.NA em um só valor, mas `str` dá um texto para cada
+    if not isinstance(serie.dtype, pd.StringDtype):
+        ausentes = serie.isna().to_numpy()
+        if ausentes.any():
+            resultado[ausentes] = serie[ausentes].map(str).astype(TIPO_TEXTO)
+    return resultado
+
+
+def agregar_por_documento(df):
+    """
+    Pré-agrega um DataFrame já padronizado por 'Documento': soma as colunas de valor
+    ('Valor_*') e mantém o primeiro sacado de cada documento, na ordem em que aparecem.
+    As linhas sem documento formam um grupo próprio, como na leitura de uma vez (a
+    normalização as reúne depois em 'nan'), em vez de sumirem dos totais.
+    """
+    colunas_valor = [c for c in df.columns if c.startswith('Valor_')]
+    agregacoes = {c: ('sum' if c in colunas_valor else 'first') for c in df.columns if c != 'Documento'}
+    return df.groupby('Documento', sort=False, dropna=False).agg(agregacoes).reset_index()[list(df.columns)]
+
+
+def combinar_blocos(blocos, colunas):
+    """
+    Consome os blocos de um leitor por partes (chunksize), pré-agregando cada um por
+    documento e fundindo as somas parciais. O pico de memória fica limitado pela
+    quantidade de documentos distintos, e não pelo tamanho do arquivo.
+    """
+    acumulado = pd.DataFrame(columns=colunas)
+    for bloco in blocos:
+        if bloco.empty:
+            continue
+        parcial = agregar_por_documento(bloco[colunas])
+        if acumulado.empty:
+            acumulado = parcial
+        else:
+            acumulado = agregar_por_documento(pd.concat([acumulado, parcial], ignore_index=True))
+    return acumulado
+
+
+def ler_blocos(ler, origem, chunksize):
+    """
+    Itera sobre os blocos do leitor devolvido por `ler(arquivo, chunksize)` (um read_csv
+    com chunksize), informando a cada bloco as linhas lidas e a fração do arquivo já
+    percorrida. `origem` é um caminho ou um arquivo binário já aberto (ex: BytesIO).
+    """
+    with ExitStack() as pilha:
+        arquivo = origem if hasattr(origem, 'read') else pilha.enter_context(open(origem, 'rb'))
+        inicio = arquivo.tell()
+        tamanho = arquivo.seek(0, os.SEEK_END) - inicio
+        arquivo.seek(inicio)
+        nome = os.path.basename(origem) if isinstance(origem, (str, os.PathLike)) else 'arquivo'
+        leitor = pilha.enter_context(ler(arquivo, chunksize))
+        linhas = 0
+        for bloco in leitor:
+            linhas += len(bloco)
+            # A posição do arquivo inclui o que o leitor já carregou no buffer: é aproximada
+            lido = arquivo.tell() - inicio
+            informar_progresso(lido / tamanho if tamanho else 1,
+                               f"{nome}: {linhas} linhas lidas ({lido / 2 ** 20:.0f} de {tamanho / 2 ** 20:.0f} MB)")
+            yield bloco
+
+
 def configurar_locale():
     """
     Tenta configurar o locale para o padrão brasileiro para formatação de moeda.
@@ -0,0 +1,203 @@
+# vigilancia.py
+"""
+Modo serviço: vigia uma pasta e concilia cada relatório de fundo que chegar nela.
+
+A pasta é varrida a cada `intervalo` segundos (só pastas locais). Um arquivo só é
+processado depois de ficar `estabilidade` segundos sem mudar de tamanho nem de data,
+para não pegar um export ainda sendo gravado. O fundo é detectado pelo cabeçalho.
+
+Os processos de trabalho leem e agregam o nosso relatório uma vez, ao iniciar, e o
+mantêm em memória entre as tarefas (relendo só se o arquivo mudar), então cada
+relatório que chega custa apenas a leitura dele e o cruzamento.
+"""
+import os
+import time
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from reconciliacao import (carregar_parsers_fundos, caminho_relatorio, executar_conciliacao, ler_relatorio, normalizar,
+                           agregar_nosso)
+from historico import resumir_execucao, registrar_resumo
+from parsers import nosso_relatorio_parser
+from parsers._deteccao import detectar_fundo
+
+EXTENSOES = ('.csv', '.txt')
+INTERVALO_PADRAO = 2.0
+ESTABILIDADE_PADRAO = 5.0
+
+# Estado de cada processo de trabalho (ver _iniciar_trabalhador)
+_nosso = {}
+
+
+def _assinatura_arquivo(caminho_arquivo):
+    info = os.stat(caminho_arquivo)
+    return info.st_size, info.st_mtime_ns
+
+
+def _nosso_agregado():
+    """
+    Nosso relatório agregado deste processo, relido só se o arquivo mudou desde a última tarefa.
+    """
+    assinatura = _assinatura_arquivo(_nosso['caminho'])
+    if _nosso.get('assinatura') != assinatura:
+        df_nosso = ler_relatorio(nosso_relatorio_parser, _nosso['caminho'], _nosso['usar_cache'])
+        _nosso.update(assinatura=assinatura, agregado=agregar_nosso(normalizar(df_nosso)))
+    return _nosso['agregado']
+
+
+def _iniciar_trabalhador(caminho_nosso, usar_cache):
+    _nosso.update(caminho=caminho_nosso, usar_cache=usar_cache)
+    _nosso_agregado()
+
+
+def _trabalhador_pronto():
+    return True
+
+
+def _iniciar_executor(caminho_nosso, workers, usar_cache):
+    """
+    Cria os processos de trabalho e espera o primeiro terminar de ler o nosso relatório.
+    Se a leitura falhar (o erro do processo sai no stderr), o pool fica inutilizável:
+    o serviço para com uma mensagem clara em vez de falhar em cada arquivo recebido.
+    """
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_trabalhador,
+                                   initargs=(caminho_nosso, usar_cache))
+    try:
+        executor.submit(_trabalhador_pronto).result()
+    except BrokenProcessPool:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise ValueError(f"Não foi possível ler o nosso relatório '{caminho_nosso}' nos processos de trabalho "
+                         f"(veja o erro acima).")
+    return executor
+
+
+def caminho_saida_arquivo(pasta_saida, nome_fundo, caminho_fundo, formato='xlsx'):
+    """
+    Um relatório por arquivo recebido (o mesmo fundo pode mandar vários exports no dia).
+    """
+    nome_arquivo = os.path.splitext(os.path.basename(caminho_fundo))[0]
+    return caminho_relatorio(pasta_saida, f"{nome_fundo}_{nome_arquivo}", formato)
+
+
+def conciliar_arquivo(nome_fundo, caminho_fundo, pasta_saida, formato='xlsx', resumir=False):
+    """
+    Concilia um relatório recebido contra o nosso relatório em memória.
+    Executada nos processos de trabalho; retorna (caminho do relatório gerado, resumo
+    para o histórico ou None). Só o resumo volta, e não o comparativo inteiro: quem
+    grava o histórico é o processo do serviço.
+    """
+    parser_fundo = carregar_parsers_fundos()[nome_fundo]
+    caminho_saida = caminho_saida_arquivo(pasta_saida, nome_fundo, caminho_fundo, formato)
+    _, _, df_comparativo = executar_conciliacao(None, nome_fundo, parser_fundo, caminho_fundo, caminho_saida,
+                                                formato, usar_cache=_nosso['usar_cache'],
+                                                df_nosso_agg=_nosso_agregado())
+    return caminho_saida, resumir_execucao(df_comparativo) if resumir else None
+
+
+def _ja_conciliado(caminho_fundo, caminho_saida):
+    # Relatório mais novo que o arquivo: já processado antes de o serviço ser reiniciado
+    try:
+        return os.path.getmtime(caminho_saida) >= os.path.getmtime(caminho_fundo)
+    except OSError:
+        return False
+
+
+def _registrar_concluidas(tarefas, registrar, historico=None, periodo=None, esperar=False):
+    for tarefa in [t for t in tarefas if esperar or t.done()]:
+        nome_fundo, caminho = tarefas.pop(tarefa)
+        try:
+            caminho_saida, resumo = tarefa.result()
+        except BrokenProcessPool:
+            # O arquivo pode ser a causa (ex: memória insuficiente): só é refeito se mudar
+            registrar(f"[{nome_fundo}] Erro: um processo de trabalho foi encerrado durante "
+                      f"'{os.path.basename(caminho)}'. O arquivo será processado de novo se for alterado.")
+        except Exception as e:
+            registrar(f"[{nome_fundo}] Erro: {e}")
+        else:
+            registrar(f"[{nome_fundo}] Relatório gerado: {caminho_saida}")
+            if resumo is not None:
+                # O relatório já foi gerado: uma falha no histórico vira só um aviso
+                try:
+                    registrar_resumo(resumo, nome_fundo, periodo, caminho_saida, historico)
+                except sqlite3.Error as e:
+                    registrar(f"[{nome_fundo}] Aviso: execução não registrada no histórico: {e}")
+
+
+def vigiar(caminho_nosso, pasta_entrada, pasta_saida, formato='xlsx', workers=2, intervalo=INTERVALO_PADRAO,
+           estabilidade=ESTABILIDADE_PADRAO, usar_cache=True, parar=None, registrar=print, historico=None,
+           periodo=None):
+    """
+    Vigia `pasta_entrada` até `parar` (threading.Event) ser sinalizado ou o processo ser interrompido.
+    `registrar(mensagem)` recebe as mensagens de andamento. Se um processo de trabalho
+    morrer, os processos são recriados e o serviço continua. Com `historico` (caminho
+    do banco), cada conciliação concluída é registrada nele com o `periodo`.
+    """
+    if not os.path.isfile(caminho_nosso):
+        raise ValueError(f"Nosso relatório não encontrado: '{caminho_nosso}'.")
+    if not os.path.isdir(pasta_entrada):
+        raise ValueError(f"Pasta não encontrada: '{pasta_entrada}'.")
+    os.makedirs(pasta_saida, exist_ok=True)
+    parar = parar or threading.Event()
+    fundos = {nome: parser.caminho for nome, parser in carregar_parsers_fundos().items()}
+    ignorados = {os.path.abspath(caminho_nosso)}
+
+    pendentes = {}    # caminho -> (assinatura, instante em que foi vista assim pela primeira vez)
+    processados = {}  # caminho -> assinatura já tratada
+    tarefas = {}
+
+    executor = _iniciar_executor(caminho_nosso, workers, usar_cache)
+    registrar(f"Vigiando '{pasta_entrada}'. Relatórios em '{pasta_saida}'.")
+    try:
+        while not parar.is_set():
+            agora = time.monotonic()
+            for entrada in os.scandir(pasta_entrada):
+                caminho = os.path.abspath(entrada.path)
+                if not entrada.is_file() or not entrada.name.lower().endswith(EXTENSOES) or caminho in ignorados:
+                    continue
+                try:
+                    assinatura = _assinatura_arquivo(caminho)
+                except OSError:
+                    continue
+                if processados.get(caminho) == assinatura:
+                    continue
+
+                # Debounce: espera o arquivo parar de crescer antes de processar
+                if caminho not in pendentes or pendentes[caminho][0] != assinatura:
+                    pendentes[caminho] = (assinatura, agora)
+                    continue
+                if assinatura[0] == 0 or agora - pendentes[caminho][1] < estabilidade:
+                    continue
+                del pendentes[caminho]
+                processados[caminho] = assinatura
+
+                try:
+                    nome_fundo = detectar_fundo(caminho, fundos)
+                except OSError:
+                    continue
+                if not nome_fundo:
+                    registrar(f"Aviso: fundo não reconhecido em '{entrada.name}'; arquivo ignorado.")
+                    continue
+                if _ja_conciliado(caminho, caminho_saida_arquivo(pasta_saida, nome_fundo, caminho, formato)):
+                    continue
+                registrar(f"[{nome_fundo}] Processando '{entrada.name}'...")
+                try:
+                    tarefa = executor.submit(conciliar_arquivo, nome_fundo, caminho, pasta_saida, formato,
+                                             historico is not None)
+                except BrokenProcessPool:
+                    # Um processo de trabalho morreu: recria os processos e tenta o arquivo na próxima varredura
+                    registrar("Aviso: um processo de trabalho foi encerrado; reiniciando os processos.")
+                    del processados[caminho]
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = _iniciar_executor(caminho_nosso, workers, usar_cache)
+                    continue
+                tarefas[tarefa] = nome_fundo, caminho
+
+            _registrar_concluidas(tarefas, registrar, historico, periodo)
+            parar.wait(intervalo)
+
+        # Espera as tarefas em andamento antes de sair
+        _registrar_concluidas(tarefas, registrar, historico, periodo, esperar=True)
+    finally:
+        executor.shutdown(cancel_futures=True)